@@ -1,7 +1,8 @@
-import csv
-import sqlite3
+from oas_db_loader import load_csv_files
 
 # Explanation of the code: I accidentally added the header of the naive B cells csv (added the wrong file) and then deleted the specific row where the header was (row 154845)
+# Loads are now recorded in the load_manifest table, a wrong load can be undone with:
+# python oas_db_loader.py --db /ibmm_data/oas_database/OAS.db --table healthy_paired --rollback <csv_file_path>
 
 # # Path to your SQLite database
 # db_path = '/ibmm_data/oas_database/OAS.db'
@@ -66,36 +67,15 @@ import sqlite3
 db_path = '/ibmm_data/oas_database/OAS.db'
 # Name of the table you're inserting data into
 table_name = 'healthy_paired'
-# Path to your CSV file without the header
-# csv_file_path = '/ibmm_data/oas_database/paired/csv_files/no_headers/no_header_OAS_db_paired_healthy_naive_b_cells_2024-02-28.csv'
-# csv_file_path = '/ibmm_data/oas_database/paired/csv_files/no_headers/no_header_OAS_db_paired_healthy_memory_b_cells_2024-02-28.csv'
-# csv_file_path = '/ibmm_data/oas_database/paired/csv_files/no_headers/no_header_OAS_db_paired_healthy_plasma_b_cells_2024-02-28.csv'
-
-
-# Connect to the SQLite database
-conn = sqlite3.connect(db_path)
-cursor = conn.cursor()
-
-# Get the number of columns in the table
-cursor.execute(f"PRAGMA table_info({table_name});")
-columns_info = cursor.fetchall()
-number_of_columns = len(columns_info)
-#print(number_of_columns)
-
-# Open the CSV file
-with open(csv_file_path, mode='r') as csv_file:
-    # Create a CSV reader object
-    csv_reader = csv.reader(csv_file)
-    
-    # Prepare a SQL query for inserting data. The placeholders (?) will be replaced by row data
-    insert_query = f'INSERT INTO {table_name} VALUES ({",".join(["?"] * number_of_columns)})'
-    
-    # Execute the insert query for each row in the CSV file
-    for row in csv_reader:
-        cursor.execute(insert_query, row)
-
-# Commit the changes and close the connection
-conn.commit()
-conn.close()
-
-print("Data from the CSV file has been added to the SQLite table.")
+# Paths to your CSV files without the header (all three B cell types are loaded in one run)
+csv_file_paths = [
+    '/ibmm_data/oas_database/paired/csv_files/no_headers/no_header_OAS_db_paired_healthy_naive_b_cells_2024-02-28.csv',
+    '/ibmm_data/oas_database/paired/csv_files/no_headers/no_header_OAS_db_paired_healthy_memory_b_cells_2024-02-28.csv',
+    '/ibmm_data/oas_database/paired/csv_files/no_headers/no_header_OAS_db_paired_healthy_plasma_b_cells_2024-02-28.csv',
+]
+
+
+# Batched executemany with one transaction per batch, see oas_db_loader.py
+load_csv_files(db_path, table_name, csv_file_paths, batch_size=50000, fast_pragmas=True)
+
+print("Data from the CSV files has been added to the SQLite table.")
@@ -0,0 +1,114 @@
+"""
+Pre-clustering of CDR3 sequences before mmseqs (heavy_model/mmseqs/1.cdrh3, light_model/src/linclust_70_pident.sh).
+1. exact duplicates are grouped with a hash map (CDR3 -> IDs)
+2. unique CDR3s that differ by one residue (Hamming distance 1, equal length) are merged: every CDR3 is indexed under its
+   wildcard neighbourhood (one key per position with that residue replaced by '*'), two CDR3s share a key exactly if they
+   differ at most at that position. CDR3s are visited by decreasing abundance, an unassigned CDR3 becomes a centroid and
+   takes all unassigned neighbours, so every member is at most one residue away from its centroid.
+   This substitution-wildcard index is used instead of a deletion-neighbourhood (SymDel) index: for equal-length
+   Hamming distance 1 the two find the same pairs, and the wildcard keys need L keys per CDR3 instead of L deletion
+   variants plus a verification of the candidates. Insertions and deletions (CDR3s of different length) are not merged.
+
+The output has the same layout as mmseqs (<prefix>_clu.tsv with centroid ID / member ID and <prefix>_clu_rep.fasta with the
+centroids), so the reduced centroid set can be passed to mmseqs_linclust_sweep.py and the TSV to cluster_stats.py and
+train_test_val_split.py. The centroid ID is the first ID of the most abundant CDR3 of the cluster.
+
+Example:
+python cdr3_precluster.py --fasta heavy_unpaired_cdrh3.fasta --prefix heavy_unpaired_cdrh3_precluster
+"""
+import argparse
+import time
+from collections import defaultdict
+
+
+def read_fasta_sequences(fasta_path):
+    """Yield (id, sequence) of a FASTA file."""
+    with open(fasta_path, 'r', buffering=16 * 1024 * 1024) as f:
+        record_id, sequence = None, []
+        for line in f:
+            if line.startswith('>'):
+                if record_id is not None:
+                    yield record_id, ''.join(sequence)
+                record_id = line[1:].split(None, 1)[0] if line[1:].strip() else ''
+                sequence = []
+            else:
+                sequence.append(line.strip())
+        if record_id is not None:
+            yield record_id, ''.join(sequence)
+
+
+def group_exact(records):
+    """Group the IDs by identical sequence (insertion ordered by first occurrence)."""
+    groups = defaultdict(list)
+    for record_id, sequence in records:
+        groups[sequence].append(record_id)
+    return groups
+
+
+def wildcard_keys(sequence):
+    """The keys of the Hamming-1 neighbourhood: one per position, with that residue replaced by '*'."""
+    return [sequence[:i] + '*' + sequence[i + 1:] for i in range(len(sequence))]
+
+
+def merge_hamming_1(groups):
+    """Assign every unique sequence to a centroid at Hamming distance <= 1. Returns {centroid sequence: [sequences]}."""
+    index = defaultdict(list)
+    for sequence in groups:
+        for key in wildcard_keys(sequence):
+            index[key].append(sequence)
+
+    # most abundant first, ties keep the input order (sorted is stable)
+    by_abundance = sorted(groups, key=lambda s: len(groups[s]), reverse=True)
+    assigned = set()
+    clusters = {}
+    for centroid in by_abundance:
+        if centroid in assigned:
+            continue
+        assigned.add(centroid)
+        members = [centroid]
+        for key in wildcard_keys(centroid):
+            for neighbour in index[key]:
+                if neighbour not in assigned:
+                    assigned.add(neighbour)
+                    members.append(neighbour)
+        clusters[centroid] = members
+    return clusters
+
+
+def precluster(fasta_path, prefix, exact_only=False):
+    """Pre-cluster the CDR3s of fasta_path and write <prefix>_clu.tsv and <prefix>_clu_rep.fasta. Returns a stats dict."""
+    start = time.perf_counter()
+    groups = group_exact(read_fasta_sequences(fasta_path))
+    n_sequences = sum(len(ids) for ids in groups.values())
+    if exact_only:
+        clusters = {sequence: [sequence] for sequence in groups}
+    else:
+        clusters = merge_hamming_1(groups)
+
+    with open(f"{prefix}_clu.tsv", 'w') as tsv, open(f"{prefix}_clu_rep.fasta", 'w') as rep_fasta:
+        for centroid, members in clusters.items():
+            centroid_id = groups[centroid][0]
+            rep_fasta.write(f">{centroid_id}\n{centroid}\n")
+            tsv.write("".join(f"{centroid_id}\t{member_id}\n" for member in members for member_id in groups[member]))
+
+    stats = {
+        'n_sequences': n_sequences,
+        'n_unique_sequences': len(groups),
+        'n_clusters': len(clusters),
+        'reduction_factor': round(n_sequences / max(len(clusters), 1), 2),
+        'time_s': round(time.perf_counter() - start, 2),
+    }
+    print(f"{n_sequences} sequences, {len(groups)} unique, {len(clusters)} clusters after "
+          f"{'exact' if exact_only else 'exact + Hamming-1'} pre-clustering "
+          f"({stats['reduction_factor']}x fewer sequences for mmseqs) in {stats['time_s']} s")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Group exact and Hamming-1 CDR3 duplicates before mmseqs clustering')
+    parser.add_argument("--fasta", help="FASTA file with the CDR3 sequences", type=str, required=True)
+    parser.add_argument("--prefix", help="Prefix of the output files (<prefix>_clu.tsv, <prefix>_clu_rep.fasta)", type=str, required=True)
+    parser.add_argument("--exact_only", help="Only group identical CDR3s", action='store_true')
+    args = parser.parse_args()
+
+    precluster(args.fasta, args.prefix, exact_only=args.exact_only)
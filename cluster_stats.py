@@ -0,0 +1,92 @@
+"""
+Statistics of an mmseqs linclust result in one streaming pass over <prefix>_clu.tsv and one over <prefix>_clu_rep.fasta
+(replaces the awk / cut | sort | uniq | grep -c post-processing in mmseqs_linclust.sh and mmseqs_linclust_2.sh).
+
+Writes:
+<prefix>_clu_sizes.tsv                     centroid ID and cluster size
+<prefix>_clu_rep_idseq                     id,seq of every representative (linearized FASTA)
+<prefix>_clu_rep_idseq_noduplicates        id,seq keeping only the first representative of every sequence
+and returns / prints the number of clusters and members, singletons, the cluster size histogram and the number of unique
+centroid sequences. Duplicates are found with a hash set of the sequences, no external sort is needed.
+
+Example:
+python cluster_stats.py linclust_mmseq_output/all_human_paired_cdr3_aa_70
+"""
+import argparse
+import json
+from collections import Counter
+
+
+def read_cluster_sizes(cluster_tsv):
+    """Count the members of every cluster (first column = centroid ID) of an mmseqs createtsv file."""
+    sizes = Counter()
+    with open(cluster_tsv, 'r', buffering=16 * 1024 * 1024) as f:
+        for line in f:
+            sizes[line.split('\t', 1)[0]] += 1
+    return sizes
+
+
+def write_rep_idseq(rep_fasta, idseq_path, idseq_noduplicates_path):
+    """Linearize the representative FASTA and drop repeated sequences. Returns (n representatives, n unique sequences)."""
+    seen = set()
+    n_reps = 0
+
+    def write_record(record_id, sequence):
+        nonlocal n_reps
+        line = f"{record_id},{sequence}\n"
+        idseq.write(line)
+        n_reps += 1
+        if sequence not in seen:
+            seen.add(sequence)
+            idseq_noduplicates.write(line)
+
+    with open(rep_fasta, 'r', buffering=16 * 1024 * 1024) as fasta, open(idseq_path, 'w') as idseq, \
+            open(idseq_noduplicates_path, 'w') as idseq_noduplicates:
+        record_id, sequence = None, []
+        for line in fasta:
+            if line.startswith('>'):
+                if record_id is not None:
+                    write_record(record_id, ''.join(sequence))
+                record_id = line[1:].rstrip('\n')
+                sequence = []
+            else:
+                sequence.append(line.strip())
+        if record_id is not None:
+            write_record(record_id, ''.join(sequence))
+    return n_reps, len(seen)
+
+
+def cluster_stats(prefix):
+    """Compute the statistics of <prefix>_clu.tsv / <prefix>_clu_rep.fasta and write the derived files."""
+    sizes = read_cluster_sizes(f"{prefix}_clu.tsv")
+    with open(f"{prefix}_clu_sizes.tsv", 'w') as f:
+        for centroid, size in sizes.most_common():
+            f.write(f"{centroid}\t{size}\n")
+    n_reps, n_unique = write_rep_idseq(f"{prefix}_clu_rep.fasta", f"{prefix}_clu_rep_idseq",
+                                       f"{prefix}_clu_rep_idseq_noduplicates")
+    size_histogram = Counter(sizes.values())
+    return {
+        'n_members': sum(sizes.values()),
+        'n_clusters': len(sizes),
+        'n_singletons': size_histogram.get(1, 0),
+        'max_cluster_size': max(sizes.values(), default=0),
+        'n_representatives': n_reps,
+        'n_unique_centroid_sequences': n_unique,
+        'size_histogram': {str(size): count for size, count in sorted(size_histogram.items())},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cluster statistics of an mmseqs linclust result')
+    parser.add_argument("prefix", help="Prefix of the linclust output, e.g. <output_dir>/<db>_70", type=str)
+    parser.add_argument("--json", help="Write the statistics to this JSON file", type=str)
+    args = parser.parse_args()
+
+    stats = cluster_stats(args.prefix)
+    print(f"Number of rows in {args.prefix}_clu.tsv: {stats['n_members']}")
+    print(f"Number of clusters: {stats['n_clusters']} ({stats['n_singletons']} singletons, largest {stats['max_cluster_size']})")
+    print(f"Number of rows in {args.prefix}_clu_rep_idseq: {stats['n_representatives']}")
+    print(f"Number of unique centroids sequences: {stats['n_unique_centroid_sequences']}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(stats, f, indent=2)
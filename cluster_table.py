@@ -0,0 +1,239 @@
+"""
+Compact cluster table of an mmseqs <prefix>_clu.tsv (centroid ID / member ID) in CSR layout, instead of a
+defaultdict(list) with every sequence ID as a Python string.
+
+Every sequence ID is mapped to an integer code, the index into the sorted ID array `ids` (int64 if all IDs are
+integers such as the OAS rowids, fixed-width bytes otherwise). The members of cluster i are
+members[offsets[i]:offsets[i + 1]] (codes), centroids[i] is the code of its centroid. Lookups of IDs are binary
+searches in `ids`, no hash map of all IDs is kept after loading.
+
+The four arrays are saved as <prefix>_ids.npy, <prefix>_centroids.npy, <prefix>_offsets.npy and <prefix>_members.npy
+and can be loaded memory-mapped by the splitter (light_model/src/train_test_val_split.py --cluster_table), the FASTA
+extractors and the EDA notebooks:
+
+    from cluster_table import ClusterTable
+    table = ClusterTable.load('full_clustering/heavy_50')
+    sizes = table.sizes()
+
+Example (convert a TSV once):
+python cluster_table.py --tsv linclust_mmseq_output/all_human_paired_cdr3_aa_70_clu.tsv --output linclust_mmseq_output/all_human_paired_cdr3_aa_70
+"""
+import argparse
+import time
+
+import numpy as np
+
+ARRAY_NAMES = ('ids', 'centroids', 'offsets', 'members')
+
+
+BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def is_integer_column(values):
+    """True if all bytes IDs survive a round trip through int (digits without leading zeros)."""
+    return bool(np.all(np.char.isdigit(values) & ~(np.char.startswith(values, b'0') & (np.char.str_len(values) > 1))))
+
+
+def iter_tsv_blocks(tsv_path, block_size=BLOCK_SIZE):
+    """Yield the centroid and member column of blocks of whole lines as bytes arrays (split in C, no per-line loop)."""
+    with open(tsv_path, 'rb') as f:
+        rest = b''
+        while True:
+            block = f.read(block_size)
+            data = rest + block
+            if block:
+                cut = data.rfind(b'\n') + 1
+                data, rest = data[:cut], data[cut:]
+            tokens = np.array(data.split())
+            if len(tokens) % 2:
+                raise ValueError(f"{tsv_path} is not a two-column TSV.")
+            if len(tokens):
+                yield tokens[0::2], tokens[1::2]
+            if not block:
+                break
+
+
+def read_cluster_tsv(tsv_path):
+    """Read the centroid and member column of an mmseqs TSV. Returns two numpy arrays (int64, or bytes if any ID is not
+    an integer)."""
+    centroid_parts, member_parts = [], []
+    integer_ids = True
+    for centroids, members in iter_tsv_blocks(tsv_path):
+        if integer_ids and not (is_integer_column(centroids) and is_integer_column(members)):
+            # not only integer IDs: continue with bytes, converting the blocks read so far
+            integer_ids = False
+            centroid_parts = [part.astype(np.bytes_) for part in centroid_parts]
+            member_parts = [part.astype(np.bytes_) for part in member_parts]
+        if integer_ids:
+            centroids, members = centroids.astype(np.int64), members.astype(np.int64)
+        centroid_parts.append(centroids)
+        member_parts.append(members)
+    if not centroid_parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(centroid_parts), np.concatenate(member_parts)
+
+
+def sorted_unique(values):
+    """Sorted unique values (sort + compare neighbours, cheaper than np.unique for tens of millions of IDs)."""
+    values = np.sort(values)
+    if len(values):
+        values = values[np.concatenate([[True], values[1:] != values[:-1]])]
+    return values
+
+
+class ClusterTable:
+    """Clusters in CSR layout: ids (sorted, code -> ID), centroids (code per cluster), offsets (n_clusters + 1) and
+    members (codes)."""
+
+    def __init__(self, ids, centroids, offsets, members):
+        self.ids = ids
+        self.centroids = centroids
+        self.offsets = offsets
+        self.members = members
+        self._cluster_of_code = None
+
+    @classmethod
+    def from_tsv(cls, tsv_path):
+        """Build the table from an mmseqs TSV. The clusters are ordered by centroid ID, the members keep the TSV order."""
+        centroid_column, member_column = read_cluster_tsv(tsv_path)
+        ids = sorted_unique(np.concatenate([centroid_column, member_column]))
+        code_dtype = np.int32 if len(ids) < 2 ** 31 else np.int64
+        # group the rows by centroid (stable: the members keep the TSV order) and cut where the centroid changes
+        order = np.argsort(centroid_column, kind='stable')
+        grouped_centroids = centroid_column[order]
+        starts = np.flatnonzero(np.concatenate([[True], grouped_centroids[1:] != grouped_centroids[:-1]])) if len(order) else order
+        offsets = np.append(starts, len(order)).astype(np.int64)
+        members = np.searchsorted(ids, member_column[order]).astype(code_dtype)
+        centroids = np.searchsorted(ids, grouped_centroids[starts]).astype(code_dtype)
+        return cls(ids, centroids, offsets, members)
+
+    @classmethod
+    def load(cls, prefix, mmap=True):
+        """Load the arrays saved by save(), memory-mapped by default."""
+        mmap_mode = 'r' if mmap else None
+        return cls(*(np.load(f"{prefix}_{name}.npy", mmap_mode=mmap_mode) for name in ARRAY_NAMES))
+
+    def save(self, prefix):
+        for name in ARRAY_NAMES:
+            np.save(f"{prefix}_{name}.npy", getattr(self, name))
+
+    @property
+    def n_clusters(self):
+        return len(self.centroids)
+
+    @property
+    def n_sequences(self):
+        return len(self.members)
+
+    def __len__(self):
+        return self.n_clusters
+
+    def sizes(self):
+        """Number of members of every cluster (int64 array)."""
+        return np.diff(self.offsets)
+
+    def sorted_by_size(self, descending=True):
+        """A new table with the clusters ordered by size (ties keep the current order)."""
+        sizes = self.sizes()
+        order = np.argsort(-sizes if descending else sizes, kind='stable')
+        offsets = np.zeros_like(self.offsets)
+        np.cumsum(sizes[order], out=offsets[1:])
+        # member positions of the reordered clusters: start of the cluster in the old layout + position within it
+        starts = np.repeat(self.offsets[:-1][order] - offsets[:-1], sizes[order])
+        members = self.members[np.arange(len(self.members)) + starts]
+        return ClusterTable(self.ids, self.centroids[order], offsets, members)
+
+    def member_codes(self, cluster):
+        return self.members[self.offsets[cluster]:self.offsets[cluster + 1]]
+
+    def cluster_members(self, cluster):
+        """The member IDs of a cluster."""
+        return self.ids[self.member_codes(cluster)]
+
+    def __iter__(self):
+        """Yield (centroid ID, member ID array) of every cluster."""
+        for cluster in range(self.n_clusters):
+            yield self.ids[self.centroids[cluster]], self.cluster_members(cluster)
+
+    def codes(self, record_ids):
+        """Codes of an array of IDs, -1 for unknown IDs."""
+        # bytes IDs keep their own width, a cast to the width of ids could truncate them into a false match
+        record_ids = np.asarray(record_ids, dtype=self.ids.dtype if self.ids.dtype.kind in 'iu' else None)
+        codes = np.searchsorted(self.ids, record_ids)
+        codes[codes == len(self.ids)] = 0
+        return np.where(self.ids[codes] == record_ids, codes, -1) if len(self.ids) else np.full(len(record_ids), -1)
+
+    def code(self, record_id):
+        """Code of one ID (str, bytes or int), -1 if unknown."""
+        if self.ids.dtype.kind in 'iu':
+            record_id = int(record_id)
+        elif isinstance(record_id, str):
+            record_id = record_id.encode()
+        return int(self.codes([record_id])[0])
+
+    def cluster_of_codes(self):
+        """Cluster index of every code (-1 for IDs that are only centroids), computed once."""
+        if self._cluster_of_code is None:
+            cluster_of_code = np.full(len(self.ids), -1, dtype=np.int64)
+            cluster_of_code[self.members] = np.repeat(np.arange(self.n_clusters), self.sizes())
+            self._cluster_of_code = cluster_of_code
+        return self._cluster_of_code
+
+    def cluster_of(self, record_id):
+        """Cluster index of a sequence ID, -1 if unknown."""
+        code = self.code(record_id)
+        return -1 if code == -1 else int(self.cluster_of_codes()[code])
+
+    def id_strings(self, codes):
+        """The IDs of codes as a list of str (for writing ID files or looking up FASTA records)."""
+        values = self.ids[codes]
+        if values.dtype.kind == 'S':
+            return [value.decode() for value in values.tolist()]
+        return [str(value) for value in values.tolist()]
+
+
+class CodeLookup:
+    """Read-only mapping ID (str) -> value of its code, with the get() interface used by partition_fasta.py.
+    For integer IDs the values are scattered into a dense array indexed by the ID (one byte per possible rowid for
+    int8 values), otherwise every get() is a binary search in the table's IDs."""
+
+    def __init__(self, table, values_per_code, names=None):
+        self.table = table
+        self.values = values_per_code
+        self.names = names
+        self.dense = None
+        ids = table.ids
+        if ids.dtype.kind in 'iu' and len(ids) and ids[0] >= 0 and ids[-1] < 4 * len(ids) + 1024:
+            self.dense = np.full(int(ids[-1]) + 1, -1, dtype=values_per_code.dtype)
+            self.dense[ids] = values_per_code
+
+    def get(self, record_id, default=None):
+        if self.dense is not None:
+            try:
+                index = int(record_id)
+            except ValueError:
+                return default
+            value = self.dense[index] if 0 <= index < len(self.dense) else -1
+        else:
+            code = self.table.code(record_id)
+            value = -1 if code == -1 else self.values[code]
+        if value == -1:
+            return default
+        return self.names[value] if self.names is not None else value
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert an mmseqs cluster TSV into a compact CSR cluster table (.npy)')
+    parser.add_argument("--tsv", help="mmseqs createtsv output (centroid ID, member ID)", type=str, required=True)
+    parser.add_argument("--output", help="Prefix of the .npy files", type=str, required=True)
+    parser.add_argument("--sort_by_size", help="Order the clusters by decreasing size", action='store_true')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = ClusterTable.from_tsv(args.tsv)
+    if args.sort_by_size:
+        table = table.sorted_by_size()
+    table.save(args.output)
+    n_bytes = sum(getattr(table, name).nbytes for name in ARRAY_NAMES)
+    print(f"{table.n_clusters} clusters, {table.n_sequences} members, {len(table.ids)} IDs "
+          f"({n_bytes / 1e6:.1f} MB) in {time.perf_counter() - start:.1f} s")
@@ -1,3 +1,5 @@
+from fasta_index import FastaIndex
+
 
 def read_ids_from_file(file_path):
     """Read IDs from a text file, one per line."""
@@ -20,17 +22,27 @@ def filter_sequences_by_ids(source_fasta, target_ids, output_fasta):
             elif write_sequence:
                 output.write(line)
 
+def filter_sequences_with_index(source_fasta, target_ids, output_fasta):
+    """Same as filter_sequences_by_ids, but reads only the target records through the offset index (fasta_index.py)."""
+    with FastaIndex(source_fasta) as fasta_index, open(output_fasta, 'wb') as output:
+        fasta_index.write_records(target_ids, output)
+
 # File paths
 centroids_ids_file = "/ibmm_data2/oas_database/paired_lea_tmp/txt_files_oas_db/centroids_ids_cdr3_aa_100.txt"
 full_sequences_fasta = "/ibmm_data2/oas_database/paired_lea_tmp/linclust_full_seq_all_paired/all_human_paired_full_aa_seq_no_duplicates.fasta"
 output_fasta = "/ibmm_data2/oas_database/paired_lea_tmp/filtered_fasta_file/all_human_paired_full_aa_seq_filtered_2.fasta"  
+# The index (<fasta>.fidx) is built on the first run and reused afterwards
+use_fasta_index = True
 
 # Step 1: Read IDs from the centroids IDs file
 centroid_ids = read_ids_from_file(centroids_ids_file)
 #print(len(centroid_ids))
 
 # Step 2: Filter sequences from the full sequences FASTA file and save to a new file
-filter_sequences_by_ids(full_sequences_fasta, centroid_ids, output_fasta)
+if use_fasta_index:
+    filter_sequences_with_index(full_sequences_fasta, centroid_ids, output_fasta)
+else:
+    filter_sequences_by_ids(full_sequences_fasta, centroid_ids, output_fasta)
 
 print("Filtered sequences have been saved to the output FASTA file.")
 
@@ -0,0 +1,285 @@
+"""
+Resumable runner for the two-stage clustering data preparation (CDR3 clustering -> filter by centroids -> remove
+duplicates -> full sequence clustering -> train/val/test split), replacing the manual chain
+create_fasta_and_csv.sh -> heavy_model/mmseqs/1.cdrh3 -> filter_seqs_with_sqlite.sh -> remove_dupl_create_fasta.sh ->
+second clustering -> train_test_val_split.py.
+
+The steps are declared in a JSON file (see clustering_pipeline.json) with a command, input files and output files:
+{
+  "vars": {"data_dir": "/ibmm_data2/oas_database/paired_lea_tmp/heavy_model/data_from_oas", ...},
+  "steps": [{"name": "...", "command": "python ${repo}/extract_columns.py ...", "inputs": [...], "outputs": [...]}]
+}
+${name} is replaced by the vars (which can use the vars defined before them, ${repo} is the directory of this script)
+and can be overridden on the command line with --var name=value, so no path is hard-coded in the scripts.
+
+A step depends on the steps that produce its inputs. It is skipped if all its outputs exist and the SHA-256 of its
+command and of the content of its inputs is the same as in the last successful run (stored in <config>.state.json,
+the file hashes are cached by size and mtime so unchanged files are not read again). A step whose upstream step was
+re-run but produced identical files is therefore skipped as well. Inputs listed under "stat_inputs" instead of
+"inputs" (the multi-hundred-GB OAS SQLite databases) are never read: their size and mtime stand in for the content
+hash, so any write to the database re-runs the steps that read it. Steps whose dependencies are done run concurrently
+(--jobs), e.g. the heavy and the light chain. Changing only the split percentages re-runs only the split steps.
+
+The filter step of clustering_pipeline.json extracts the centroid rows of the CDR3 clustering by rowid
+(extract_columns.py --rowid_file), i.e. one full sequence per CDR3 cluster. filter_seqs_with_sqlite.sh selected every
+row whose CDR3 equals a centroid CDR3, which also kept the other rows with an identical CDR3 (they are members of the
+same 100% cluster).
+
+Example:
+python clustering_pipeline.py clustering_pipeline.json --jobs 2 --var split_args="--train_percentage 0.9 --val_percentage 0.05 --test_percentage 0.05"
+"""
+import argparse
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from string import Template
+
+BLOCK_SIZE = 16 * 1024 * 1024
+
+
+class Step:
+    """One command of the pipeline with the files it reads and writes."""
+
+    def __init__(self, name, command, inputs, outputs, stat_inputs=()):
+        self.name = name
+        self.command = command
+        # all inputs, stat_inputs are the ones fingerprinted by size and mtime only
+        self.inputs = inputs + [path for path in stat_inputs if path not in inputs]
+        self.stat_inputs = set(stat_inputs)
+        self.outputs = outputs
+        self.dependencies = set()
+
+
+def resolve_vars(config_vars, overrides):
+    """Substitute the vars into each other in definition order; overrides replace the values of the config."""
+    resolved = {'repo': os.path.dirname(os.path.abspath(__file__))}
+    values = dict(config_vars)
+    values.update(overrides)
+    for name, value in values.items():
+        resolved[name] = Template(str(value)).substitute(resolved)
+    return resolved
+
+
+def load_pipeline(config_path, overrides=None):
+    """Read the JSON config and return the steps (in definition order) with their dependencies."""
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    variables = resolve_vars(config.get('vars', {}), overrides or {})
+
+    def substitute(value):
+        return Template(value).substitute(variables)
+
+    steps = {}
+    producers = {}
+    for step_config in config['steps']:
+        step = Step(step_config['name'], substitute(step_config['command']),
+                    [os.path.abspath(substitute(path)) for path in step_config.get('inputs', [])],
+                    [os.path.abspath(substitute(path)) for path in step_config.get('outputs', [])],
+                    [os.path.abspath(substitute(path)) for path in step_config.get('stat_inputs', [])])
+        if step.name in steps:
+            raise ValueError(f"Step '{step.name}' is defined twice.")
+        for path in step.outputs:
+            if path in producers:
+                raise ValueError(f"{path} is an output of '{producers[path]}' and '{step.name}'.")
+            producers[path] = step.name
+        steps[step.name] = step
+
+    for step in steps.values():
+        step.dependencies = {producers[path] for path in step.inputs if path in producers}
+    check_acyclic(steps)
+    return steps
+
+
+def check_acyclic(steps):
+    """Raise a ValueError if the dependencies contain a cycle."""
+    remaining = {name: set(step.dependencies) for name, step in steps.items()}
+    while remaining:
+        ready = [name for name, dependencies in remaining.items() if not dependencies]
+        if not ready:
+            raise ValueError(f"The steps {sorted(remaining)} depend on each other.")
+        for name in ready:
+            del remaining[name]
+        for dependencies in remaining.values():
+            dependencies.difference_update(ready)
+
+
+class PipelineState:
+    """File hash cache and hashes of the last successful run of every step, saved as JSON after every step."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {'files': {}, 'steps': {}}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.state = json.load(f)
+
+    def file_hash(self, path):
+        """SHA-256 of the file content, cached as long as size and mtime are unchanged."""
+        stat = os.stat(path)
+        with self.lock:
+            cached = self.state['files'].get(path)
+        if cached is not None and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached['sha256']
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                sha256.update(block)
+        with self.lock:
+            self.state['files'][path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256.hexdigest()}
+        return sha256.hexdigest()
+
+    def step_hash(self, step):
+        """Hash of the command and of the content of all inputs (size and mtime of the stat_inputs)."""
+        sha256 = hashlib.sha256(step.command.encode())
+        for path in step.inputs:
+            if path in step.stat_inputs:
+                stat = os.stat(path)
+                fingerprint = f"size={stat.st_size},mtime_ns={stat.st_mtime_ns}"
+            else:
+                fingerprint = self.file_hash(path)
+            sha256.update(f"\0{path}\0{fingerprint}".encode())
+        return sha256.hexdigest()
+
+    def is_up_to_date(self, step, step_hash):
+        with self.lock:
+            last_run = self.state['steps'].get(step.name)
+        return last_run is not None and last_run['hash'] == step_hash and all(os.path.exists(path) for path in step.outputs)
+
+    def record(self, step, step_hash, wall_time):
+        for path in step.outputs:
+            # hash the fresh outputs now, the downstream steps need them anyway
+            if os.path.isfile(path):
+                self.file_hash(path)
+        with self.lock:
+            self.state['steps'][step.name] = {'hash': step_hash, 'wall_time_s': round(wall_time, 2),
+                                              'finished_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+            self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def run_step(step, state, log_dir, force=False):
+    """Run one step unless it is up to date. Returns 'skipped' or 'done', raises CalledProcessError on failure."""
+    missing = [path for path in step.inputs if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"{step.name}: missing inputs {missing}")
+    step_hash = state.step_hash(step)
+    if not force and state.is_up_to_date(step, step_hash):
+        print(f"[{step.name}] up to date, skipped", flush=True)
+        return 'skipped'
+
+    for path in step.outputs:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    log_path = os.path.join(log_dir, f"{step.name}.log")
+    print(f"[{step.name}] {step.command}", flush=True)
+    start = time.perf_counter()
+    with open(log_path, 'w') as log:
+        process = subprocess.run(shlex.split(step.command), stdout=log, stderr=subprocess.STDOUT)
+    wall_time = time.perf_counter() - start
+    if process.returncode != 0:
+        print(f"[{step.name}] failed with exit code {process.returncode}, see {log_path}", flush=True)
+        raise subprocess.CalledProcessError(process.returncode, step.command)
+    missing = [path for path in step.outputs if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"{step.name}: the command did not create {missing}")
+    state.record(step, step_hash, wall_time)
+    print(f"[{step.name}] done in {wall_time:.1f} s", flush=True)
+    return 'done'
+
+
+def run_pipeline(steps, state_path, log_dir, jobs=1, force=(), only=None):
+    """Run the steps in dependency order, at most `jobs` at the same time. Returns {step name: result}."""
+    os.makedirs(log_dir, exist_ok=True)
+    state = PipelineState(state_path)
+    if only is not None:
+        steps = select_upstream(steps, only)
+    results = {}
+    failed = set()
+    pending = dict(steps)
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            for name in list(pending):
+                step = pending[name]
+                if step.dependencies & failed:
+                    results[name] = 'not run'
+                    failed.add(name)
+                    del pending[name]
+                elif all(dependency in results for dependency in step.dependencies):
+                    running[executor.submit(run_step, step, state, log_dir, name in force)] = name
+                    del pending[name]
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except (subprocess.CalledProcessError, FileNotFoundError) as e:
+                    print(f"[{name}] {e}", flush=True)
+                    results[name] = 'failed'
+                    failed.add(name)
+    return results
+
+
+def select_upstream(steps, targets):
+    """The target steps and all steps they depend on."""
+    selected = set()
+    stack = list(targets)
+    while stack:
+        name = stack.pop()
+        if name not in steps:
+            raise ValueError(f"Unknown step '{name}'.")
+        if name not in selected:
+            selected.add(name)
+            stack.extend(steps[name].dependencies)
+    return {name: step for name, step in steps.items() if name in selected}
+
+
+def parse_vars(var_args):
+    overrides = {}
+    for var in var_args:
+        name, sep, value = var.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError(f"--var expects name=value, got '{var}'")
+        overrides[name] = value
+    return overrides
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the clustering data preparation steps, skipping up-to-date steps')
+    parser.add_argument("config", help="JSON file with the vars and steps of the pipeline", type=str)
+    parser.add_argument("--var", help="Override a var of the config (name=value), can be repeated", action='append', default=[])
+    parser.add_argument("--jobs", help="Number of steps run at the same time", type=int, default=1)
+    parser.add_argument("--only", help="Only run these steps (and the steps they depend on)", nargs='+', type=str)
+    parser.add_argument("--force", help="Run these steps even if they are up to date", nargs='+', type=str, default=[])
+    parser.add_argument("--state", help="State file (default: <config>.state.json)", type=str)
+    parser.add_argument("--log_dir", help="Directory for the step logs (default: <config>_logs)", type=str)
+    parser.add_argument("--list", help="Print the steps and their dependencies and exit", action='store_true')
+    args = parser.parse_args()
+
+    config_base = os.path.splitext(args.config)[0]
+    steps = load_pipeline(args.config, parse_vars(args.var))
+    if args.list:
+        for step in steps.values():
+            print(f"{step.name}: {step.command}")
+            print(f"    depends on: {', '.join(sorted(step.dependencies)) or '-'}")
+    else:
+        start = time.perf_counter()
+        results = run_pipeline(steps, args.state or f"{config_base}.state.json", args.log_dir or f"{config_base}_logs",
+                               jobs=args.jobs, force=set(args.force), only=args.only)
+        for name, result in results.items():
+            print(f"{name}: {result}")
+        print(f"Pipeline finished in {time.perf_counter() - start:.1f} s")
+        if 'failed' in results.values():
+            raise SystemExit(1)
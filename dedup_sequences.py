@@ -0,0 +1,202 @@
+"""
+Exact-duplicate removal keyed on a 64 or 128 bit hash of the sequence instead of the sequence string itself
+(replaces awk -F ',' '!seen[$3]++' in heavy_model/src/remove_dupl_create_fasta.sh and the *_no_duplicates.fasta step of the
+paired pipeline). The first pass stores only the hash (blake2b, the same in every run) and the byte offset of every
+record in NumPy arrays; a stable sort by hash gives the first occurrence of every hash. The second pass writes the
+records in input order and reads the first sequence of a hash back from the memory-mapped input to compare it, so a
+hash collision never merges different sequences. The first ID of every sequence is kept. Besides the deduplicated file
+an ID -> canonical ID map (tab-separated) is written.
+
+Memory is about 40 bytes per record (16 per record for the second pass). Inputs larger than --partition_size are first
+spilled into partition files by hash and every partition is deduplicated on its own (the output is then grouped by
+partition instead of keeping the input order); --partitions sets the number explicitly, 0 keeps everything in memory.
+
+Input: a delimited text file (--id_column / --seq_column, 0-based) or a FASTA file (--format fasta).
+
+Example:
+python dedup_sequences.py --input filtered_heavy_seqs_from_cdrh3.txt --output filtered_heavy_seqs_from_cdrh3_no_duplicates.txt \
+    --id_map filtered_heavy_seqs_from_cdrh3_id_map.tsv --seq_column 2
+"""
+import argparse
+import hashlib
+import math
+import mmap
+import os
+import tempfile
+import time
+from array import array
+
+import numpy as np
+
+# input bytes per partition when the number of partitions is derived from the input size
+PARTITION_SIZE = 4 * 1024 ** 3
+
+
+def hash_sequence(sequence, hash_bits=64):
+    """64 or 128 bit blake2b digest (bytes) of a sequence, independent of the process (unlike hash())."""
+    return hashlib.blake2b(sequence, digest_size=hash_bits // 8).digest()
+
+
+def header_id(header):
+    """ID (first word) of a FASTA header line, b'' for an empty header."""
+    words = header[1:].split(None, 1)
+    return words[0] if words else b''
+
+
+def iter_delimited(f, id_column, seq_column, delimiter):
+    """Yield (offset, record bytes, id, sequence) for every line of a delimited file opened in binary mode."""
+    offset = 0
+    for line in f:
+        fields = line.rstrip(b'\r\n').split(delimiter)
+        yield offset, line, fields[id_column], fields[seq_column]
+        offset += len(line)
+
+
+def iter_fasta(f):
+    """Yield (offset, record bytes, id, sequence) for every record of a FASTA file opened in binary mode."""
+    offset = 0
+    record_offset, lines = 0, []
+    for line in f:
+        if line.startswith(b'>') and lines:
+            yield record_offset, b''.join(lines), header_id(lines[0]), b''.join(l.strip() for l in lines[1:])
+            record_offset, lines = offset, []
+        lines.append(line)
+        offset += len(line)
+    if lines:
+        yield record_offset, b''.join(lines), header_id(lines[0]), b''.join(l.strip() for l in lines[1:])
+
+
+def iter_records(f, input_format, id_column=0, seq_column=1, delimiter=b','):
+    """Yield (offset, record bytes, id, sequence) of a FASTA or delimited file."""
+    if input_format == 'fasta':
+        return iter_fasta(f)
+    return iter_delimited(f, id_column, seq_column, delimiter)
+
+
+def record_at(mm, offset, input_format, id_column=0, seq_column=1, delimiter=b','):
+    """Parse the record that starts at offset of the memory-mapped input. Returns (id, sequence)."""
+    if input_format == 'fasta':
+        end = mm.find(b'\n>', offset)
+        lines = mm[offset:end if end != -1 else len(mm)].split(b'\n')
+        return header_id(lines[0]), b''.join(l.strip() for l in lines[1:])
+    end = mm.find(b'\n', offset)
+    fields = mm[offset:end if end != -1 else len(mm)].rstrip(b'\r').split(delimiter)
+    return fields[id_column], fields[seq_column]
+
+
+def first_occurrences(input_path, input_format='csv', id_column=0, seq_column=1, delimiter=b',', hash_bits=64):
+    """Byte offset of the first record with the same hash, for every record of the input (int64 array)."""
+    digests = bytearray()
+    offsets = array('q')
+    with open(input_path, 'rb', buffering=16 * 1024 * 1024) as f:
+        for offset, _, _, sequence in iter_records(f, input_format, id_column, seq_column, delimiter):
+            digests += hash_sequence(sequence, hash_bits)
+            offsets.append(offset)
+    offsets = np.frombuffer(offsets, dtype=np.int64)
+    hashes = np.frombuffer(digests, dtype='<u8').reshape(len(offsets), hash_bits // 64)
+    # stable: within a group of equal hashes the records stay in input order, the first one is the first occurrence
+    order = np.lexsort(hashes.T[::-1])
+    sorted_hashes = hashes[order]
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = np.any(sorted_hashes[1:] != sorted_hashes[:-1], axis=1)
+    del sorted_hashes, hashes, digests
+    group_first_offsets = offsets[order[new_group]]
+    first_offsets = np.empty_like(offsets)
+    first_offsets[order] = group_first_offsets[np.cumsum(new_group) - 1]
+    return first_offsets
+
+
+def dedup_file(input_path, output_file, id_map_file, input_format='csv', id_column=0, seq_column=1, delimiter=b',',
+               hash_bits=64):
+    """Deduplicate one file into the open binary output and map files. Returns (n records, n unique sequences)."""
+    if os.path.getsize(input_path) == 0:
+        return 0, 0
+    first_offsets = first_occurrences(input_path, input_format, id_column, seq_column, delimiter, hash_bits)
+    # sequences whose hash collides with a different sequence, checked exactly
+    collisions = {}
+    n_records = n_unique = 0
+    with open(input_path, 'rb', buffering=16 * 1024 * 1024) as f, open(input_path, 'rb') as raw:
+        mm = mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ)
+        for offset, record, record_id, sequence in iter_records(f, input_format, id_column, seq_column, delimiter):
+            first_offset = int(first_offsets[n_records])
+            n_records += 1
+            is_first = False
+            if first_offset == offset:
+                canonical_id, is_first = record_id, True
+            else:
+                canonical_id, first_sequence = record_at(mm, first_offset, input_format, id_column, seq_column, delimiter)
+                if first_sequence != sequence:
+                    if sequence in collisions:
+                        canonical_id = collisions[sequence]
+                    else:
+                        collisions[sequence] = record_id
+                        canonical_id, is_first = record_id, True
+            if is_first:
+                output_file.write(record)
+                n_unique += 1
+            id_map_file.write(record_id + b'\t' + canonical_id + b'\n')
+        mm.close()
+    return n_records, n_unique
+
+
+def partition_file(input_path, tmp_dir, n_partitions, input_format='csv', id_column=0, seq_column=1, delimiter=b',',
+                   hash_bits=64):
+    """Spill the records into n_partitions files by sequence hash. Returns the partition paths."""
+    paths = [os.path.join(tmp_dir, f'partition_{i}') for i in range(n_partitions)]
+    parts = [open(path, 'wb') for path in paths]
+    with open(input_path, 'rb', buffering=16 * 1024 * 1024) as f:
+        for _, record, _, sequence in iter_records(f, input_format, id_column, seq_column, delimiter):
+            if not record.endswith(b'\n'):
+                record += b'\n'
+            parts[int.from_bytes(hash_sequence(sequence, hash_bits)[:8], 'little') % n_partitions].write(record)
+    for part in parts:
+        part.close()
+    return paths
+
+
+def dedup_sequences(input_path, output_path, id_map_path, input_format='csv', id_column=0, seq_column=1, delimiter=',',
+                    hash_bits=64, n_partitions=None, partition_size=PARTITION_SIZE, tmp_dir=None):
+    """Write the deduplicated records and the ID -> canonical ID map. Returns (n records, n unique sequences).
+    n_partitions None: one partition per partition_size bytes of input (none for smaller inputs), 0: all in memory."""
+    delimiter = delimiter.encode()
+    if n_partitions is None:
+        n_partitions = math.ceil(os.path.getsize(input_path) / partition_size)
+        n_partitions = n_partitions if n_partitions > 1 else 0
+    start = time.perf_counter()
+    with open(output_path, 'wb') as output_file, open(id_map_path, 'wb') as id_map_file:
+        if n_partitions:
+            n_records, n_unique = 0, 0
+            with tempfile.TemporaryDirectory(dir=tmp_dir) as partition_dir:
+                for path in partition_file(input_path, partition_dir, n_partitions, input_format, id_column, seq_column,
+                                           delimiter, hash_bits):
+                    counts = dedup_file(path, output_file, id_map_file, input_format, id_column, seq_column, delimiter, hash_bits)
+                    n_records += counts[0]
+                    n_unique += counts[1]
+                    os.remove(path)
+        else:
+            n_records, n_unique = dedup_file(input_path, output_file, id_map_file, input_format, id_column, seq_column,
+                                             delimiter, hash_bits)
+    print(f"{n_records} records, {n_unique} unique sequences ({n_records - n_unique} duplicates removed) "
+          f"in {time.perf_counter() - start:.1f} s")
+    return n_records, n_unique
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Remove exact duplicate sequences using sequence hashes')
+    parser.add_argument("--input", help="Input file (delimited text or FASTA)", type=str, required=True)
+    parser.add_argument("--output", help="Output file with the first record of every sequence", type=str, required=True)
+    parser.add_argument("--id_map", help="Output TSV with ID and canonical ID of every record", type=str, required=True)
+    parser.add_argument("--format", help="Format of the input", choices=['csv', 'fasta'], default='csv')
+    parser.add_argument("--id_column", help="0-based ID column (csv)", type=int, default=0)
+    parser.add_argument("--seq_column", help="0-based sequence column (csv)", type=int, default=1)
+    parser.add_argument("--delimiter", help="Column delimiter (csv)", type=str, default=',')
+    parser.add_argument("--hash_bits", help="Hash size", type=int, choices=[64, 128], default=64)
+    parser.add_argument("--partitions", help="Spill to this many partitions on disk first (0 = all in memory, "
+                                             "default: one per --partition_size bytes of input)", type=int)
+    parser.add_argument("--partition_size", help="Input bytes per partition when --partitions is not given", type=int, default=PARTITION_SIZE)
+    parser.add_argument("--tmp_dir", help="Directory for the partition files", type=str)
+    args = parser.parse_args()
+
+    dedup_sequences(args.input, args.output, args.id_map, input_format=args.format, id_column=args.id_column,
+                    seq_column=args.seq_column, delimiter=args.delimiter, hash_bits=args.hash_bits,
+                    n_partitions=args.partitions, partition_size=args.partition_size, tmp_dir=args.tmp_dir)
@@ -0,0 +1,178 @@
+"""
+Extract columns of a table of the OAS SQLite database in one pass and write them as CSV, FASTA and/or a binary
+columnar directory at the same time (replaces the sqlite3 CLI + awk exports in extract_sequences_sqlite3.sh,
+export_csv.sh and heavy_model/src/create_fasta_and_csv.sh).
+The query results are streamed with a large fetch size; the throughput (rows/s) is reported.
+
+FASTA records use the first column as ID and --fasta_seq_column as sequence.
+The columnar directory contains one file per column: <column>.int64 for the rowid, and for text columns the
+concatenated UTF-8 bytes in <column>.bin plus the int64 start offsets (n_rows + 1) in <column>.offsets.
+columns.json describes the layout.
+If --rowid_file is given only these rows are extracted (join on the rowid, which uses the table's rowid b-tree). The file is
+either one rowid per line or a FASTA file whose IDs are rowids (e.g. the <prefix>_clu_rep.fasta centroids of mmseqs).
+
+Example (rowid, cdrh3 and full heavy sequence as CSV and the CDRH3 FASTA for clustering):
+python extract_columns.py --db /ibmm_data2/oas_database/OAS_heavy.db --table Bcells_subset_human_unpaired_heavy \
+    --columns rowid cdr3_aa sequence_alignment_aa --csv heavy_unpaired_cdrh3_full_heavy.csv \
+    --fasta heavy_unpaired_cdrh3.fasta --fasta_seq_column cdr3_aa
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import time
+from array import array
+
+
+class ColumnarWriter:
+    """Append rows column-wise to <column>.int64 or <column>.bin/<column>.offsets files in out_dir."""
+
+    def __init__(self, out_dir, columns, column_types):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.columns = columns
+        self.column_types = column_types
+        self.files = {}
+        self.offsets = {}
+        for column, column_type in zip(columns, column_types):
+            if column_type == 'int64':
+                self.files[column] = open(os.path.join(out_dir, f'{column}.int64'), 'wb')
+            else:
+                self.files[column] = open(os.path.join(out_dir, f'{column}.bin'), 'wb')
+                self.offsets[column] = open(os.path.join(out_dir, f'{column}.offsets'), 'wb')
+                array('q', [0]).tofile(self.offsets[column])
+        self.positions = {column: 0 for column in self.offsets}
+        self.n_rows = 0
+
+    def write_rows(self, rows):
+        for i, column in enumerate(self.columns):
+            values = [row[i] for row in rows]
+            if column not in self.offsets:
+                array('q', values).tofile(self.files[column])
+                continue
+            encoded = [b'' if value is None else str(value).encode() for value in values]
+            ends = array('q')
+            position = self.positions[column]
+            for value in encoded:
+                position += len(value)
+                ends.append(position)
+            self.positions[column] = position
+            self.files[column].write(b''.join(encoded))
+            ends.tofile(self.offsets[column])
+        self.n_rows += len(rows)
+
+    def close(self):
+        for f in list(self.files.values()) + list(self.offsets.values()):
+            f.close()
+        with open(os.path.join(self.out_dir, 'columns.json'), 'w') as f:
+            json.dump({'n_rows': self.n_rows, 'columns': dict(zip(self.columns, self.column_types))}, f, indent=2)
+
+
+def get_column_types(columns):
+    """Return 'int64' for the rowid and 'text' for all other columns (OAS columns are loaded from CSV as text)."""
+    return ['int64' if column.lower() == 'rowid' else 'text' for column in columns]
+
+
+def read_rowids(rowid_file):
+    """Yield the rowids of a file with one rowid per line or of the headers of a FASTA file."""
+    with open(rowid_file, 'r') as f:
+        first_line = f.readline()
+        f.seek(0)
+        if first_line.startswith('>'):
+            for line in f:
+                if line.startswith('>'):
+                    yield int(line[1:].split(None, 1)[0])
+        else:
+            for line in f:
+                if line.strip():
+                    yield int(line)
+
+
+def build_query(conn, table_name, columns, rowid_file=None, where=None):
+    """Return the SELECT statement, loading the rowids into a temporary table if rowid_file is given."""
+    selected = ", ".join(f"t.{column}" for column in columns)
+    query = f"SELECT {selected} FROM {table_name} t"
+    if rowid_file is not None:
+        conn.execute("DROP TABLE IF EXISTS temp.extract_rowids;")
+        conn.execute("CREATE TEMP TABLE extract_rowids (id INTEGER PRIMARY KEY);")
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO temp.extract_rowids VALUES (?);",
+                             ((rowid,) for rowid in read_rowids(rowid_file)))
+        query += " JOIN temp.extract_rowids r ON t.rowid = r.id"
+    if where is not None:
+        query += f" WHERE {where}"
+    return query
+
+
+def extract_columns(db_path, table_name, columns, csv_path=None, fasta_path=None, fasta_seq_column=None,
+                    columnar_dir=None, csv_header=False, rowid_file=None, where=None, fetch_size=100000,
+                    report_every=1000000):
+    """Stream the selected columns once and write all requested output formats. Returns the number of rows."""
+    if fasta_path is not None:
+        fasta_seq_column = fasta_seq_column or columns[1]
+        seq_index = columns.index(fasta_seq_column)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.arraysize = fetch_size
+    query = build_query(conn, table_name, columns, rowid_file=rowid_file, where=where)
+    print(f"Query: {query}")
+
+    csv_file = open(csv_path, 'w', newline='') if csv_path else None
+    fasta_file = open(fasta_path, 'w') if fasta_path else None
+    columnar = ColumnarWriter(columnar_dir, columns, get_column_types(columns)) if columnar_dir else None
+    csv_writer = csv.writer(csv_file) if csv_file else None
+    if csv_writer is not None and csv_header:
+        csv_writer.writerow(columns)
+
+    n_rows = 0
+    next_report = report_every
+    start = time.perf_counter()
+    try:
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            if csv_writer is not None:
+                csv_writer.writerows(rows)
+            if fasta_file is not None:
+                fasta_file.write("".join(f">{row[0]}\n{row[seq_index]}\n" for row in rows))
+            if columnar is not None:
+                columnar.write_rows(rows)
+            n_rows += len(rows)
+            if report_every and n_rows >= next_report:
+                print(f"  {n_rows} rows ({n_rows / (time.perf_counter() - start):.0f} rows/s)")
+                next_report += report_every
+    finally:
+        for f in (csv_file, fasta_file, columnar):
+            if f is not None:
+                f.close()
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Extracted {n_rows} rows from {table_name} in {elapsed:.1f} s ({n_rows / max(elapsed, 1e-9):.0f} rows/s)")
+    return n_rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract columns of an OAS SQLite table as CSV, FASTA and/or columnar files in one pass')
+    parser.add_argument("--db", help="Path to the SQLite database", type=str, required=True)
+    parser.add_argument("--table", help="Name of the table", type=str, required=True)
+    parser.add_argument("--columns", help="Columns to extract (rowid is allowed)", nargs='+', type=str,
+                        default=['rowid', 'cdr3_aa', 'sequence_alignment_aa'])
+    parser.add_argument("--csv", help="Output CSV file", type=str)
+    parser.add_argument("--csv_header", help="Write the column names as first CSV line", action='store_true')
+    parser.add_argument("--fasta", help="Output FASTA file (ID = first column)", type=str)
+    parser.add_argument("--fasta_seq_column", help="Column used as FASTA sequence (default: second column)", type=str)
+    parser.add_argument("--columnar", help="Output directory for the binary columnar files", type=str)
+    parser.add_argument("--rowid_file", help="Only extract the rowids listed in this file (one per line, or the IDs of a FASTA file)", type=str)
+    parser.add_argument("--where", help="Optional SQL WHERE condition", type=str)
+    parser.add_argument("--fetch_size", help="Number of rows fetched per fetchmany", type=int, default=100000)
+    args = parser.parse_args()
+
+    if not (args.csv or args.fasta or args.columnar):
+        parser.error("at least one of --csv, --fasta or --columnar is required")
+    extract_columns(args.db, args.table, args.columns, csv_path=args.csv, fasta_path=args.fasta,
+                    fasta_seq_column=args.fasta_seq_column, columnar_dir=args.columnar, csv_header=args.csv_header,
+                    rowid_file=args.rowid_file, where=args.where, fetch_size=args.fetch_size)
@@ -1,23 +1,81 @@
-centroids_file_path = '/ibmm_data2/oas_database/paired_lea_tmp/txt_files_oas_db/centroids_ids_cdrl3_aa_70_human_unpaired.txt'  
-data_file_path = '/ibmm_data2/oas_database/paired_lea_tmp/txt_files_oas_db/Bcells_subset_human_unpaired_light_cdr3_light_seq_3_rowid.txt'  
-output_file_path = '/ibmm_data2/oas_database/paired_lea_tmp/txt_files_oas_db/matched_rows_cdrl3_unpaired_python_4.txt'
+"""
+Extract lines of a (large) data file either by line number or by the rowid/ID in the first column.
+Replaces the list membership test of the old version (O(N x M)) and the extract.awk and sqlite join workarounds
+(match_ids.py is the multi-process version of --key rowid for very large exports).
 
-# centroids_file_path = '/ibmm_data2/oas_database/paired_lea_tmp/centroid_test.txt'  
-# data_file_path = '/ibmm_data2/oas_database/paired_lea_tmp/test_data.txt'  
-# output_file_path = '/ibmm_data2/oas_database/paired_lea_tmp/test_output_extraction.txt'
+--key line   the centroids file contains 1-based line numbers; they are sorted and merged with the data file in one pass,
+             the scan stops after the last requested line
+--key rowid  the centroids file contains rowids/IDs; a data line is kept if its first column (up to --separator) is in the set
 
-# Reading line numbers to extract, storing them in a list
-with open(centroids_file_path, 'r') as f:
-    line_numbers_to_extract = [int(line.strip()) for line in f]
+The files are read and written in binary mode with large buffers, the output keeps the order of the data file.
 
-#print(line_numbers_to_extract[:10])
+Example:
+python extract_lines.py --key rowid \
+    --centroids /ibmm_data2/oas_database/paired_lea_tmp/txt_files_oas_db/centroids_ids_cdrl3_aa_70_human_unpaired.txt \
+    --data /ibmm_data2/oas_database/paired_lea_tmp/txt_files_oas_db/Bcells_subset_human_unpaired_light_cdr3_light_seq_3_rowid.txt \
+    --output /ibmm_data2/oas_database/paired_lea_tmp/txt_files_oas_db/matched_rows_cdrl3_unpaired_python_4.txt
+"""
+import argparse
+import time
 
-# Extracting the specified lines
-with open(data_file_path, 'r') as data_file, open(output_file_path, 'w') as output_file:
+BUFFER_SIZE = 16 * 1024 * 1024
+
+
+def read_keys(file_path):
+    """Read the non-empty lines of a file as bytes (whitespace stripped)."""
+    with open(file_path, 'rb', buffering=BUFFER_SIZE) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def extract_by_line_numbers(data_file, output_file, line_numbers):
+    """Write the requested 1-based lines, merging the sorted line numbers with the file. Returns the number of lines."""
+    targets = sorted(set(line_numbers))
+    n_written = 0
+    if not targets:
+        return 0
+    next_target = targets[0]
     for current_line_number, line in enumerate(data_file, 1):
-        if current_line_number in line_numbers_to_extract:
+        if current_line_number == next_target:
             output_file.write(line)
+            n_written += 1
+            if n_written == len(targets):
+                break
+            next_target = targets[n_written]
+    return n_written
+
+
+def extract_by_first_column(data_file, output_file, ids, separator=b','):
+    """Write the lines whose first column is in ids (a set of bytes). Returns the number of lines."""
+    n_written = 0
+    for line in data_file:
+        if line.split(separator, 1)[0].strip() in ids:
+            output_file.write(line)
+            n_written += 1
+    return n_written
+
+
+def extract_lines(centroids_file_path, data_file_path, output_file_path, key='line', separator=','):
+    """Extract the lines selected by the centroids file from the data file. Returns the number of written lines."""
+    keys = read_keys(centroids_file_path)
+    start = time.perf_counter()
+    with open(data_file_path, 'rb', buffering=BUFFER_SIZE) as data_file, \
+            open(output_file_path, 'wb', buffering=BUFFER_SIZE) as output_file:
+        if key == 'line':
+            n_written = extract_by_line_numbers(data_file, output_file, [int(k) for k in keys])
+        else:
+            n_written = extract_by_first_column(data_file, output_file, set(keys), separator=separator.encode())
+    print(f"Extracted {n_written} of {len(set(keys))} requested lines in {time.perf_counter() - start:.1f} s.")
+    return n_written
 
-print(f"Extraction complete. Check {output_file_path} for the extracted lines.")
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract lines of a data file by line number or by the ID in the first column')
+    parser.add_argument("--centroids", help="File with the line numbers or IDs to extract, one per line", type=str, required=True)
+    parser.add_argument("--data", help="Data file to extract the lines from", type=str, required=True)
+    parser.add_argument("--output", help="Output file", type=str, required=True)
+    parser.add_argument("--key", help="Match on the line number or on the first column", choices=['line', 'rowid'], default='line')
+    parser.add_argument("--separator", help="Column separator of the data file (--key rowid)", type=str, default=',')
+    args = parser.parse_args()
 
+    extract_lines(args.centroids, args.data, args.output, key=args.key, separator=args.separator)
+    print(f"Extraction complete. Check {args.output} for the extracted lines.")
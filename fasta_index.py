@@ -0,0 +1,149 @@
+"""
+Offset index for large FASTA files (e.g. all_human_paired_full_aa_seq_no_duplicates.fasta) for random access by sequence ID.
+The index is built once with one scan of the FASTA and saved next to it as <fasta>.fidx
+(tab-separated: ID, byte offset of the record, byte length of the record; the first line stores the size and mtime of
+the FASTA so a stale index is rebuilt automatically).
+FastaIndex memory-maps the FASTA and copies only the requested records, so extracting k IDs costs O(k) instead of a full
+rescan of the file.
+
+The ID of a record is the first word of its header (as in the mmseqs cluster TSVs and filter_sequences_by_ids of
+clustering_filter_sequences.py). The awk lookup of train_test_val_split.py compared the whole header line instead, so
+headers with a description (">id description") are now found by their ID. An ID that occurs twice in the FASTA is an
+error, the index is not written.
+
+Example:
+python fasta_index.py --fasta all_human_paired_full_aa_seq_no_duplicates.fasta --ids centroids_ids_cdr3_aa_100.txt \
+    --output all_human_paired_full_aa_seq_filtered.fasta
+"""
+import argparse
+import mmap
+import os
+import time
+
+INDEX_SUFFIX = '.fidx'
+
+
+def fasta_signature(fasta_path):
+    """Size and modification time of the FASTA, used to detect a stale index."""
+    stat = os.stat(fasta_path)
+    return f"{stat.st_size}\t{stat.st_mtime_ns}"
+
+
+def build_index(fasta_path, index_path=None):
+    """Scan the FASTA once and write the ID -> (offset, length) index. Returns the index path.
+    Raises ValueError (and writes no index) if an ID occurs more than once."""
+    index_path = index_path or fasta_path + INDEX_SUFFIX
+    start = time.perf_counter()
+    n_records = 0
+    seen_ids = set()
+    try:
+        with open(fasta_path, 'rb', buffering=16 * 1024 * 1024) as fasta, open(index_path, 'w') as index:
+            index.write(f"#{fasta_signature(fasta_path)}\n")
+            offset = 0
+            record_id, record_offset = None, 0
+            for line in fasta:
+                if line.startswith(b'>'):
+                    if record_id is not None:
+                        index.write(f"{record_id}\t{record_offset}\t{offset - record_offset}\n")
+                        n_records += 1
+                    record_id = line[1:].split(None, 1)[0].decode() if line[1:].strip() else ''
+                    if record_id in seen_ids:
+                        raise ValueError(f"ID '{record_id}' occurs more than once in {fasta_path} (byte offset {offset}), "
+                                         f"records are looked up by the first word of the header")
+                    seen_ids.add(record_id)
+                    record_offset = offset
+                offset += len(line)
+            if record_id is not None:
+                index.write(f"{record_id}\t{record_offset}\t{offset - record_offset}\n")
+                n_records += 1
+    except ValueError:
+        os.remove(index_path)
+        raise
+    print(f"Indexed {n_records} records of {fasta_path} in {time.perf_counter() - start:.1f} s ({index_path})")
+    return index_path
+
+
+class FastaIndex:
+    """Random access to the records of a FASTA file by ID through a memory map."""
+
+    def __init__(self, fasta_path, index_path=None):
+        self.fasta_path = fasta_path
+        index_path = index_path or fasta_path + INDEX_SUFFIX
+        if not self._is_current(index_path):
+            build_index(fasta_path, index_path)
+        self.offsets = {}
+        with open(index_path, 'r') as index:
+            next(index)
+            for line in index:
+                record_id, offset, length = line.rstrip('\n').split('\t')
+                if record_id in self.offsets:
+                    raise ValueError(f"ID '{record_id}' occurs more than once in {index_path}, rebuild the index")
+                self.offsets[record_id] = (int(offset), int(length))
+        self._file = open(fasta_path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(fasta_path) else b''
+
+    def _is_current(self, index_path):
+        if not os.path.exists(index_path):
+            return False
+        with open(index_path, 'r') as index:
+            return index.readline().rstrip('\n') == f"#{fasta_signature(self.fasta_path)}"
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, record_id):
+        return record_id in self.offsets
+
+    def get_record(self, record_id):
+        """Return the full record (header and sequence lines) as bytes."""
+        offset, length = self.offsets[record_id]
+        return self._mmap[offset:offset + length]
+
+    def get_sequence(self, record_id):
+        """Return the sequence of a record as str (multi-line sequences are joined)."""
+        return b''.join(self.get_record(record_id).split(b'\n')[1:]).decode().strip()
+
+    def write_records(self, record_ids, output_file):
+        """Write the records of record_ids (in FASTA order) to an open binary file. Returns the number of records."""
+        found = sorted(self.offsets[record_id] for record_id in set(record_ids) if record_id in self.offsets)
+        for offset, length in found:
+            output_file.write(self._mmap[offset:offset + length])
+        return len(found)
+
+    def close(self):
+        if not isinstance(self._mmap, bytes):
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_ids(file_path):
+    """Read IDs from a text file, one per line."""
+    with open(file_path, 'r') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build an offset index of a FASTA file and extract records by ID')
+    parser.add_argument("--fasta", help="FASTA file", type=str, required=True)
+    parser.add_argument("--index", help="Index file (default: <fasta>.fidx)", type=str)
+    parser.add_argument("--ids", help="File with the IDs to extract, one per line", type=str)
+    parser.add_argument("--output", help="Output FASTA file for the extracted records", type=str)
+    parser.add_argument("--rebuild", help="Rebuild the index even if it is up to date", action='store_true')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        build_index(args.fasta, args.index)
+    with FastaIndex(args.fasta, args.index) as fasta_index:
+        print(f"{len(fasta_index)} records in the index")
+        if args.ids and args.output:
+            ids = read_ids(args.ids)
+            start = time.perf_counter()
+            with open(args.output, 'wb') as output:
+                n_written = fasta_index.write_records(ids, output)
+            print(f"Wrote {n_written} of {len(ids)} requested records to {args.output} in {time.perf_counter() - start:.1f} s")
@@ -0,0 +1,129 @@
+"""
+Set-based version of filter_seqs_with_sqlite.sh: instead of one sqlite3 process (and one full table scan) per CDRH3 centroid,
+the centroid CDR3 sequences are loaded into a temporary table and all matching rows are extracted with a single join,
+which uses an index on the CDR3 column (created with --create_index if it does not exist yet).
+The result is streamed to the output file with the same '|' separated layout as the sqlite3 CLI.
+With --benchmark_sample N the old per-sequence loop is timed on N centroids and the estimated speedup is reported.
+
+Example:
+python filter_seqs_with_sqlite.py --db /ibmm_data2/oas_database/OAS_paired.db \
+    --centroids /ibmm_data2/oas_database/paired_lea_tmp/txt_files_oas_db/centroids_seqs_cdr3_aa_100.txt \
+    --output /ibmm_data2/oas_database/paired_lea_tmp/filtered_fasta_file/filtered_full_seq_cdrh3.txt --create_index
+"""
+import argparse
+import shutil
+import sqlite3
+import subprocess
+import time
+
+DEFAULT_COLUMNS = ['sequence_id_heavy_light', 'sequence_alignment_aa_heavy', 'sequence_alignment_aa_light',
+                   'sequence_alignment_aa_full', 'cdr3_aa_heavy']
+
+
+def read_centroids(file_path):
+    """Read the centroid CDR3 sequences, one per line (empty lines are ignored)."""
+    with open(file_path, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def ensure_index(conn, table_name, column):
+    """Create the index on table_name(column) if there is none yet. Returns the seconds spent."""
+    start = time.perf_counter()
+    with conn:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_{column} ON {table_name}({column});")
+    return time.perf_counter() - start
+
+
+def has_index(conn, table_name, column):
+    """Return True if an index on table_name starts with column."""
+    for index in conn.execute(f"PRAGMA index_list({table_name});").fetchall():
+        index_columns = conn.execute(f"PRAGMA index_info({index[1]});").fetchall()
+        if index_columns and index_columns[0][2] == column:
+            return True
+    return False
+
+
+def filter_by_centroids(conn, table_name, cdr3_column, columns, centroids, output_path, separator='|', fetch_size=50000,
+                        indexed=True):
+    """Join the centroid set against table_name and write all matching rows. Returns the number of rows.
+    If the CDR3 column is indexed, the centroids drive the join (CROSS JOIN fixes the loop order in SQLite),
+    otherwise SQLite scans the table once and probes the centroid table."""
+    conn.execute("DROP TABLE IF EXISTS temp.centroid_cdr3;")
+    conn.execute("CREATE TEMP TABLE centroid_cdr3 (cdr3 TEXT PRIMARY KEY);")
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO temp.centroid_cdr3 VALUES (?);", ((c,) for c in centroids))
+
+    selected = ", ".join(f"t.{column}" for column in columns)
+    join = "CROSS JOIN" if indexed else "JOIN"
+    query = f"SELECT {selected} FROM temp.centroid_cdr3 c {join} {table_name} t ON t.{cdr3_column} = c.cdr3;"
+    for plan in conn.execute(f"EXPLAIN QUERY PLAN {query}"):
+        print(f"  plan: {plan[-1]}")
+
+    cursor = conn.cursor()
+    cursor.arraysize = fetch_size
+    cursor.execute(query)
+    n_rows = 0
+    with open(output_path, 'w') as output_file:
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            output_file.write("".join(separator.join("" if v is None else str(v) for v in row) + "\n" for row in rows))
+            n_rows += len(rows)
+    return n_rows
+
+
+def time_per_sequence_loop(db_path, table_name, cdr3_column, columns, centroids):
+    """Time the per-sequence query loop of filter_seqs_with_sqlite.sh (one sqlite3 process per centroid if available)."""
+    selected = ", ".join(columns)
+    sqlite3_cli = shutil.which('sqlite3')
+    conn = None if sqlite3_cli else sqlite3.connect(db_path)
+    start = time.perf_counter()
+    for cdr3 in centroids:
+        if sqlite3_cli:
+            subprocess.run([sqlite3_cli, db_path, f"SELECT {selected} FROM {table_name} WHERE {cdr3_column} = '{cdr3}';"],
+                           check=True, stdout=subprocess.DEVNULL)
+        else:
+            conn.execute(f"SELECT {selected} FROM {table_name} WHERE {cdr3_column} = ?;", (cdr3,)).fetchall()
+    if conn is not None:
+        conn.close()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract all rows whose CDR3 is one of the centroid sequences with a single join')
+    parser.add_argument("--db", help="Path to the SQLite database", type=str, required=True)
+    parser.add_argument("--centroids", help="File with the centroid CDR3 sequences, one per line", type=str, required=True)
+    parser.add_argument("--output", help="Output file", type=str, required=True)
+    parser.add_argument("--table", help="Name of the table", type=str, default='all_human_paired')
+    parser.add_argument("--cdr3_column", help="CDR3 column to match on", type=str, default='cdr3_aa_heavy')
+    parser.add_argument("--columns", help="Columns to write", nargs='+', type=str, default=DEFAULT_COLUMNS)
+    parser.add_argument("--separator", help="Column separator of the output file", type=str, default='|')
+    parser.add_argument("--create_index", help="Create the index on the CDR3 column if it is missing", action='store_true')
+    parser.add_argument("--benchmark_sample", help="Time the old per-sequence loop on this many centroids", type=int, default=0)
+    args = parser.parse_args()
+
+    centroids = read_centroids(args.centroids)
+    print(f"Number of centroid CDR3 sequences: {len(centroids)}")
+
+    conn = sqlite3.connect(args.db)
+    if args.create_index:
+        print(f"Index on {args.table}({args.cdr3_column}) ready after {ensure_index(conn, args.table, args.cdr3_column):.1f} s")
+    indexed = has_index(conn, args.table, args.cdr3_column)
+    if not indexed:
+        print(f"WARNING: no index on {args.table}({args.cdr3_column}), use --create_index (or oas_db_indexes.py create) to avoid a full scan")
+
+    start = time.perf_counter()
+    n_rows = filter_by_centroids(conn, args.table, args.cdr3_column, args.columns, centroids, args.output,
+                                 separator=args.separator, indexed=indexed)
+    join_time = time.perf_counter() - start
+    conn.close()
+    print(f"Extraction complete: {n_rows} rows saved to {args.output} in {join_time:.1f} s.")
+
+    if args.benchmark_sample:
+        sample = centroids[:args.benchmark_sample]
+        loop_time = time_per_sequence_loop(args.db, args.table, args.cdr3_column, args.columns, sample)
+        estimated_loop_time = loop_time / max(len(sample), 1) * len(centroids)
+        print(f"Per-sequence loop: {loop_time:.1f} s for {len(sample)} centroids, "
+              f"estimated {estimated_loop_time:.1f} s for all {len(centroids)} centroids")
+        print(f"Estimated speedup of the join: {estimated_loop_time / max(join_time, 1e-9):.0f}x")
@@ -0,0 +1,209 @@
+"""
+Incremental train / validation / test assignment of newly ingested OAS sequences, instead of re-clustering and
+re-splitting everything when bulk_download.sh brings new studies.
+
+0. new IDs that are already listed in the existing <split_prefix>_ids_*.txt files keep their split and are skipped
+1. the new sequences are searched against the representatives of the existing clusters (mmseqs easy-search with the
+   identity and coverage of the clustering): a sequence with a hit joins the cluster of its best hit (highest score)
+   and inherits the split of that centroid, so no new sequence can leak into another split than its cluster. A hit on
+   a representative that is in none of the split files (mismatched --rep_fasta / --split_prefix) is an error
+2. the sequences without a hit are clustered among themselves (mmseqs easy-linclust, same thresholds)
+3. only these new clusters are allocated (split_allocator.py, binpack), with the targets computed on the existing plus
+   the new sequences, so the overall fractions stay on target. Existing assignments never change.
+
+Outputs (for the new sequences only, to be appended to the existing files):
+<output_prefix>_ids_{train,val,test}.txt   new IDs per split
+<output_prefix>_{train,val,test}.txt       their FASTA records
+<output_prefix>_clu.tsv                    centroid ID / member ID of the joined sequences and of the new clusters
+<output_prefix>_clu_rep.fasta              representatives of the new clusters
+<output_prefix>_incremental_split.json     counts and realized fractions
+For the next increment, pass the old and the new representatives and split prefixes together.
+
+Example:
+python incremental_split.py --new_fasta new_studies_heavy.fasta \
+    --rep_fasta full_clustering/filtered_heavy_seqs_from_cdrh3_no_duplicates_50_clu_rep.fasta \
+    --split_prefix data_from_oas/heavy --output_prefix data_from_oas/heavy_update_2024_06 --min_seq_id 0.5
+"""
+import argparse
+import json
+import os
+import shlex
+import shutil
+import tempfile
+
+from cluster_table import ClusterTable
+from mmseqs_linclust_sweep import run_timed
+from partition_fasta import iter_fasta, partition_records
+from split_allocator import SPLITS, allocate_clusters
+
+
+def read_existing_splits(split_prefixes, centroid_ids, new_ids=()):
+    """Split of every centroid, number of sequences per split and the new_ids that are already assigned
+    from the <prefix>_ids_<split>.txt files."""
+    centroid_split = {}
+    counts = [0] * len(SPLITS)
+    already_assigned = set()
+    for prefix in split_prefixes:
+        for split, name in enumerate(SPLITS):
+            with open(f"{prefix}_ids_{name}.txt", 'r') as f:
+                for line in f:
+                    record_id = line.strip()
+                    if not record_id:
+                        continue
+                    counts[split] += 1
+                    if record_id in centroid_ids:
+                        centroid_split[record_id] = split
+                    if record_id in new_ids:
+                        already_assigned.add(record_id)
+    return centroid_split, counts, already_assigned
+
+
+def concatenate_files(paths, output_path):
+    with open(output_path, 'wb') as output_file:
+        for path in paths:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, output_file, 16 * 1024 * 1024)
+
+
+def read_best_hits(m8_path):
+    """Best target of every query of an mmseqs result (query,target,... sorted by score per query, the first line
+    of a query is its best hit)."""
+    best_hits = {}
+    with open(m8_path, 'r') as f:
+        for line in f:
+            query, target = line.split('\t', 2)[:2]
+            best_hits.setdefault(query, target)
+    return best_hits
+
+
+def incremental_split(new_fasta, rep_fastas, split_prefixes, output_prefix, fractions=(0.8, 0.1, 0.1), min_seq_id=0.5,
+                      coverage=0.8, seed=42, threads=None, search_args='', tmp_dir=None):
+    """Assign the sequences of new_fasta to the existing splits or to new clusters. Returns the summary dict."""
+    os.makedirs(os.path.dirname(os.path.abspath(output_prefix)), exist_ok=True)
+    centroid_ids = {record_id for rep_fasta in rep_fastas for record_id, _ in iter_fasta(rep_fasta)}
+    new_ids = {record_id for record_id, _ in iter_fasta(new_fasta)}
+    centroid_split, existing_counts, already_assigned = read_existing_splits(split_prefixes, centroid_ids, new_ids)
+    del new_ids
+    if already_assigned:
+        print(f"Skipping {len(already_assigned)} new sequences that are already in the existing splits")
+    missing_centroids = centroid_ids.difference(centroid_split)
+    thread_args = ['--threads', str(threads)] if threads else []
+    threshold_args = ['--min-seq-id', str(min_seq_id), '-c', str(coverage)]
+    steps = []
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as work_dir:
+        if len(rep_fastas) == 1:
+            rep_fasta = rep_fastas[0]
+        else:
+            rep_fasta = os.path.join(work_dir, 'representatives.fasta')
+            concatenate_files(rep_fastas, rep_fasta)
+
+        # 1. search the new sequences against the existing representatives
+        hits_path = os.path.join(work_dir, 'hits.m8')
+        steps.append(run_timed(['mmseqs', 'easy-search', new_fasta, rep_fasta, hits_path, os.path.join(work_dir, 'search_tmp'),
+                                '--format-output', 'query,target,pident'] + threshold_args
+                               + shlex.split(search_args) + thread_args))
+        best_hits = read_best_hits(hits_path)
+        unknown_targets = {target for target in best_hits.values() if target in missing_centroids}
+        if unknown_targets:
+            raise ValueError(f"{len(unknown_targets)} representatives hit by new sequences are in none of the split files "
+                             f"of {', '.join(split_prefixes)} (e.g. {', '.join(sorted(unknown_targets)[:5])}), "
+                             f"do --rep_fasta and --split_prefix belong together?")
+
+        id_to_split = {}
+        cluster_rows = []
+        unmatched_path = os.path.join(work_dir, 'unmatched.fasta')
+        n_new = n_unmatched = 0
+        joined_counts = [0] * len(SPLITS)
+        with open(unmatched_path, 'w') as unmatched:
+            for record_id, sequence in iter_fasta(new_fasta):
+                if record_id in already_assigned:
+                    continue
+                n_new += 1
+                target = best_hits.get(record_id)
+                if target is not None:
+                    split = centroid_split[target]
+                    id_to_split[record_id] = SPLITS[split]
+                    joined_counts[split] += 1
+                    cluster_rows.append(f"{target}\t{record_id}\n")
+                else:
+                    unmatched.write(f">{record_id}\n{sequence}\n")
+                    n_unmatched += 1
+
+        # 2. cluster the sequences without a hit
+        new_clusters = None
+        if n_unmatched:
+            linclust_prefix = os.path.join(work_dir, 'new')
+            steps.append(run_timed(['mmseqs', 'easy-linclust', unmatched_path, linclust_prefix,
+                                    os.path.join(work_dir, 'linclust_tmp')] + threshold_args + thread_args))
+            new_clusters = ClusterTable.from_tsv(f"{linclust_prefix}_cluster.tsv")
+            shutil.copyfile(f"{linclust_prefix}_rep_seq.fasta", f"{output_prefix}_clu_rep.fasta")
+        else:
+            open(f"{output_prefix}_clu_rep.fasta", 'w').close()
+
+    # 3. allocate only the new clusters, on top of the existing and joined sequences
+    new_cluster_counts = [0] * len(SPLITS)
+    if new_clusters is not None:
+        initial_counts = [existing + joined for existing, joined in zip(existing_counts, joined_counts)]
+        assignment = allocate_clusters(new_clusters.sizes().tolist(), fractions, seed=seed, initial_counts=initial_counts)
+        centroids = new_clusters.id_strings(new_clusters.centroids)
+        for cluster, split in enumerate(assignment):
+            members = new_clusters.id_strings(new_clusters.member_codes(cluster))
+            new_cluster_counts[split] += len(members)
+            for member in members:
+                id_to_split[member] = SPLITS[split]
+                cluster_rows.append(f"{centroids[cluster]}\t{member}\n")
+
+    with open(f"{output_prefix}_clu.tsv", 'w') as f:
+        f.writelines(cluster_rows)
+    id_files = {name: open(f"{output_prefix}_ids_{name}.txt", 'w') for name in SPLITS}
+    for record_id, name in id_to_split.items():
+        id_files[name].write(f"{record_id}\n")
+    for f in id_files.values():
+        f.close()
+    partition_records(new_fasta, id_to_split, {name: f"{output_prefix}_{name}.txt" for name in SPLITS})
+
+    totals = [a + b + c for a, b, c in zip(existing_counts, joined_counts, new_cluster_counts)]
+    summary = {
+        'new_fasta': new_fasta,
+        'n_new_sequences': n_new,
+        'n_skipped_already_assigned': len(already_assigned),
+        'n_joined_existing_clusters': sum(joined_counts),
+        'n_new_clusters': new_clusters.n_clusters if new_clusters is not None else 0,
+        'n_sequences_in_new_clusters': sum(new_cluster_counts),
+        'splits': {name: {'existing': existing_counts[i], 'joined': joined_counts[i], 'new_clusters': new_cluster_counts[i],
+                          'realized': round(totals[i] / max(sum(totals), 1), 4), 'target': fractions[i]}
+                   for i, name in enumerate(SPLITS)},
+        'steps': steps,
+    }
+    with open(f"{output_prefix}_incremental_split.json", 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"{n_new} new sequences: {sum(joined_counts)} joined existing clusters, {sum(new_cluster_counts)} in "
+          f"{summary['n_new_clusters']} new clusters")
+    for name, split_summary in summary['splits'].items():
+        print(f"  {name}: +{split_summary['joined'] + split_summary['new_clusters']} "
+              f"(realized {split_summary['realized']:.4f}, target {split_summary['target']})")
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Assign new sequences to the existing cluster splits without re-clustering everything')
+    parser.add_argument("--new_fasta", help="FASTA with the newly ingested sequences", type=str, required=True)
+    parser.add_argument("--rep_fasta", help="Representatives of the existing clusters (several for earlier increments)", nargs='+', type=str, required=True)
+    parser.add_argument("--split_prefix", help="Prefix of the existing <prefix>_ids_{train,val,test}.txt files", nargs='+', type=str, required=True)
+    parser.add_argument("--output_prefix", help="Prefix of the output files", type=str, required=True)
+    parser.add_argument("--train_percentage", help="Fraction of the sequences for the training set", type=float, default=0.8)
+    parser.add_argument("--val_percentage", help="Fraction of the sequences for the validation set", type=float, default=0.1)
+    parser.add_argument("--test_percentage", help="Fraction of the sequences for the test set", type=float, default=0.1)
+    parser.add_argument("--min_seq_id", help="Minimum identity to join a cluster (the --min-seq-id of the clustering)", type=float, default=0.5)
+    parser.add_argument("--coverage", help="Minimum coverage (mmseqs -c)", type=float, default=0.8)
+    parser.add_argument("--seed", help="Seed of the allocation of the new clusters", type=int, default=42)
+    parser.add_argument("--threads", help="--threads passed to mmseqs", type=int)
+    parser.add_argument("--search_args", help="Additional arguments for mmseqs easy-search", type=str, default='')
+    parser.add_argument("--tmp_dir", help="Directory for the mmseqs intermediate files", type=str)
+    args = parser.parse_args()
+
+    incremental_split(args.new_fasta, args.rep_fasta, args.split_prefix, args.output_prefix,
+                      fractions=(args.train_percentage, args.val_percentage, args.test_percentage),
+                      min_seq_id=args.min_seq_id, coverage=args.coverage, seed=args.seed, threads=args.threads,
+                      search_args=args.search_args, tmp_dir=args.tmp_dir)
@@ -0,0 +1,146 @@
+"""
+One-pass ingestion of OAS *_Paired_All.csv.gz downloads (see bulk_download.sh) into a table of the OAS SQLite database.
+Each .gz file is streamed (nothing is decompressed to disk), the OAS metadata line and the header are skipped,
+chunks of raw lines are parsed with the csv module in a process pool and a single writer (the main process)
+bulk-inserts the parsed rows with executemany, one transaction per chunk.
+This replaces gunzip + remove_header_from_csv.py + add_csv_to_database_table.py.
+A summary with the number of rows and the timings is printed per file.
+Loads are recorded in the manifest table of oas_db_loader.py: files that were already ingested are skipped
+and an interrupted file resumes after its last committed chunk.
+
+Example:
+python ingest_oas_csv_gz.py --db /ibmm_data/oas_database/OAS.db --table healthy_paired --workers 8 --fast_pragmas *_Paired_All.csv.gz
+"""
+import argparse
+import csv
+import gzip
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from oas_db_loader import (MANIFEST_TABLE, file_checksum, finish_manifest_entry, get_number_of_columns,
+                           insert_batch, make_insert_query, restore_pragmas, set_fast_pragmas, start_manifest_entry)
+
+
+def read_header(gz_file):
+    """Skip the OAS metadata line and return the parsed header of an open OAS csv file."""
+    gz_file.readline()
+    return next(csv.reader([gz_file.readline()]))
+
+
+def iter_line_chunks(gz_file, chunk_size):
+    """Yield lists of about chunk_size raw lines, never splitting a quoted field that spans several lines."""
+    chunk = []
+    open_quotes = False
+    for line in gz_file:
+        chunk.append(line)
+        # an odd number of quotes opens (or closes) a field that continues on the next line
+        if line.count('"') % 2:
+            open_quotes = not open_quotes
+        if len(chunk) >= chunk_size and not open_quotes:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_chunk(lines):
+    """Parse a list of raw csv lines into rows (runs in the worker processes)."""
+    return list(csv.reader(lines))
+
+
+def ingest_file(conn, executor, table_name, number_of_columns, gz_path, chunk_size=20000, max_pending=16,
+                use_manifest=True):
+    """Stream one .gz file into the database. Returns (number of rows, elapsed seconds, seconds spent inserting)."""
+    start = time.perf_counter()
+    insert_query = make_insert_query(table_name, number_of_columns)
+    n_rows = 0
+    insert_time = 0.0
+    pending = deque()
+    checksum, skip_rows = None, 0
+    if use_manifest:
+        checksum = file_checksum(gz_path)
+        status, skip_rows = start_manifest_entry(conn, table_name, gz_path, checksum)
+        if status == 'done':
+            print(f"{gz_path} is already loaded into {table_name} (see {MANIFEST_TABLE}), skipping.")
+            return 0, time.perf_counter() - start, 0.0
+        if skip_rows:
+            print(f"Resuming {gz_path} after {skip_rows} committed rows")
+
+    def write_next():
+        nonlocal n_rows, insert_time, skip_rows
+        rows = pending.popleft().result()
+        # rows committed by an interrupted earlier run
+        if skip_rows:
+            n_skipped = min(skip_rows, len(rows))
+            rows = rows[n_skipped:]
+            skip_rows -= n_skipped
+            if not rows:
+                return
+        t0 = time.perf_counter()
+        insert_batch(conn, table_name, insert_query, rows, checksum=checksum)
+        insert_time += time.perf_counter() - t0
+        n_rows += len(rows)
+
+    with gzip.open(gz_path, mode='rt', newline='') as gz_file:
+        header = read_header(gz_file)
+        if len(header) != number_of_columns:
+            raise ValueError(f"{gz_path} has {len(header)} columns, the table has {number_of_columns}.")
+        for chunk in iter_line_chunks(gz_file, chunk_size):
+            pending.append(executor.submit(parse_chunk, chunk))
+            # keep a bounded number of chunks in flight, rows are written in file order
+            if len(pending) >= max_pending:
+                write_next()
+        while pending:
+            write_next()
+    if use_manifest:
+        finish_manifest_entry(conn, table_name, checksum)
+    return n_rows, time.perf_counter() - start, insert_time
+
+
+def ingest_files(db_path, table_name, gz_paths, workers=4, chunk_size=20000, fast_pragmas=False, use_manifest=True):
+    """Ingest several OAS .csv.gz files and print a per-file summary."""
+    conn = sqlite3.connect(db_path)
+    old_settings = set_fast_pragmas(conn) if fast_pragmas else None
+    summary = []
+    try:
+        number_of_columns = get_number_of_columns(conn, table_name)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for gz_path in gz_paths:
+                try:
+                    n_rows, elapsed, insert_time = ingest_file(conn, executor, table_name, number_of_columns, gz_path,
+                                                               chunk_size=chunk_size, max_pending=4 * workers,
+                                                               use_manifest=use_manifest)
+                except (ValueError, sqlite3.Error, OSError) as e:
+                    print(f"{gz_path}: FAILED ({e})")
+                    summary.append((gz_path, 0, 0.0, 0.0))
+                    continue
+                print(f"{gz_path}: {n_rows} rows in {elapsed:.1f} s "
+                      f"({n_rows / max(elapsed, 1e-9):.0f} rows/s, {insert_time:.1f} s inserting)")
+                summary.append((gz_path, n_rows, elapsed, insert_time))
+    finally:
+        if old_settings is not None:
+            restore_pragmas(conn, old_settings)
+        conn.close()
+
+    total_rows = sum(s[1] for s in summary)
+    total_time = sum(s[2] for s in summary)
+    print(f"Total: {len(summary)} files, {total_rows} rows in {total_time:.1f} s "
+          f"({total_rows / max(total_time, 1e-9):.0f} rows/s)")
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stream OAS csv.gz files into a table of the OAS SQLite database')
+    parser.add_argument("gz_files", help="OAS *_Paired_All.csv.gz files", nargs='+', type=str)
+    parser.add_argument("--db", help="Path to the SQLite database", type=str, default='/ibmm_data/oas_database/OAS.db')
+    parser.add_argument("--table", help="Name of the table to insert into", type=str, default='healthy_paired')
+    parser.add_argument("--workers", help="Number of parser processes", type=int, default=4)
+    parser.add_argument("--chunk_size", help="Number of lines per parsed chunk / transaction", type=int, default=20000)
+    parser.add_argument("--fast_pragmas", help="Use journal_mode=WAL and synchronous=OFF during the load", action='store_true')
+    parser.add_argument("--no_manifest", help="Do not record the loads in the manifest table", action='store_true')
+    args = parser.parse_args()
+
+    ingest_files(args.db, args.table, args.gz_files, workers=args.workers, chunk_size=args.chunk_size,
+                 fast_pragmas=args.fast_pragmas, use_manifest=not args.no_manifest)
@@ -0,0 +1,323 @@
+"""
+Audit train / validation / test files for sequences shared across the splits (the classification datasets of
+paired_model/IgBERT/create_and_synthesize_dataset_for_classification.py assume that heavy and light chains are not
+shared, nothing checked it so far).
+
+The first file is the reference (train). For every chain (heavy and light of heavy[SEP]light files or of CSVs with
+heavy,light columns, or the sequence of FASTA / one-sequence-per-line files) its unique sequences are indexed with
+- a hash map for exact matches (for pairs also heavy+light together)
+- MinHash signatures of the k-mer sets, banded into an LSH index (one sorted hash array per band). Two sequences become
+  candidates if all rows of one band agree. With 32 permutations in 16 bands of 2 rows the probability is
+  1 - (1 - J^2)^16 for a k-mer Jaccard similarity J: 0.64 at J = 0.25, 0.94 at J = 0.4 and 0.99 at J = 0.5. With k=5,
+  90% identity (scattered mismatches) gives J ~0.42, so such pairs are found with probability ~0.95, closer pairs almost
+  surely. The candidates are verified with the sequence identity (positions for equal lengths, matching blocks of
+  difflib otherwise).
+The signatures are computed in batches with numpy, the other files are queried in parallel worker processes (fork, the
+index is shared). The report gives the exact and the high-identity overlaps per file and chain, the overlapping pairs
+are written to a TSV.
+
+Example:
+python leakage_audit.py paired_full_seqs_sep_train_no_ids.txt paired_full_seqs_sep_val_no_ids.txt \
+    paired_full_seqs_sep_test_no_ids.txt --workers 16 --min_identity 0.9 --output leakage_report.json --pairs leakage_pairs.tsv
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from partition_fasta import iter_fasta
+
+# signature value of sequences without k-mers, the hash values are < 2 ** 32
+EMPTY = np.uint64(2 ** 32)
+BATCH_SIZE = 2000
+
+# the index of the reference file, set before the worker processes are forked
+_INDEX = {}
+# chains read from each file format
+FORMAT_CHAINS = {'sep': ('heavy', 'light'), 'csv': ('heavy', 'light'), 'fasta': ('sequence',), 'seq': ('sequence',)}
+
+
+def detect_format(path):
+    """csv for .csv files, fasta if the file starts with '>', sep if the first line contains [SEP], seq otherwise."""
+    if path.endswith('.csv'):
+        return 'csv'
+    with open(path, 'r') as f:
+        first_line = f.readline()
+    if first_line.startswith('>'):
+        return 'fasta'
+    return 'sep' if '[SEP]' in first_line else 'seq'
+
+
+def read_chains(path, input_format='auto'):
+    """Read the sequences of a split file. Returns {chain: [sequence, ...]} in line order, spaces removed.
+    Raises ValueError for a CSV without heavy,light columns and for heavy[SEP]light files with lines without [SEP]."""
+    if input_format == 'auto':
+        input_format = detect_format(path)
+    if input_format == 'fasta':
+        return {'sequence': [sequence for _, sequence in iter_fasta(path)]}
+    if input_format == 'csv':
+        heavy, light = [], []
+        with open(path, 'r', newline='') as f:
+            reader = csv.DictReader(f)
+            missing = [column for column in ('heavy', 'light') if column not in (reader.fieldnames or [])]
+            if missing:
+                raise ValueError(f"{path} has no {','.join(missing)} column (columns: {','.join(reader.fieldnames or [])})")
+            for row in reader:
+                heavy.append(row['heavy'].replace(' ', ''))
+                light.append(row['light'].replace(' ', ''))
+        return {'heavy': heavy, 'light': light}
+    with open(path, 'r', buffering=16 * 1024 * 1024) as f:
+        numbered_lines = [(number, line.strip().replace(' ', '')) for number, line in enumerate(f, 1) if line.strip()]
+    if input_format == 'seq':
+        return {'sequence': [line for _, line in numbered_lines]}
+    no_sep = [number for number, line in numbered_lines if '[SEP]' not in line]
+    if no_sep:
+        raise ValueError(f"{path}: no [SEP] in line {', '.join(map(str, no_sep[:10]))}"
+                         f"{f' and {len(no_sep) - 10} more lines' if len(no_sep) > 10 else ''}, expected heavy[SEP]light")
+    pairs = [line.split('[SEP]', 1) for _, line in numbered_lines]
+    return {'heavy': [pair[0] for pair in pairs], 'light': [pair[1] for pair in pairs]}
+
+
+def check_formats(reference_path, query_paths, input_format='auto'):
+    """Raise ValueError if a query file does not have the chains of the reference file (e.g. a FASTA query against a
+    heavy[SEP]light reference)."""
+    reference_format = detect_format(reference_path) if input_format == 'auto' else input_format
+    for query_path in query_paths:
+        query_format = detect_format(query_path) if input_format == 'auto' else input_format
+        if FORMAT_CHAINS[query_format] != FORMAT_CHAINS[reference_format]:
+            raise ValueError(f"{query_path} is a {query_format} file ({', '.join(FORMAT_CHAINS[query_format])}), "
+                             f"the reference {reference_path} is a {reference_format} file "
+                             f"({', '.join(FORMAT_CHAINS[reference_format])}): the chains cannot be compared")
+
+
+def make_permutations(num_perm, seed=1):
+    """Coefficients of the multiply-shift hash functions ((a * x + b) mod 2 ** 64) >> 32, a odd."""
+    rng = np.random.RandomState(seed)
+    a = rng.randint(0, 2 ** 63 - 1, size=num_perm, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+    b = rng.randint(0, 2 ** 63 - 1, size=num_perm, dtype=np.int64).astype(np.uint64)
+    return a, b
+
+
+def minhash_signatures(sequences, k, a, b):
+    """MinHash signatures (n, num_perm) of the k-mer sets of a batch of sequences. Sequences shorter than k get the
+    maximum value in every row, which never matches a real signature."""
+    signatures = np.full((len(sequences), len(a)), EMPTY, dtype=np.uint64)
+    lengths = np.fromiter((len(sequence) for sequence in sequences), dtype=np.int64, count=len(sequences))
+    codes = np.frombuffer(''.join(sequences).encode(), dtype=np.uint8).astype(np.uint64) & np.uint64(31)
+    n_positions = len(codes) - k + 1
+    if n_positions <= 0:
+        return signatures
+    # exact k-mer code, 5 bits per residue (k <= 12)
+    kmers = np.zeros(n_positions, dtype=np.uint64)
+    for j in range(k):
+        kmers |= codes[j:j + n_positions] << np.uint64(5 * j)
+    # keep the k-mers that lie within one sequence
+    sequence_of_position = np.repeat(np.arange(len(sequences)), lengths)[:n_positions]
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    valid = np.arange(n_positions) - starts[sequence_of_position] <= lengths[sequence_of_position] - k
+    kmers = kmers[valid]
+    sequence_of_kmer = sequence_of_position[valid]
+    if not len(kmers):
+        return signatures
+    # in place, the (num_perm, n_kmers) array is the largest one
+    hashed = a[:, None] * kmers[None, :]
+    hashed += b[:, None]
+    hashed >>= np.uint64(32)
+    first = np.flatnonzero(np.concatenate([[True], sequence_of_kmer[1:] != sequence_of_kmer[:-1]]))
+    signatures[sequence_of_kmer[first]] = np.minimum.reduceat(hashed, first, axis=1).T
+    return signatures
+
+
+def band_hashes(signatures, bands):
+    """One uint64 hash per band of the signature rows."""
+    rows = signatures.shape[1] // bands
+    hashes = np.zeros((len(signatures), bands), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for band in range(bands):
+            for row in range(band * rows, (band + 1) * rows):
+                hashes[:, band] = hashes[:, band] * np.uint64(0x100000001B3) ^ signatures[:, row]
+    return hashes
+
+
+def signature_batch(sequences, k, num_perm, bands, seed):
+    a, b = make_permutations(num_perm, seed)
+    return band_hashes(minhash_signatures(sequences, k, a, b), bands)
+
+
+def identity(query, target):
+    """Sequence identity of two byte strings: matching positions for equal lengths, otherwise the matching blocks of
+    difflib, relative to the longer sequence."""
+    if len(query) == len(target):
+        return np.count_nonzero(np.frombuffer(query, dtype=np.uint8) == np.frombuffer(target, dtype=np.uint8)) / len(query)
+    matcher = SequenceMatcher(None, query, target, autojunk=False)
+    return sum(block.size for block in matcher.get_matching_blocks()) / max(len(query), len(target))
+
+
+def build_index(sequences, executor, k, num_perm, bands, seed):
+    """Exact map and LSH index of the unique reference sequences."""
+    first_line = {}
+    for line, sequence in enumerate(sequences):
+        first_line.setdefault(sequence, line)
+    unique = list(first_line)
+    batches = [unique[i:i + BATCH_SIZE] for i in range(0, len(unique), BATCH_SIZE)]
+    hashes = list(executor.map(signature_batch, batches, *([value] * len(batches) for value in (k, num_perm, bands, seed))))
+    hashes = np.concatenate(hashes) if hashes else np.zeros((0, bands), dtype=np.uint64)
+    order = np.argsort(hashes, axis=0, kind='stable')
+    return {
+        'first_line': first_line,
+        'unique': [sequence.encode() for sequence in unique],
+        'sorted_hashes': np.take_along_axis(hashes, order, axis=0).T.copy(),
+        'sorted_ids': order.T.copy(),
+    }
+
+
+def query_batch(chain, line_offset, sequences, k, num_perm, bands, seed, min_identity, max_bucket, max_candidates):
+    """Exact and high-identity matches of a batch of query sequences against the reference index of chain.
+    Returns [(query record, reference record, identity, 'exact' or 'near')]."""
+    index = _INDEX[chain]
+    first_line, unique = index['first_line'], index['unique']
+    matches = []
+    near_queries = []
+    for i, sequence in enumerate(sequences):
+        if sequence in first_line:
+            matches.append((line_offset + i, first_line[sequence], 1.0, 'exact'))
+        else:
+            near_queries.append(i)
+    if not near_queries or not unique:
+        return matches
+
+    hashes = signature_batch([sequences[i] for i in near_queries], k, num_perm, bands, seed)
+    query_ids, target_ids = [], []
+    for band in range(bands):
+        left = np.searchsorted(index['sorted_hashes'][band], hashes[:, band], side='left')
+        right = np.minimum(np.searchsorted(index['sorted_hashes'][band], hashes[:, band], side='right'), left + max_bucket)
+        counts = right - left
+        if not counts.sum():
+            continue
+        query_ids.append(np.repeat(np.arange(len(near_queries)), counts))
+        # positions left[q] .. right[q] - 1 of every query, flattened
+        positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(left, counts)
+        target_ids.append(index['sorted_ids'][band][positions])
+    if not query_ids:
+        return matches
+
+    # candidates ranked by the number of bands they share with the query
+    pair_keys, n_bands = np.unique(np.concatenate(query_ids).astype(np.int64) * len(unique) + np.concatenate(target_ids),
+                                   return_counts=True)
+    order = np.lexsort((-n_bands, pair_keys // len(unique)))
+    best = {}
+    n_checked = {}
+    for key in pair_keys[order].tolist():
+        query, target = divmod(key, len(unique))
+        if n_checked.get(query, 0) >= max_candidates:
+            continue
+        n_checked[query] = n_checked.get(query, 0) + 1
+        query_sequence, target_sequence = sequences[near_queries[query]].encode(), unique[target]
+        if min(len(query_sequence), len(target_sequence)) < min_identity * max(len(query_sequence), len(target_sequence)):
+            continue
+        value = identity(query_sequence, target_sequence)
+        if value >= min_identity and value > best.get(query, (0.0, None))[0]:
+            best[query] = (value, target)
+    for query, (value, target) in sorted(best.items()):
+        matches.append((line_offset + near_queries[query], first_line[unique[target].decode()], round(value, 4), 'near'))
+    return matches
+
+
+def audit(reference_path, query_paths, input_format='auto', k=5, num_perm=32, bands=16, seed=1, min_identity=0.9,
+          max_bucket=1000, max_candidates=10, workers=None, pairs_path=None):
+    """Audit the query files against the reference file. Returns the report dict."""
+    if num_perm % bands:
+        raise ValueError("num_perm must be a multiple of bands.")
+    if not 1 <= k <= 12:
+        raise ValueError("k must be between 1 and 12.")
+    check_formats(reference_path, query_paths, input_format)
+    start = time.perf_counter()
+    workers = workers or os.cpu_count()
+    context = multiprocessing.get_context('fork')
+    reference = read_chains(reference_path, input_format)
+    chains = list(reference)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        for chain in chains:
+            _INDEX[chain] = build_index(reference[chain], executor, k, num_perm, bands, seed)
+            print(f"Indexed {len(_INDEX[chain]['unique'])} unique {chain} sequences of {reference_path} "
+                  f"({time.perf_counter() - start:.1f} s)", flush=True)
+    reference_pairs = set(zip(reference['heavy'], reference['light'])) if 'heavy' in reference else None
+
+    report = {'reference': reference_path, 'parameters': {'k': k, 'num_perm': num_perm, 'bands': bands,
+                                                          'min_identity': min_identity}, 'files': {}}
+    pairs_file = open(pairs_path, 'w') if pairs_path else None
+    if pairs_file is not None:
+        pairs_file.write("file\tchain\trecord\treference_record\tidentity\ttype\n")
+    # the pool is forked after the index is built, so the workers share it
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        for query_path in query_paths:
+            query = read_chains(query_path, input_format)
+            file_report = {}
+            for chain in chains:
+                sequences = query[chain]
+                futures = [executor.submit(query_batch, chain, i, sequences[i:i + BATCH_SIZE], k, num_perm, bands, seed,
+                                           min_identity, max_bucket, max_candidates)
+                           for i in range(0, len(sequences), BATCH_SIZE)]
+                n_exact = n_near = 0
+                for future in futures:
+                    for line, reference_line, value, match_type in future.result():
+                        if match_type == 'exact':
+                            n_exact += 1
+                        else:
+                            n_near += 1
+                        if pairs_file is not None:
+                            pairs_file.write(f"{query_path}\t{chain}\t{line}\t{reference_line}\t{value}\t{match_type}\n")
+                file_report[chain] = {
+                    'sequences': len(sequences),
+                    'exact_overlaps': n_exact,
+                    f'near_overlaps_identity_{min_identity}': n_near,
+                    'fraction_leaked': round((n_exact + n_near) / max(len(sequences), 1), 6),
+                }
+            if reference_pairs is not None and 'heavy' in query:
+                file_report['pair'] = {'sequences': len(query['heavy']),
+                                       'exact_overlaps': sum(pair in reference_pairs for pair in zip(query['heavy'], query['light']))}
+            report['files'][query_path] = file_report
+            print(f"{query_path}: " + "; ".join(f"{chain} {values['exact_overlaps']} exact"
+                                                + (f", {values[f'near_overlaps_identity_{min_identity}']} >= {min_identity} identity"
+                                                   if chain != 'pair' else '')
+                                                + f" of {values['sequences']}"
+                                                for chain, values in file_report.items()), flush=True)
+    if pairs_file is not None:
+        pairs_file.close()
+    _INDEX.clear()
+    report['time_s'] = round(time.perf_counter() - start, 1)
+    print(f"Audit finished in {report['time_s']} s")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find exact and near-duplicate sequences shared between train and val/test files')
+    parser.add_argument("reference", help="Training file (heavy[SEP]light lines, heavy,light CSV, FASTA or one sequence per line)", type=str)
+    parser.add_argument("queries", help="Validation / test files", nargs='+', type=str)
+    parser.add_argument("--format", help="Format of the files (default: detected per file)", choices=['auto', 'sep', 'csv', 'fasta', 'seq'], default='auto')
+    parser.add_argument("--kmer", help="k-mer length", type=int, default=5)
+    parser.add_argument("--num_perm", help="Number of MinHash permutations", type=int, default=32)
+    parser.add_argument("--bands", help="Number of LSH bands (num_perm / bands rows per band)", type=int, default=16)
+    parser.add_argument("--min_identity", help="Identity from which a pair is reported as near-duplicate", type=float, default=0.9)
+    parser.add_argument("--max_candidates", help="Candidates verified per query sequence (most shared bands first)", type=int, default=10)
+    parser.add_argument("--workers", help="Number of worker processes (default: all CPUs)", type=int)
+    parser.add_argument("--output", help="JSON report", type=str)
+    parser.add_argument("--pairs", help="TSV with every overlapping pair (0-based record numbers)", type=str)
+    args = parser.parse_args()
+
+    try:
+        report = audit(args.reference, args.queries, input_format=args.format, k=args.kmer, num_perm=args.num_perm,
+                       bands=args.bands, min_identity=args.min_identity, max_candidates=args.max_candidates,
+                       workers=args.workers, pairs_path=args.pairs)
+    except ValueError as error:
+        raise SystemExit(f"error: {error}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -2,6 +2,12 @@ from utils import *
 #from model import *
 from model import *
 
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from tokenization import LengthBucketBatchSampler
+from pretokenized_dataset import PretokenizedCollator, PretokenizedDataset, load_or_compile
+
 
 def training_setup(train_data,lr,n_epochs,batch_size,max_len):
     ## 1. Create the checkpoint and best model directories
@@ -57,65 +63,41 @@ def data_prep(train_data,val_data,MAX_LEN,batch_size,num_workers):
     """The dataset is divided in 3 files, already splitted into training, validation, test set (created by using .py)"""
     logging.info('----- DATASET STRUCTURE ----- ')
 
-    # Load train data
-    train_data = pd.read_csv(train_data,header=None)
-    #shuffle inserted in the domains training
-    train_data=train_data.sample(frac=1, random_state=42).reset_index()
-    # Display 5 samples from the test data
-    print(train_data.sample(5))
-    logging.info('TRAIN SET distribution:{}'.format(Counter(train_data[2])))
-
-    # Load val data
-    val_data = pd.read_csv(val_data,header=None)
-    val_data=val_data.sample(frac=1, random_state=42).reset_index()
-    # Display 5 samples from the test data
-    print(val_data.sample(5))
-    logging.info('VAL SET distribution: {}'.format(Counter(val_data[2])))
-
-
-    ## 4. Tokenization and DataPreparation
+    # The sequences (column 1) and labels (column 2) are tokenized once with the Rostlab/prot_bert vocabulary into
+    # memory-mapped stores next to the CSV files (../src/pretokenized_dataset.py, compiled again only if a CSV
+    # changes), so no spacing of the AA and no preprocessing_for_bert pass at every start
+    print('Loading tokenized data...')
+    train_store = load_or_compile(train_data, vocab=tokenizer.get_vocab(), sequence_column=1, label_column=2)
+    val_store = load_or_compile(val_data, vocab=tokenizer.get_vocab(), sequence_column=1, label_column=2)
+    logging.info('TRAIN SET distribution:{}'.format(Counter(train_store.labels.tolist())))
+    logging.info('VAL SET distribution: {}'.format(Counter(val_store.labels.tolist())))
 
-    # Rostlab/prot_bert requires that the AA are separated between each other with a space
-    train_data[1]= [" ".join("".join(sample.split())) for sample in train_data[1]]
-    val_data[1]=[" ".join("".join(sample.split())) for sample in val_data[1]]
+    train_data = PretokenizedDataset(train_store)
+    val_data = PretokenizedDataset(val_store)
+    # (input ids, attention mask, label) batches, as from the former TensorDataset
+    collator = PretokenizedCollator(train_data.special_ids, MAX_LEN, as_tuple=True)
 
     #check
-    print('Checking data prep: {}'.format(train_data.head()))
-
-
-    # Run function `preprocessing_for_bert` on the train set and validation set
-    print('Tokenizing data...')
-    train_inputs, train_masks = preprocessing_for_bert(train_data[1],MAX_LEN)
-    val_inputs,val_masks = preprocessing_for_bert(val_data[1],MAX_LEN)
-
-    #check
-    logging.info("Example and check of the tokenized data: {}".format(train_data[1][0],train_inputs[0],train_masks[0]))
-
-
-    ## Create PyTorch DataLoader
-
-    # Training label
-    y_train=train_data[2]
-    # Val label
-    y_val=val_data[2]
-
-    # Convert other data types to torch.Tensor
-    train_labels = torch.tensor(y_train)
-    val_labels = torch.tensor(y_val)
+    logging.info("Example and check of the tokenized data: {}".format(collator([train_data[0]])))
 
     print("Creating Train and Val Dataloader")
     # Create the DataLoader for our training set
-    train_data = TensorDataset(train_inputs, train_masks, train_labels)
-    train_sampler = SequentialSampler(train_data)
-    train_dataloader = DataLoader(train_data, sampler=train_sampler, batch_size=batch_size, num_workers = num_workers)
+    # Batches of similar lengths, padded to the longest sequence of the batch (multiple of 8) instead of MAX_LEN,
+    # with at most batch_size * MAX_LEN tokens each
+    train_sampler = LengthBucketBatchSampler(train_data.lengths(MAX_LEN), max_tokens=batch_size * MAX_LEN, max_len=MAX_LEN, seed=42)
+    train_dataloader = DataLoader(train_data, batch_sampler=train_sampler, collate_fn=collator, num_workers = num_workers)
 
     # Create the DataLoader for our validation set
-    val_data = TensorDataset(val_inputs, val_masks, val_labels)
-    val_sampler = SequentialSampler(val_data)
-    val_dataloader = DataLoader(val_data, sampler=val_sampler, batch_size=batch_size, num_workers = num_workers)
+    val_sampler = LengthBucketBatchSampler(val_data.lengths(MAX_LEN), max_tokens=batch_size * MAX_LEN, max_len=MAX_LEN, shuffle=False)
+    val_dataloader = DataLoader(val_data, batch_sampler=val_sampler, collate_fn=collator, num_workers = num_workers)
+
+    logging.info('TRAIN SET padding: {}'.format(train_sampler.padding_report()))
+    logging.info('VAL SET padding: {}'.format(val_sampler.padding_report()))
+    # Val label, in the order of the validation batches (ordered by length) like the predictions
+    y_val = pd.Series(val_store.labels[[i for batch in val_sampler for i in batch]])
 
 
-    logging.info('Number of labels/target: {}'.format(len(np.unique(train_labels))))
+    logging.info('Number of labels/target: {}'.format(len(np.unique(train_store.labels))))
 
     return (train_dataloader,val_dataloader,y_val)
 
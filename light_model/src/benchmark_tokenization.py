@@ -0,0 +1,62 @@
+"""
+Benchmark of tokenize_and_mask_sequences (per-residue loop) against tokenize_and_mask_sequences_np (lookup table +
+one random call) on random light chains or on a sequence file.
+Without masking (mask_probability 0) and with every residue masked (1) both functions must return the same token ids,
+labels and attention masks; with the default probability the realized mask rate is compared.
+
+Example:
+python benchmark_tokenization.py --n_sequences 1000000 --max_len 160
+python benchmark_tokenization.py --sequences /ibmm_data2/oas_database/paired_lea_tmp/light_model/data/training_set_light_seq_70_pident.txt
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from tokenization import aa_to_id, amino_acids, load_sequences, tokenize_and_mask_sequences, tokenize_and_mask_sequences_np
+
+
+def random_sequences(n, min_len=100, max_len=120, seed=0):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(amino_acids + 'X') for _ in range(rng.randint(min_len, max_len))) for _ in range(n)]
+
+
+def check_equal(sequences, max_len):
+    """Both versions must agree exactly when the masking is deterministic."""
+    for mask_probability in (0.0, 1.0):
+        loop_output = tokenize_and_mask_sequences(sequences, aa_to_id, max_len, mask_probability=mask_probability)
+        np_output = tokenize_and_mask_sequences_np(sequences, aa_to_id, max_len, mask_probability=mask_probability)
+        for name, expected, actual in zip(('token ids', 'labels', 'attention masks'), loop_output, np_output):
+            if not np.array_equal(np.array(expected), actual):
+                raise AssertionError(f"{name} differ for mask_probability {mask_probability}")
+    print(f"Token ids, labels and attention masks are identical (mask_probability 0 and 1, {len(sequences)} sequences)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the loop and the vectorized tokenizer')
+    parser.add_argument("--sequences", help="File with one sequence per line (default: random sequences)", type=str)
+    parser.add_argument("--n_sequences", help="Number of random sequences", type=int, default=200000)
+    parser.add_argument("--max_len", help="Padded length", type=int, default=160)
+    parser.add_argument("--mask_probability", help="MLM mask probability", type=float, default=0.15)
+    args = parser.parse_args()
+
+    sequences = load_sequences(args.sequences) if args.sequences else random_sequences(args.n_sequences)
+    check_equal(sequences[:2000], args.max_len)
+
+    start = time.perf_counter()
+    input_ids, labels, _ = tokenize_and_mask_sequences(sequences, aa_to_id, args.max_len, args.mask_probability)
+    loop_time = time.perf_counter() - start
+    loop_rate = np.mean(np.array(labels) != -100)
+    del input_ids, labels
+
+    start = time.perf_counter()
+    input_ids, labels, _ = tokenize_and_mask_sequences_np(sequences, aa_to_id, args.max_len, args.mask_probability)
+    np_time = time.perf_counter() - start
+    np_rate = np.mean(labels != -100)
+
+    print(f"{len(sequences)} sequences, max_len {args.max_len}")
+    print(f"loop:       {loop_time:.2f} s (masked positions {loop_rate:.4f})")
+    print(f"vectorized: {np_time:.2f} s (masked positions {np_rate:.4f}), "
+          f"{input_ids.nbytes * 3 / 1e6:.0f} MB for the three arrays")
+    print(f"speedup: {loop_time / max(np_time, 1e-9):.1f}x")
@@ -0,0 +1,325 @@
+"""
+Pre-tokenized sequence store: the residue token ids of a split are compiled once into a flat uint8 file
+(<prefix>.tokens.bin) and an int64 array of record offsets (<prefix>.offsets.npy). When training starts both are only
+memory-mapped, so opening a multi-million-sequence split takes milliseconds instead of re-reading and re-tokenizing the
+text, and the DataLoader workers share the page cache instead of receiving pickled lists.
+[CLS]/[SEP] and padding are added per batch by the collators, the records hold the residues only.
+
+Optional files: <prefix>.labels.npy (one int label per record, from a CSV column), <prefix>.documents.npy (record
+offsets of the blank-line separated documents of a next sentence prediction text file). <prefix>.json (vocabulary,
+source file, counts) is written last and marks a complete store.
+
+    from pretokenized_dataset import PretokenizedDataset, PretokenizedCollator
+    dataset = PretokenizedDataset('data/training_set_light_seq_70_pident')
+    loader = DataLoader(dataset, batch_size=32, collate_fn=PretokenizedCollator(dataset.special_ids, max_len=128))
+
+Example:
+python pretokenized_dataset.py --input /ibmm_data2/oas_database/paired_lea_tmp/light_model/data/training_set_light_seq_70_pident.txt \
+    --output /ibmm_data2/oas_database/paired_lea_tmp/light_model/data/training_set_light_seq_70_pident
+python pretokenized_dataset.py --input paired_full_seqs_train_for_nsp.txt --output paired_full_seqs_train_for_nsp --documents
+python pretokenized_dataset.py --input train.csv --output train --sequence_column 1 --label_column 2 --vocab vocab.txt
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+import torch
+
+from tokenization import aa_to_id, build_lookup_table
+
+CHUNK_SIZE = 500000
+
+
+def read_vocab(vocab_path):
+    """Token -> id of a BERT vocab.txt (one token per line, the id is the line number)."""
+    with open(vocab_path, 'r') as f:
+        return {line.rstrip('\n'): i for i, line in enumerate(f)}
+
+
+def iter_record_chunks(input_path, sequence_column=None, label_column=None, delimiter=',', chunk_size=CHUNK_SIZE):
+    """Yield (sequences, labels or None, number of blank lines before every sequence) for chunks of the input.
+    Text input has one sequence per line, CSV input (sequence_column given) has no header. Whitespace inside the
+    sequences (the spaced input of Rostlab/prot_bert) is removed."""
+    with open(input_path, 'r', newline='') as f:
+        rows = csv.reader(f, delimiter=delimiter) if sequence_column is not None else f
+        sequences, labels, blank_lines = [], [], []
+        blank = 0
+        for row in rows:
+            sequence = row[sequence_column] if sequence_column is not None else row
+            sequence = ''.join(sequence.split())
+            if not sequence:
+                blank += 1
+                continue
+            sequences.append(sequence)
+            blank_lines.append(blank)
+            blank = 0
+            if label_column is not None:
+                labels.append(int(row[label_column]))
+            if len(sequences) == chunk_size:
+                yield sequences, labels if label_column is not None else None, blank_lines
+                sequences, labels, blank_lines = [], [], []
+        if sequences:
+            yield sequences, labels if label_column is not None else None, blank_lines
+
+
+def encode_chunk(sequences, table):
+    """Token ids of all residues of a chunk (flat uint8, through the byte lookup table) and the number per sequence."""
+    tokens = table[np.frombuffer(''.join(sequences).encode('ascii', 'replace'), dtype=np.uint8)]
+    lengths = np.fromiter((len(sequence) for sequence in sequences), dtype=np.int64, count=len(sequences))
+    return tokens, lengths
+
+
+def compile_tokens(input_path, prefix, vocab=None, sequence_column=None, label_column=None, delimiter=',',
+                   documents=False):
+    """Compile the sequences of input_path into the store <prefix>.*. Returns the metadata dict."""
+    vocab = vocab or aa_to_id
+    if max(vocab.values()) > 255:
+        raise ValueError("The token ids must fit into uint8 (vocabulary of at most 256 tokens).")
+    start = time.perf_counter()
+    table = build_lookup_table(vocab)
+    os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+    if os.path.exists(f"{prefix}.json"):
+        os.remove(f"{prefix}.json")
+
+    length_parts, label_parts = [], []
+    document_starts = []
+    n_records = n_tokens = 0
+    with open(f"{prefix}.tokens.bin", 'wb') as tokens_file:
+        for sequences, labels, blank_lines in iter_record_chunks(input_path, sequence_column, label_column, delimiter):
+            tokens, lengths = encode_chunk(sequences, table)
+            tokens_file.write(tokens.tobytes())
+            length_parts.append(lengths)
+            if labels is not None:
+                label_parts.append(np.array(labels, dtype=np.int64))
+            if documents:
+                # a record starts a new document if blank lines precede it (and the first record does)
+                is_start = np.array(blank_lines) > 0
+                is_start[0] |= n_records == 0
+                document_starts.append(np.flatnonzero(is_start) + n_records)
+            n_records += len(sequences)
+            n_tokens += len(tokens)
+
+    offsets = np.zeros(n_records + 1, dtype=np.int64)
+    if length_parts:
+        np.cumsum(np.concatenate(length_parts), out=offsets[1:])
+    np.save(f"{prefix}.offsets.npy", offsets)
+    if label_column is not None:
+        np.save(f"{prefix}.labels.npy", np.concatenate(label_parts) if label_parts else np.zeros(0, dtype=np.int64))
+    if documents:
+        starts = np.concatenate(document_starts) if document_starts else np.zeros(0, dtype=np.int64)
+        np.save(f"{prefix}.documents.npy", np.append(starts, n_records).astype(np.int64))
+
+    source = os.stat(input_path)
+    meta = {
+        'source': os.path.abspath(input_path),
+        'source_size': source.st_size,
+        'source_mtime_ns': source.st_mtime_ns,
+        'n_records': n_records,
+        'n_tokens': n_tokens,
+        'vocab': vocab,
+        'sequence_column': sequence_column,
+        'label_column': label_column,
+        'documents': documents,
+    }
+    with open(f"{prefix}.json", 'w') as f:
+        json.dump(meta, f, indent=2)
+    print(f"Compiled {n_records} sequences ({n_tokens} tokens) of {input_path} into {prefix} "
+          f"in {time.perf_counter() - start:.1f} s")
+    return meta
+
+
+def is_compiled(prefix, input_path=None):
+    """True if the store is complete (and, if input_path is given, was compiled from the current version of it)."""
+    if not os.path.exists(f"{prefix}.json"):
+        return False
+    if input_path is None:
+        return True
+    with open(f"{prefix}.json", 'r') as f:
+        meta = json.load(f)
+    source = os.stat(input_path)
+    return meta['source_size'] == source.st_size and meta['source_mtime_ns'] == source.st_mtime_ns
+
+
+def load_or_compile(input_path, prefix=None, **compile_args):
+    """The TokenStore of input_path, compiled first if it does not exist, the input changed since or it was compiled
+    with other arguments.
+    The default prefix is the input path without its extension."""
+    prefix = prefix or os.path.splitext(input_path)[0]
+    if is_compiled(prefix, input_path):
+        store = TokenStore(prefix)
+        # the store is only reused if it was compiled with the same vocabulary and columns
+        requested = dict(compile_args, vocab=compile_args.get('vocab') or aa_to_id)
+        requested.pop('delimiter', None)
+        if all(store.meta.get(key) == value for key, value in requested.items()):
+            return store
+    compile_tokens(input_path, prefix, **compile_args)
+    return TokenStore(prefix)
+
+
+class TokenStore:
+    """Memory-mapped view of a compiled store: store[i] is the uint8 array of the residue token ids of record i
+    (a view into the map, nothing is copied)."""
+
+    def __init__(self, prefix):
+        with open(f"{prefix}.json", 'r') as f:
+            self.meta = json.load(f)
+        self.prefix = prefix
+        self.vocab = self.meta['vocab']
+        self.offsets = np.load(f"{prefix}.offsets.npy", mmap_mode='r')
+        n_tokens = self.meta['n_tokens']
+        # np.memmap cannot map an empty file
+        self.tokens = np.memmap(f"{prefix}.tokens.bin", dtype=np.uint8, mode='r') if n_tokens else np.zeros(0, dtype=np.uint8)
+        self.labels = np.load(f"{prefix}.labels.npy", mmap_mode='r') if self.meta['label_column'] is not None else None
+        self.documents = np.load(f"{prefix}.documents.npy", mmap_mode='r') if self.meta['documents'] else None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]]
+
+    def lengths(self):
+        """Number of residues of every record."""
+        return np.diff(self.offsets)
+
+    def max_token_id(self):
+        return int(self.tokens.max()) if len(self.tokens) else -1
+
+    @property
+    def special_ids(self):
+        return {token: self.vocab[token] for token in ('[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]')}
+
+
+class PretokenizedDataset(torch.utils.data.Dataset):
+    """Dataset over a compiled store. An item is {'tokens': uint8 view of the residues} (+ 'label' if the store has
+    labels), the collator builds the padded tensors."""
+
+    def __init__(self, store):
+        self.store = store if isinstance(store, TokenStore) else TokenStore(store)
+        self.special_ids = self.store.special_ids
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, index):
+        item = {'tokens': self.store[index]}
+        if self.store.labels is not None:
+            item['label'] = int(self.store.labels[index])
+        return item
+
+    def lengths(self, max_len):
+        """Number of attended tokens of every sample ([CLS] and [SEP] included) after truncation to max_len, for
+        LengthBucketBatchSampler."""
+        return np.minimum(self.store.lengths() + 2, max_len)
+
+
+class PretokenizedCollator:
+    """Collate function for PretokenizedDataset: [CLS] residues [SEP], truncated to max_len and padded to the longest
+    sample of the batch (rounded up to pad_multiple). Returns {'input_ids', 'attention_mask'(, 'labels')} as long
+    tensors, or the tuple (input_ids, attention_mask(, labels)) if as_tuple (TensorDataset layout of training.py)."""
+
+    def __init__(self, special_ids, max_len, pad_multiple=8, as_tuple=False):
+        self.cls_id = special_ids['[CLS]']
+        self.sep_id = special_ids['[SEP]']
+        self.pad_id = special_ids['[PAD]']
+        self.max_len = max_len
+        self.pad_multiple = pad_multiple
+        self.as_tuple = as_tuple
+
+    def __call__(self, batch):
+        residues = [item['tokens'][:self.max_len - 2] for item in batch]
+        lengths = np.array([len(tokens) for tokens in residues], dtype=np.int64) + 2
+        width = min(-(-int(lengths.max()) // self.pad_multiple) * self.pad_multiple, self.max_len)
+        input_ids = np.full((len(batch), width), self.pad_id, dtype=np.int64)
+        input_ids[:, 0] = self.cls_id
+        for row, tokens in enumerate(residues):
+            input_ids[row, 1:len(tokens) + 1] = tokens
+        input_ids[np.arange(len(batch)), lengths - 1] = self.sep_id
+        attention_mask = (np.arange(width) < lengths[:, None]).astype(np.int64)
+
+        output = {'input_ids': torch.from_numpy(input_ids), 'attention_mask': torch.from_numpy(attention_mask)}
+        if 'label' in batch[0]:
+            output['labels'] = torch.tensor([item['label'] for item in batch], dtype=torch.long)
+        return tuple(output.values()) if self.as_tuple else output
+
+
+class PretokenizedNSPDataset(torch.utils.data.Dataset):
+    """Next sentence prediction examples over a store compiled with documents=True (e.g. heavy chain line, light chain
+    line, blank line), in the format of transformers' TextDatasetForNextSentencePrediction: every consecutive pair of
+    lines of a document is an example, whose second line is replaced with probability nsp_probability by a line of
+    another document (next_sentence_label 1, else 0). The pairs are drawn once (seed), the items are built from the
+    map: [CLS] a [SEP] b [SEP] with token_type_ids, the longer line truncated first to fit block_size."""
+
+    def __init__(self, store, block_size=128, nsp_probability=0.5, seed=42):
+        self.store = store if isinstance(store, TokenStore) else TokenStore(store)
+        if self.store.documents is None:
+            raise ValueError(f"{self.store.prefix} was compiled without documents.")
+        special_ids = self.store.special_ids
+        self.cls_id, self.sep_id = special_ids['[CLS]'], special_ids['[SEP]']
+        self.block_size = block_size
+
+        documents = np.asarray(self.store.documents)
+        document_of = np.repeat(np.arange(len(documents) - 1), np.diff(documents))
+        # first lines: every record that is followed by a record of the same document
+        first = np.flatnonzero(document_of[:-1] == document_of[1:]) if len(document_of) > 1 else np.zeros(0, dtype=np.int64)
+        second = first + 1
+        rng = np.random.default_rng(seed)
+        random_next = rng.random(len(first)) < nsp_probability
+        # a random line of another document: draw among the records outside the document of the first line
+        document = document_of[first[random_next]]
+        document_start, document_length = documents[document], documents[document + 1] - documents[document]
+        n_other = len(document_of) - document_length
+        candidates = (rng.random(len(document)) * n_other).astype(np.int64)
+        candidates += document_length * (candidates >= document_start)
+        random_next[np.flatnonzero(random_next)[n_other == 0]] = False
+        second[random_next] = candidates[n_other > 0]
+        self.first, self.second = first, second
+        self.next_sentence_labels = random_next.astype(np.int64)
+
+    def __len__(self):
+        return len(self.first)
+
+    def __getitem__(self, index):
+        tokens_a = self.store[self.first[index]]
+        tokens_b = self.store[self.second[index]]
+        length_a, length_b = len(tokens_a), len(tokens_b)
+        budget = self.block_size - 3
+        if length_a + length_b > budget:
+            # longest first: the longer line is cut down to the shorter one, then both alternately
+            if length_a >= length_b:
+                length_a, length_b = (budget - length_b, length_b) if length_b <= budget // 2 else (budget // 2, budget - budget // 2)
+            else:
+                length_a, length_b = (length_a, budget - length_a) if length_a <= budget // 2 else (budget // 2, budget - budget // 2)
+        input_ids = np.empty(length_a + length_b + 3, dtype=np.int64)
+        input_ids[0] = self.cls_id
+        input_ids[1:length_a + 1] = tokens_a[:length_a]
+        input_ids[length_a + 1] = self.sep_id
+        input_ids[length_a + 2:-1] = tokens_b[:length_b]
+        input_ids[-1] = self.sep_id
+        token_type_ids = np.zeros(len(input_ids), dtype=np.int64)
+        token_type_ids[length_a + 2:] = 1
+        return {
+            'input_ids': torch.from_numpy(input_ids),
+            'token_type_ids': torch.from_numpy(token_type_ids),
+            'next_sentence_label': torch.tensor(self.next_sentence_labels[index], dtype=torch.long),
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile a sequence file into a memory-mapped token store')
+    parser.add_argument("--input", help="Text file with one sequence per line, or CSV with --sequence_column", type=str, required=True)
+    parser.add_argument("--output", help="Prefix of the store files (default: input without extension)", type=str)
+    parser.add_argument("--vocab", help="vocab.txt of the tokenizer (default: the amino acid vocabulary of tokenization.py)", type=str)
+    parser.add_argument("--sequence_column", help="Index of the sequence column of a CSV without header", type=int)
+    parser.add_argument("--label_column", help="Index of an integer label column of the CSV", type=int)
+    parser.add_argument("--delimiter", help="CSV delimiter", type=str, default=',')
+    parser.add_argument("--documents", help="Keep the blank-line separated documents (next sentence prediction input)", action='store_true')
+    args = parser.parse_args()
+
+    vocab = read_vocab(args.vocab) if args.vocab else None
+    compile_tokens(args.input, args.output or os.path.splitext(args.input)[0], vocab=vocab,
+                   sequence_column=args.sequence_column, label_column=args.label_column, delimiter=args.delimiter,
+                   documents=args.documents)
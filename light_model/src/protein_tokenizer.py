@@ -0,0 +1,314 @@
+"""
+Character-level protein tokenizer for the vocab.txt of ProteinTokenizer / UpdatedProteinTokenizer (and of other
+one-letter vocabularies such as Rostlab/prot_bert_bfd), with the interface of a transformers tokenizer.
+
+Every amino acid is one token, so the sequences need no spaces between the residues (preprocess_input_data.py is not
+needed anymore, spaced files still work: whitespace is ignored). Calls on str or lists of str take a fast path: the
+residues of the whole batch are mapped through a 256-entry byte lookup table in NumPy and [CLS]/[SEP], truncation,
+padding, token_type_ids and the special tokens mask are placed with array operations, instead of the per-character
+WordPiece / added-token matching of BertTokenizer. Special tokens written in the text (e.g. heavy[SEP]light) are
+recognized. Everything else (tokenize, pad, decode, save_pretrained, DataCollatorForLanguageModeling) is the
+transformers implementation.
+
+    from protein_tokenizer import ProteinTokenizer
+    tokenizer = ProteinTokenizer.from_pretrained('ProteinTokenizer')
+    batch = tokenizer(heavy_chains, light_chains, padding=True, truncation=True, max_length=256, return_tensors='pt')
+
+Example (speed and equality against the AutoTokenizer of the same directory):
+python protein_tokenizer.py --tokenizer redo_ch/ProteinTokenizer --sequences /ibmm_data2/oas_database/paired_lea_tmp/light_model/data/test_set_light_seq_70_pident.txt
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from transformers import PreTrainedTokenizer
+from transformers.tokenization_utils_base import BatchEncoding
+
+VOCAB_FILES_NAMES = {'vocab_file': 'vocab.txt'}
+
+# arguments of __call__ the fast path does not implement, the call is then left to transformers
+FAST_PATH_UNSUPPORTED = ('text_target', 'text_pair_target', 'is_split_into_words', 'return_overflowing_tokens',
+                         'return_offsets_mapping', 'stride')
+
+
+def load_vocab(vocab_file):
+    """Token -> id of a vocab.txt (one token per line, the id is the line number)."""
+    with open(vocab_file, 'r', encoding='utf-8') as f:
+        return {line.rstrip('\n'): i for i, line in enumerate(f)}
+
+
+def truncate_pair_lengths(length_a, length_b, budget):
+    """Lengths after the 'longest_first' truncation of the transformers fast tokenizers, for arrays of lengths: the
+    longer sequence is cut down to the shorter one, then both alternately (the longer one, the second on ties, keeps
+    the odd token)."""
+    overflow = length_a + length_b > budget
+    a_longer = length_a > length_b
+    balanced = np.minimum(length_a, length_b) > budget // 2
+    new_a = np.where(balanced, np.where(a_longer, budget - budget // 2, budget // 2),
+                     np.where(a_longer, budget - length_b, length_a))
+    new_b = np.where(balanced, budget - new_a, np.where(a_longer, length_b, budget - length_a))
+    return np.where(overflow, new_a, length_a), np.where(overflow, new_b, length_b)
+
+
+class ProteinTokenizer(PreTrainedTokenizer):
+    vocab_files_names = VOCAB_FILES_NAMES
+    model_input_names = ['input_ids', 'token_type_ids', 'attention_mask']
+
+    def __init__(self, vocab_file, unk_token='[UNK]', sep_token='[SEP]', pad_token='[PAD]', cls_token='[CLS]',
+                 mask_token='[MASK]', **kwargs):
+        # the options of the BertTokenizer config (lower casing, basic tokenization) do not apply to residues
+        for option in ('do_lower_case', 'do_basic_tokenize', 'never_split', 'tokenize_chinese_chars', 'strip_accents'):
+            kwargs.pop(option, None)
+        self.vocab = load_vocab(vocab_file)
+        self.ids_to_tokens = {token_id: token for token, token_id in self.vocab.items()}
+        self._table = None
+        self._table_size = None
+        self._placeholders = []
+        super().__init__(unk_token=unk_token, sep_token=sep_token, pad_token=pad_token, cls_token=cls_token,
+                         mask_token=mask_token, **kwargs)
+
+    @property
+    def vocab_size(self):
+        return len(self.vocab)
+
+    def get_vocab(self):
+        vocab = dict(self.vocab)
+        vocab.update(self.added_tokens_encoder)
+        return vocab
+
+    def lookup_table(self):
+        """256-entry byte -> token id table of all one-character tokens (vocab.txt and added tokens, e.g. the amino
+        acids of ProteinTokenizer/added_tokens.json), [UNK] for all other bytes. The multi-character tokens ([SEP],
+        [MASK], ...) get the control characters 1, 2, ... as placeholders (see encode_residues). Rebuilt when tokens
+        are added."""
+        if self._table is None or self._table_size != len(self):
+            vocab = self.get_vocab()
+            table = np.full(256, self.unk_token_id, dtype=np.int64)
+            for token, token_id in vocab.items():
+                if len(token) == 1 and ord(token) < 256:
+                    table[ord(token)] = token_id
+            long_tokens = sorted((token for token in vocab if len(token) > 1), key=len, reverse=True)[:31]
+            self._placeholders = [(token, chr(i + 1)) for i, token in enumerate(long_tokens)]
+            for token, placeholder in self._placeholders:
+                table[ord(placeholder)] = vocab[token]
+            self._table, self._table_size = table, len(self)
+        return self._table
+
+    def _tokenize(self, text, **kwargs):
+        return [character for character in text if not character.isspace()]
+
+    def _convert_token_to_id(self, token):
+        return self.vocab.get(token, self.vocab.get(self.unk_token))
+
+    def _convert_id_to_token(self, index):
+        return self.ids_to_tokens.get(index, self.unk_token)
+
+    def convert_tokens_to_string(self, tokens):
+        return ''.join(tokens)
+
+    def build_inputs_with_special_tokens(self, token_ids_0, token_ids_1=None):
+        if token_ids_1 is None:
+            return [self.cls_token_id] + token_ids_0 + [self.sep_token_id]
+        return [self.cls_token_id] + token_ids_0 + [self.sep_token_id] + token_ids_1 + [self.sep_token_id]
+
+    def get_special_tokens_mask(self, token_ids_0, token_ids_1=None, already_has_special_tokens=False):
+        if already_has_special_tokens:
+            return super().get_special_tokens_mask(token_ids_0, token_ids_1, already_has_special_tokens=True)
+        if token_ids_1 is None:
+            return [1] + [0] * len(token_ids_0) + [1]
+        return [1] + [0] * len(token_ids_0) + [1] + [0] * len(token_ids_1) + [1]
+
+    def create_token_type_ids_from_sequences(self, token_ids_0, token_ids_1=None):
+        if token_ids_1 is None:
+            return [0] * (len(token_ids_0) + 2)
+        return [0] * (len(token_ids_0) + 2) + [1] * (len(token_ids_1) + 1)
+
+    def num_special_tokens_to_add(self, pair=False):
+        return 3 if pair else 2
+
+    def save_vocabulary(self, save_directory, filename_prefix=None):
+        vocab_file = os.path.join(save_directory, (filename_prefix + '-' if filename_prefix else '') + VOCAB_FILES_NAMES['vocab_file'])
+        with open(vocab_file, 'w', encoding='utf-8') as f:
+            for token, _ in sorted(self.vocab.items(), key=lambda item: item[1]):
+                f.write(token + '\n')
+        return (vocab_file,)
+
+    # ---- fast path ----
+
+    def encode_residues(self, sequences):
+        """Token ids of all sequences without special tokens: (flat int64 array, length per sequence).
+        Whitespace is dropped, special tokens written in the text (heavy[SEP]light) are replaced by their one-byte
+        placeholders, so every byte is one token."""
+        table = self.lookup_table()
+        sequences = [''.join(sequence.split()) for sequence in sequences]
+        if any('[' in sequence for sequence in sequences):
+            for token, placeholder in self._placeholders:
+                sequences = [sequence.replace(token, placeholder) if token in sequence else sequence for sequence in sequences]
+        lengths = np.fromiter((len(sequence) for sequence in sequences), dtype=np.int64, count=len(sequences))
+        # characters that are not ASCII count as one residue and become [UNK]
+        raw = np.frombuffer(''.join(sequences).encode('ascii', 'replace'), dtype=np.uint8)
+        return table[raw], lengths
+
+    def encode_batch(self, sequences, pairs=None, add_special_tokens=True, truncation=False, max_length=None,
+                     padding=False, pad_to_multiple_of=None):
+        """Encode a batch into padded NumPy arrays: input_ids, token_type_ids, attention_mask and special_tokens_mask
+        of shape (n, width), plus 'length' (tokens per sequence). Without padding width is the longest sequence and the
+        rows are cut to their length by __call__.
+        truncation: False or True/'longest_first' ('only_first' / 'only_second' for pairs); padding: False/'longest'/True
+        or 'max_length'."""
+        n = len(sequences)
+        ids_a, length_a = self.encode_residues(sequences)
+        ids_b, length_b = self.encode_residues(pairs) if pairs is not None else (np.zeros(0, dtype=np.int64), np.zeros(n, dtype=np.int64))
+        if pairs is not None and len(pairs) != n:
+            raise ValueError(f"{n} sequences but {len(pairs)} pairs.")
+        n_special = (3 if pairs is not None else 2) if add_special_tokens else 0
+
+        kept_a, kept_b = length_a, length_b
+        if truncation and max_length is not None:
+            budget = max_length - n_special
+            if pairs is None or truncation in (True, 'longest_first'):
+                kept_a, kept_b = truncate_pair_lengths(length_a, length_b, budget) if pairs is not None else (np.minimum(length_a, budget), length_b)
+            elif truncation in ('only_first', 'only_second'):
+                kept, other = (length_a, length_b) if truncation == 'only_first' else (length_b, length_a)
+                if np.any(budget - other < 0):
+                    raise ValueError(f"Sequence to truncate too short to respect max_length {max_length} ({truncation}).")
+                kept = np.minimum(kept, budget - other)
+                kept_a, kept_b = (kept, length_b) if truncation == 'only_first' else (length_a, kept)
+            else:
+                raise ValueError(f"Unknown truncation strategy {truncation}.")
+        lengths = kept_a + kept_b + n_special
+
+        width = int(lengths.max()) if n else 0
+        if padding == 'max_length' and max_length is not None:
+            width = max(width, max_length)
+        if padding and pad_to_multiple_of:
+            width = -(-width // pad_to_multiple_of) * pad_to_multiple_of
+
+        input_ids = np.full((n, width), self.pad_token_id, dtype=np.int64)
+        rows = np.arange(n)
+        start_a = 1 if add_special_tokens else 0
+        start_b = kept_a + (2 if add_special_tokens else 0)
+        for ids, length, kept, start in ((ids_a, length_a, kept_a, np.full(n, start_a)), (ids_b, length_b, kept_b, start_b)):
+            if not len(ids):
+                continue
+            # row and position within its sequence of every token of the flat array, tokens beyond kept are dropped
+            token_rows = np.repeat(rows, length)
+            positions = np.arange(len(ids)) - np.repeat(np.cumsum(length) - length, length)
+            selected = positions < np.repeat(kept, length)
+            input_ids[token_rows[selected], (positions + np.repeat(start, length))[selected]] = ids[selected]
+
+        columns = np.arange(width)
+        special_tokens_mask = np.zeros((n, width), dtype=np.int64)
+        if add_special_tokens and n:
+            sep_positions = [kept_a + 1] + ([kept_a + kept_b + 2] if pairs is not None else [])
+            input_ids[:, 0] = self.cls_token_id
+            special_tokens_mask[:, 0] = 1
+            for position in sep_positions:
+                input_ids[rows, position] = self.sep_token_id
+                special_tokens_mask[rows, position] = 1
+        attention_mask = (columns < lengths[:, None]).astype(np.int64)
+        special_tokens_mask[attention_mask == 0] = 1
+        token_type_ids = ((columns >= start_b[:, None]) & (attention_mask == 1)).astype(np.int64) if pairs is not None \
+            else np.zeros((n, width), dtype=np.int64)
+        return {'input_ids': input_ids, 'token_type_ids': token_type_ids, 'attention_mask': attention_mask,
+                'special_tokens_mask': special_tokens_mask, 'length': lengths}
+
+    def _unpadded_lists(self, encoded, names, pair_special_tokens):
+        """The rows of encode_batch cut to their lengths, as lists (one tolist() of the flat ids, the masks are built
+        from the lengths)."""
+        lengths = encoded['length'].tolist()
+        ends = np.cumsum(encoded['length']).tolist()
+        flat_ids = encoded['input_ids'][encoded['attention_mask'] == 1].tolist()
+        data = {'input_ids': [flat_ids[end - length:end] for end, length in zip(ends, lengths)]}
+        if 'attention_mask' in names:
+            data['attention_mask'] = [[1] * length for length in lengths]
+        if 'token_type_ids' in names or 'special_tokens_mask' in names:
+            # length of the first segment ([CLS] a [SEP]) of every row
+            first = (encoded['token_type_ids'] == 0).sum(axis=1) - (encoded['attention_mask'] == 0).sum(axis=1)
+            first = first.tolist()
+            if 'token_type_ids' in names:
+                data['token_type_ids'] = [[0] * a + [1] * (length - a) for a, length in zip(first, lengths)]
+            if 'special_tokens_mask' in names:
+                special = encoded['special_tokens_mask'][encoded['attention_mask'] == 1].tolist()
+                data['special_tokens_mask'] = [special[end - length:end] for end, length in zip(ends, lengths)]
+        return {name: data[name] for name in names}
+
+    def __call__(self, text=None, text_pair=None, add_special_tokens=True, padding=False, truncation=None,
+                 max_length=None, pad_to_multiple_of=None, return_tensors=None, return_token_type_ids=None,
+                 return_attention_mask=None, return_special_tokens_mask=False, return_length=False, **kwargs):
+        call_args = dict(text_pair=text_pair, add_special_tokens=add_special_tokens, padding=padding,
+                         truncation=truncation, max_length=max_length, pad_to_multiple_of=pad_to_multiple_of,
+                         return_tensors=return_tensors, return_token_type_ids=return_token_type_ids,
+                         return_attention_mask=return_attention_mask, return_special_tokens_mask=return_special_tokens_mask,
+                         return_length=return_length)
+        single = isinstance(text, str)
+        texts = [text] if single else text
+        pairs = [text_pair] if single and isinstance(text_pair, str) else text_pair
+        fast = (isinstance(texts, (list, tuple)) and all(isinstance(t, str) for t in texts)
+                and (pairs is None or (isinstance(pairs, (list, tuple)) and all(isinstance(t, str) for t in pairs)))
+                and not any(kwargs.get(name) for name in FAST_PATH_UNSUPPORTED)
+                and kwargs.get('padding_side', self.padding_side) == 'right' and self.truncation_side == 'right')
+        padding = getattr(padding, 'value', padding)
+        truncation = getattr(truncation, 'value', truncation)
+        if not fast or padding not in (False, True, 'longest', 'max_length', 'do_not_pad') or \
+                truncation not in (None, False, True, 'longest_first', 'only_first', 'only_second', 'do_not_truncate'):
+            return super().__call__(text, **call_args, **kwargs)
+
+        padding = False if padding == 'do_not_pad' else padding
+        truncation = False if truncation in (None, 'do_not_truncate') else truncation
+        if truncation and max_length is None and self.model_max_length < 1e30:
+            max_length = self.model_max_length
+        if padding == 'max_length' and max_length is None:
+            max_length = self.model_max_length
+        encoded = self.encode_batch(list(texts), list(pairs) if pairs is not None else None, add_special_tokens,
+                                    truncation, max_length, padding, pad_to_multiple_of)
+
+        names = ['input_ids']
+        if return_token_type_ids or (return_token_type_ids is None and 'token_type_ids' in self.model_input_names):
+            names.append('token_type_ids')
+        if return_attention_mask or (return_attention_mask is None and 'attention_mask' in self.model_input_names):
+            names.append('attention_mask')
+        if return_special_tokens_mask:
+            names.append('special_tokens_mask')
+        if padding:
+            data = {name: encoded[name] for name in names}
+            if return_tensors is None:
+                data = {name: values.tolist() for name, values in data.items()}
+        else:
+            if return_tensors is not None and len(set(encoded['length'].tolist())) > 1:
+                raise ValueError("Sequences of different lengths need padding=True to be returned as tensors.")
+            data = self._unpadded_lists(encoded, names, pairs is not None and add_special_tokens)
+        if return_length:
+            data['length'] = encoded['length'].tolist()
+        if single and return_tensors is None:
+            data = {name: values[0] for name, values in data.items()}
+        return BatchEncoding(data, tensor_type=return_tensors)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare ProteinTokenizer with the AutoTokenizer of the same directory')
+    parser.add_argument("--tokenizer", help="Tokenizer directory (vocab.txt, special_tokens_map.json, ...)", type=str, required=True)
+    parser.add_argument("--sequences", help="File with one sequence per line", type=str, required=True)
+    parser.add_argument("--max_length", help="Truncation length", type=int, default=160)
+    parser.add_argument("--n_sequences", help="Number of sequences to compare", type=int, default=100000)
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    with open(args.sequences, 'r') as f:
+        sequences = [line.strip() for line, _ in zip(f, range(args.n_sequences)) if line.strip()]
+    fast_tokenizer = ProteinTokenizer.from_pretrained(args.tokenizer)
+    auto_tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+
+    start = time.perf_counter()
+    fast = fast_tokenizer(sequences, truncation=True, max_length=args.max_length, return_special_tokens_mask=True)
+    fast_time = time.perf_counter() - start
+    start = time.perf_counter()
+    # the WordPiece tokenizer needs the spaced input preprocess_input_data.py used to write
+    auto = auto_tokenizer([' '.join(sequence) for sequence in sequences], truncation=True, max_length=args.max_length,
+                          return_special_tokens_mask=True)
+    auto_time = time.perf_counter() - start
+    print(f"{len(sequences)} sequences: ProteinTokenizer {fast_time:.2f} s, {type(auto_tokenizer).__name__} {auto_time:.2f} s "
+          f"({auto_time / max(fast_time, 1e-9):.0f}x)")
+    print("input_ids identical:", fast['input_ids'] == auto['input_ids'])
@@ -18,6 +18,7 @@ conda activate lea_env
 /home/leab/anaconda3/envs/lea_env/bin/python run_mlm.py \
     --model_type 'roberta' \
     --tokenizer_name ./ProteinTokenizer \
+    --use_protein_tokenizer \
     --train_file /ibmm_data2/oas_database/paired_lea_tmp/light_model/data/train_test_val_datasets/light_all_seqs_train_no_ids.txt \
     --validation_file /ibmm_data2/oas_database/paired_lea_tmp/light_model/data/train_test_val_datasets/light_all_seqs_val_no_ids.txt \
     --per_device_train_batch_size 16 \
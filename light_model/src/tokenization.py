@@ -4,6 +4,7 @@
 # Instead, use character-level tokenization, where each amino acid is treated as a separate token. 
 # This requires mapping each amino acid to a unique ID, similar to how subwords are tokenized in NLP.
 
+import numpy as np
 import torch
 from torch.utils.data import Dataset, DataLoader
 import random
@@ -16,10 +17,6 @@ def load_sequences(file_path):
 #training_sequences = load_sequences('/ibmm_data2/oas_database/paired_lea_tmp/light_model/data/training_set_light_seq_100_pident.txt')
 #test_sequences = load_sequences('/ibmm_data2/oas_database/paired_lea_tmp/light_model/data/test_set_light_seq_100_pident.txt')
 
-training_sequences = load_sequences('/ibmm_data2/oas_database/paired_lea_tmp/light_model/data/training_set_test.txt')
-test_sequences = load_sequences('/ibmm_data2/oas_database/paired_lea_tmp/light_model/data/test_set_test.txt')
-
-
 amino_acids = 'ACDEFGHIKLMNPQRSTVWY'
 special_tokens = {'[PAD]': 0, '[UNK]': 1, '[CLS]': 2, '[SEP]': 3, '[MASK]': 4}
 
@@ -68,6 +65,196 @@ def tokenize_and_mask_sequences(sequences, aa_to_id, max_len, mask_probability=0
     return tokenized_sequences, masked_labels, attention_masks  # Modify this line
 
 
+def build_lookup_table(aa_to_id):
+    """256-entry table byte -> token id, every byte that is not an amino acid maps to [UNK]."""
+    table = np.full(256, aa_to_id['[UNK]'], dtype=np.uint8)
+    for token, token_id in aa_to_id.items():
+        if len(token) == 1:
+            table[ord(token)] = token_id
+    return table
+
+
+def tokenize_sequences_np(sequences, aa_to_id, max_len):
+    """Token ids and attention masks without masking, as contiguous (n, max_len) uint8 arrays: the residues are mapped
+    through a 256-entry lookup table on the raw bytes and written into the padded array in one assignment."""
+    table = build_lookup_table(aa_to_id)
+    n = len(sequences)
+    # characters that are not ASCII count as one residue and become [UNK], as in the loop version
+    raw = np.frombuffer(''.join(sequences).encode('ascii', 'replace'), dtype=np.uint8)
+    lengths = np.fromiter((len(seq) for seq in sequences), dtype=np.int64, count=n)
+    n_residues = np.minimum(lengths, max_len - 2)
+
+    # row and column (after [CLS]) of every residue of the joined bytes, residues beyond max_len - 2 are dropped
+    rows = np.repeat(np.arange(n), lengths)
+    columns = np.arange(len(raw)) - np.repeat(np.cumsum(lengths) - lengths, lengths) + 1
+    kept = columns <= max_len - 2
+    input_ids = np.full((n, max_len), aa_to_id['[PAD]'], dtype=np.uint8)
+    input_ids[rows[kept], columns[kept]] = table[raw[kept]]
+    input_ids[:, 0] = aa_to_id['[CLS]']
+    input_ids[np.arange(n), n_residues + 1] = aa_to_id['[SEP]']
+
+    attention_masks = (np.arange(max_len) < (n_residues + 2)[:, None]).astype(np.uint8)
+    return input_ids, attention_masks
+
+
+def tokenize_and_mask_sequences_np(sequences, aa_to_id, max_len, mask_probability=0.15, seed=None):
+    """Vectorized version of tokenize_and_mask_sequences (static masking, one random call for all positions).
+    Returns (token ids, labels, attention masks) as contiguous (n, max_len) arrays (uint8, int8, uint8)."""
+    input_ids, attention_masks = tokenize_sequences_np(sequences, aa_to_id, max_len)
+    residue_positions = ~np.isin(input_ids, [aa_to_id['[PAD]'], aa_to_id['[CLS]'], aa_to_id['[SEP]']])
+
+    masked = (np.random.default_rng(seed).random(input_ids.shape) < mask_probability) & residue_positions
+    labels = np.where(masked, input_ids, -100).astype(np.int8)
+    input_ids[masked] = aa_to_id['[MASK]']
+    return input_ids, labels, attention_masks
+
+
+def padded_width(length, pad_multiple=8):
+    """length rounded up to a multiple of pad_multiple (works on ints and arrays)."""
+    return -(-length // pad_multiple) * pad_multiple
+
+
+class PadToLongestCollator:
+    """Collate function that stacks the samples (dicts as returned by AminoAcidDataset, or tuples of a TensorDataset)
+    and cuts the padding after the longest attention mask of the batch, rounded up to a multiple of pad_multiple.
+    Every 2-d batch tensor whose second dimension is the padded length (ids, mask, token labels) is cut."""
+
+    def __init__(self, pad_multiple=8, mask_key='attention_mask', mask_index=1):
+        self.pad_multiple = pad_multiple
+        self.mask_key = mask_key
+        self.mask_index = mask_index
+
+    def __call__(self, batch):
+        batch = torch.utils.data.default_collate(batch)
+        mask = batch[self.mask_key] if isinstance(batch, dict) else batch[self.mask_index]
+        full_width = mask.shape[1]
+        width = min(padded_width(int(mask.sum(dim=1).max()), self.pad_multiple), full_width)
+
+        def cut(tensor):
+            return tensor[:, :width] if tensor.dim() == 2 and tensor.shape[1] == full_width else tensor
+
+        if isinstance(batch, dict):
+            return {key: cut(value) for key, value in batch.items()}
+        return [cut(value) for value in batch]
+
+
+class LengthBucketBatchSampler(torch.utils.data.Sampler):
+    """Batch sampler that groups sequences of similar length, for use with PadToLongestCollator.
+    The samples are sorted by length (ties in a new random order every epoch) and cut into batches of at most
+    max_tokens padded positions (number of sequences x longest length rounded up to pad_multiple), so the token count
+    per batch stays roughly constant and short sequences come in larger batches. The order of the batches is shuffled.
+    Since only ties are shuffled, the batch boundaries and therefore len() are the same in every epoch.
+
+    lengths: number of attended tokens per sample ([CLS] and [SEP] included), e.g. attention_masks.sum(1)."""
+
+    def __init__(self, lengths, max_tokens, pad_multiple=8, max_len=None, shuffle=True, seed=None):
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.max_len = int(max_len) if max_len is not None else int(self.lengths.max(initial=0))
+        self.widths = np.minimum(padded_width(self.lengths, pad_multiple), self.max_len)
+        if len(self.widths) and max_tokens < self.widths.max():
+            raise ValueError(f"max_tokens ({max_tokens}) is smaller than the longest padded sequence ({self.widths.max()}).")
+        self.max_tokens = max_tokens
+        self.shuffle = shuffle
+        # follows torch.manual_seed if no seed is given, like the DataLoader's own sampler
+        self.rng = np.random.default_rng(seed if seed is not None else int(torch.randint(2 ** 62, (1,))))
+
+        sorted_widths = np.sort(self.widths)
+        self.boundaries = [0]
+        n = len(sorted_widths)
+        while self.boundaries[-1] < n:
+            start = self.boundaries[-1]
+            # the widths grow along the sorted order: shrink the batch until its last (widest) member fits
+            end = min(start + self.max_tokens // sorted_widths[start], n)
+            while (end - start) * sorted_widths[end - 1] > self.max_tokens:
+                end = start + self.max_tokens // sorted_widths[end - 1]
+            self.boundaries.append(end)
+        self.batch_widths = sorted_widths[np.array(self.boundaries[1:], dtype=np.int64) - 1] if n else sorted_widths
+
+    def __len__(self):
+        return len(self.boundaries) - 1
+
+    def __iter__(self):
+        if self.shuffle:
+            order = np.lexsort((self.rng.random(len(self.lengths)), self.widths))
+            batch_order = self.rng.permutation(len(self))
+        else:
+            order = np.argsort(self.widths, kind='stable')
+            batch_order = range(len(self))
+        for batch in batch_order:
+            yield order[self.boundaries[batch]:self.boundaries[batch + 1]].tolist()
+
+    def padding_summary(self):
+        """Share of padding positions with every sample padded to max_len and with the per-batch padding."""
+        n_tokens = int(self.lengths.sum())
+        fixed_positions = len(self.lengths) * self.max_len
+        bucketed_positions = int((np.diff(self.boundaries) * self.batch_widths).sum())
+        return {
+            'n_batches': len(self),
+            'padding_fraction_max_len': 1 - n_tokens / max(fixed_positions, 1),
+            'padding_fraction_bucketed': 1 - n_tokens / max(bucketed_positions, 1),
+            'positions_saved_fraction': 1 - bucketed_positions / max(fixed_positions, 1),
+        }
+
+    def padding_report(self):
+        summary = self.padding_summary()
+        return (f"{summary['n_batches']} batches of <= {self.max_tokens} tokens: padding {summary['padding_fraction_max_len']:.1%} "
+                f"of the positions at max_len {self.max_len}, {summary['padding_fraction_bucketed']:.1%} with length "
+                f"buckets ({summary['positions_saved_fraction']:.1%} fewer positions)")
+
+
+class MLMMaskingCollator:
+    """Collate function that masks every batch anew (dynamic masking), for an AminoAcidDataset built without labels.
+    Each residue is selected with mask_probability; a selected residue becomes [MASK] with probability 0.8, a random
+    amino acid with 0.1 and stays unchanged with 0.1. The labels are the original ids at the selected positions, -100
+    elsewhere.
+
+    The random generator is created in the process that collates: in a DataLoader worker it is seeded from the
+    worker's seed (which the DataLoader derives from the main process RNG, so it differs per worker and per epoch and
+    follows torch.manual_seed), combined with seed if given; without workers once from seed, or from the torch RNG.
+    collate_fn stacks the samples before masking (e.g. PadToLongestCollator(), default: plain stacking)."""
+
+    def __init__(self, aa_to_id, mask_probability=0.15, seed=None, mask_fraction=0.8, random_fraction=0.1, collate_fn=None):
+        self.collate_fn = collate_fn or torch.utils.data.default_collate
+        self.mask_probability = mask_probability
+        self.mask_fraction = mask_fraction
+        self.random_fraction = random_fraction
+        self.seed = seed
+        self.mask_id = aa_to_id['[MASK]']
+        self.non_residue_ids = torch.tensor([aa_to_id['[PAD]'], aa_to_id['[CLS]'], aa_to_id['[SEP]']])
+        self.residue_ids = torch.tensor(sorted(token_id for token, token_id in aa_to_id.items() if token in amino_acids))
+        self._generator = None
+        self._worker_seed = None
+
+    def generator(self):
+        worker_info = torch.utils.data.get_worker_info()
+        worker_seed = worker_info.seed if worker_info is not None else None
+        if self._generator is None or worker_seed != self._worker_seed:
+            if worker_seed is not None:
+                seed = worker_seed if self.seed is None else hash((self.seed, worker_seed)) % 2 ** 63
+            else:
+                seed = int(torch.randint(2 ** 62, (1,))) if self.seed is None else self.seed
+            self._generator = torch.Generator().manual_seed(seed)
+            self._worker_seed = worker_seed
+        return self._generator
+
+    def __call__(self, batch):
+        generator = self.generator()
+        batch = self.collate_fn(batch)
+        input_ids, attention_mask = batch['input_ids'], batch['attention_mask']
+
+        # one uniform draw per position decides both the selection and the replacement
+        draws = torch.rand(input_ids.shape, generator=generator)
+        masked = (draws < self.mask_probability) & ~torch.isin(input_ids, self.non_residue_ids)
+        labels = torch.where(masked, input_ids, torch.full_like(input_ids, -100))
+
+        replace_mask = masked & (draws < self.mask_probability * self.mask_fraction)
+        replace_random = masked & ~replace_mask & \
+            (draws < self.mask_probability * (self.mask_fraction + self.random_fraction))
+        random_ids = self.residue_ids[torch.randint(len(self.residue_ids), input_ids.shape, generator=generator)]
+        input_ids = torch.where(replace_mask, torch.full_like(input_ids, self.mask_id), input_ids)
+        input_ids = torch.where(replace_random, random_ids, input_ids)
+        return {'input_ids': input_ids, 'attention_mask': attention_mask, 'labels': labels}
+
 
 class AminoAcidDataset(torch.utils.data.Dataset):
     def __init__(self, sequences, masks, labels=None):
@@ -90,35 +277,45 @@ class AminoAcidDataset(torch.utils.data.Dataset):
 
 
 
-max_len = 160
+if __name__ == '__main__':
+    training_sequences = load_sequences('/ibmm_data2/oas_database/paired_lea_tmp/light_model/data/training_set_test.txt')
+    test_sequences = load_sequences('/ibmm_data2/oas_database/paired_lea_tmp/light_model/data/test_set_test.txt')
+
+    max_len = 160
 
-#tokenized_training_sequences = tokenize_and_mask_sequences(training_sequences, aa_to_id, max_len=128)
-#tokenized_test_sequences = tokenize_and_mask_sequences(test_sequences, aa_to_id, max_len=128)
+    #tokenized_training_sequences = tokenize_and_mask_sequences(training_sequences, aa_to_id, max_len=128)
+    #tokenized_test_sequences = tokenize_and_mask_sequences(test_sequences, aa_to_id, max_len=128)
 
-tokenized_training_sequences, training_labels, training_masks = tokenize_and_mask_sequences(training_sequences, aa_to_id, max_len=max_len)
-tokenized_test_sequences, test_labels, test_masks = tokenize_and_mask_sequences(test_sequences, aa_to_id, max_len=max_len)
+    tokenized_training_sequences, training_masks = tokenize_sequences_np(training_sequences, aa_to_id, max_len=max_len)
+    tokenized_test_sequences, test_labels, test_masks = tokenize_and_mask_sequences_np(test_sequences, aa_to_id, max_len=max_len, seed=0)
 
 
-# # Find the minimum and maximum sequence lengths
-# min_length = min(len(seq) for seq in tokenized_training_sequences)
-# max_length = max(len(seq) for seq in tokenized_training_sequences)
+    # # Find the minimum and maximum sequence lengths
+    # min_length = min(len(seq) for seq in tokenized_training_sequences)
+    # max_length = max(len(seq) for seq in tokenized_training_sequences)
 
-# print(f"Minimum sequence length: {min_length}")
-# print(f"Maximum sequence length: {max_length}")
+    # print(f"Minimum sequence length: {min_length}")
+    # print(f"Maximum sequence length: {max_length}")
 
-# # Ensure all sequences are of the expected max length
-# assert all(len(seq) == max_len for seq in tokenized_training_sequences), "Not all sequences are of the expected maximum length."
+    # # Ensure all sequences are of the expected max length
+    # assert all(len(seq) == max_len for seq in tokenized_training_sequences), "Not all sequences are of the expected maximum length."
 
 
-# Create dataset instances
-#train_dataset = AminoAcidDataset(tokenized_training_sequences)
-#test_dataset = AminoAcidDataset(tokenized_test_sequences)
+    # Create dataset instances
+    #train_dataset = AminoAcidDataset(tokenized_training_sequences)
+    #test_dataset = AminoAcidDataset(tokenized_test_sequences)
 
-# Adjusted to include attention masks
-#train_dataset = AminoAcidDataset(tokenized_training_sequences, training_masks)
-test_dataset = AminoAcidDataset(tokenized_test_sequences, test_masks, test_labels)
-train_dataset = AminoAcidDataset(tokenized_training_sequences, training_masks, training_labels)
+    # Adjusted to include attention masks
+    #train_dataset = AminoAcidDataset(tokenized_training_sequences, training_masks)
+    test_dataset = AminoAcidDataset(tokenized_test_sequences, test_masks, test_labels)
+    train_dataset = AminoAcidDataset(tokenized_training_sequences, training_masks)
 
-train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True)
-test_loader = DataLoader(test_dataset, batch_size=32, shuffle=False)
+    # batches of similar lengths padded to their longest sequence, about 32 * max_len tokens each
+    train_sampler = LengthBucketBatchSampler(training_masks.sum(axis=1), max_tokens=32 * max_len, max_len=max_len)
+    test_sampler = LengthBucketBatchSampler(test_masks.sum(axis=1), max_tokens=32 * max_len, max_len=max_len, shuffle=False)
+    print(f"Training set: {train_sampler.padding_report()}")
+    print(f"Test set: {test_sampler.padding_report()}")
 
+    train_loader = DataLoader(train_dataset, batch_sampler=train_sampler,
+                              collate_fn=MLMMaskingCollator(aa_to_id, collate_fn=PadToLongestCollator()))
+    test_loader = DataLoader(test_dataset, batch_sampler=test_sampler, collate_fn=PadToLongestCollator())
@@ -3,7 +3,8 @@ import torch.optim as optim
 from transformers import BertForMaskedLM
 from transformers import BertModel, BertConfig
 from transformers import AdamW
-from tokenization import AminoAcidDataset, tokenize_and_mask_sequences, load_sequences
+from tokenization import AminoAcidDataset, LengthBucketBatchSampler, MLMMaskingCollator, PadToLongestCollator, tokenize_and_mask_sequences_np, load_sequences
+from pretokenized_dataset import PretokenizedCollator, PretokenizedDataset, load_or_compile
 from torch.utils.data import Dataset, DataLoader
 
 # Check if CUDA (GPU support) is available and set the device accordingly
@@ -29,11 +30,14 @@ max_len = 128
 #training_sequences = load_sequences('/ibmm_data2/oas_database/paired_lea_tmp/light_model/data/training_set_light_seq_70_pident_subset.txt')
 #test_sequences = load_sequences('/ibmm_data2/oas_database/paired_lea_tmp/light_model/data/test_set_light_seq_70_pident_subset.txt')
 
-training_sequences = load_sequences('/ibmm_data2/oas_database/paired_lea_tmp/light_model/data/training_set_light_seq_70_pident.txt')
+# the training set is tokenized once into a memory-mapped store next to the text file (pretokenized_dataset.py),
+# later runs only map it
+training_store = load_or_compile('/ibmm_data2/oas_database/paired_lea_tmp/light_model/data/training_set_light_seq_70_pident.txt')
 test_sequences = load_sequences('/ibmm_data2/oas_database/paired_lea_tmp/light_model/data/test_set_light_seq_70_pident.txt')
 
-tokenized_training_sequences, training_labels, training_masks = tokenize_and_mask_sequences(training_sequences, aa_to_id, max_len=max_len)
-tokenized_test_sequences, test_labels, test_masks = tokenize_and_mask_sequences(test_sequences, aa_to_id, max_len=max_len)
+# training sequences are masked per batch by the collator (new masked positions every epoch),
+# the test set keeps one fixed masking so that the evaluations are comparable
+tokenized_test_sequences, test_labels, test_masks = tokenize_and_mask_sequences_np(test_sequences, aa_to_id, max_len=max_len, seed=0)
 
 # Create dataset instances
 # train_dataset = AminoAcidDataset(tokenized_training_sequences, training_masks)
@@ -43,10 +47,19 @@ tokenized_test_sequences, test_labels, test_masks = tokenize_and_mask_sequences(
 # test_loader = DataLoader(test_dataset, batch_size=32, shuffle=False)
 
 test_dataset = AminoAcidDataset(tokenized_test_sequences, test_masks, test_labels)
-train_dataset = AminoAcidDataset(tokenized_training_sequences, training_masks, training_labels)
-
-train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True)
-test_loader = DataLoader(test_dataset, batch_size=32, shuffle=False)
+train_dataset = PretokenizedDataset(training_store)
+
+# length buckets padded to the longest sequence of the batch (multiple of 8) instead of max_len,
+# with at most the 32 * max_len tokens of a fixed batch
+train_sampler = LengthBucketBatchSampler(train_dataset.lengths(max_len), max_tokens=32 * max_len, max_len=max_len)
+test_sampler = LengthBucketBatchSampler(test_masks.sum(axis=1), max_tokens=32 * max_len, max_len=max_len, shuffle=False)
+print(f"Training set: {train_sampler.padding_report()}")
+print(f"Test set: {test_sampler.padding_report()}")
+
+train_loader = DataLoader(train_dataset, batch_sampler=train_sampler,
+                          collate_fn=MLMMaskingCollator(aa_to_id, mask_probability=0.15,
+                                                         collate_fn=PretokenizedCollator(train_dataset.special_ids, max_len)))
+test_loader = DataLoader(test_dataset, batch_sampler=test_sampler, collate_fn=PadToLongestCollator())
 
 # Step 1: Custom Token Embeddings
 # Since BERT is pre-trained with a specific vocabulary (English words and subwords), 
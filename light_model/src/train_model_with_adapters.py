@@ -4,7 +4,8 @@ from transformers import BertTokenizer, BertForMaskedLM, AdamW
 from adapters import AdapterConfig, AutoAdapterModel
 
 # Assuming tokenization and dataset preparation functions are defined elsewhere
-from tokenization import AminoAcidDataset, tokenize_and_mask_sequences, load_sequences
+from tokenization import AminoAcidDataset, MLMMaskingCollator, tokenize_and_mask_sequences_np, load_sequences
+from pretokenized_dataset import PretokenizedCollator, PretokenizedDataset, load_or_compile
 
 # Define device
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -18,10 +19,12 @@ aa_to_id.update(special_tokens)
 
 
 # Load and prepare data
-training_sequences = load_sequences('/ibmm_data2/oas_database/paired_lea_tmp/light_model/data/training_set_test.txt')
-tokenized_training_sequences, training_labels, training_masks = tokenize_and_mask_sequences(training_sequences, aa_to_id, max_len=128)
-train_dataset = AminoAcidDataset(tokenized_training_sequences, training_masks, training_labels)
-train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True)
+# tokenized once into a memory-mapped store next to the text file (pretokenized_dataset.py)
+train_dataset = PretokenizedDataset(load_or_compile('/ibmm_data2/oas_database/paired_lea_tmp/light_model/data/training_set_test.txt'))
+# masked per batch, so every epoch sees other masked positions
+train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True,
+                          collate_fn=MLMMaskingCollator(aa_to_id, mask_probability=0.15,
+                                                        collate_fn=PretokenizedCollator(train_dataset.special_ids, max_len=128)))
 
 # Initialize the tokenizer and model
 tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
@@ -59,7 +62,7 @@ for epoch in range(3):  # Number of epochs
     print(f"Epoch {epoch+1}, Loss: {total_loss / len(train_loader)}")
 
 test_sequences = load_sequences('/ibmm_data2/oas_database/paired_lea_tmp/light_model/data/test_set_test.txt')
-tokenized_test_sequences, test_labels, test_masks = tokenize_and_mask_sequences(test_sequences, aa_to_id, max_len=128)
+tokenized_test_sequences, test_labels, test_masks = tokenize_and_mask_sequences_np(test_sequences, aa_to_id, max_len=128, seed=0)
 
 test_dataset = AminoAcidDataset(tokenized_test_sequences, test_masks, test_labels)
 test_loader = DataLoader(test_dataset, batch_size=32, shuffle=False)
@@ -1,21 +1,42 @@
 """
 This code processes a TSV dataset containing cluster and sequence IDs. 
-It extract the clusters from the clustered 50% pident data (*cluster.tsv), sorts them by size, and allocates sequences to training, validation, and test sets based on specified percentages.
+It extract the clusters from the clustered 50% pident data (*cluster.tsv) and allocates whole clusters to training, validation, and test sets based on specified percentages.
 The script logs information about the dataset, cluster count, and sequence count.
-It then populates train_sequences, val_sequences, and test_sequences lists while maintaining entire clusters in each set. Bigger cluster are kept for the training set.
-The log includes counts of sequences allocated to each set (iga and igg) and the intended sizes.
+The clusters are allocated by split_allocator.py: by default (binpack) from the biggest to the smallest cluster, each going to the set that is furthest below its target, so bigger clusters are kept for the training set and all three sets reach their intended sizes.
+With --stratify_file (e.g. rowid,v_call) every stratum of the centroids is split with the same percentages. The allocation is reproducible for a given --seed.
+The log includes counts of sequences allocated to each set and the realized and intended fractions.
 """
-import random
-import subprocess
-from collections import defaultdict
+import json
+import os
+import sys
 import argparse
 import logging
 
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from cluster_table import ClusterTable, CodeLookup
+from fasta_index import FastaIndex
+from partition_fasta import partition_records
+from split_allocator import SPLITS, allocate_clusters, read_strata, split_summary
+
 # Set up command line argument parsing
 parser = argparse.ArgumentParser(description='')
 parser.add_argument("--tsv_dataset", help="Path to the TSV dataset file", type=str)
+parser.add_argument("--cluster_table", help="Prefix of a saved cluster table (cluster_table.py), used instead of --tsv_dataset", type=str)
+parser.add_argument("--save_cluster_table", help="Save the cluster table of --tsv_dataset under this prefix for later runs", type=str)
 parser.add_argument("--rep_fasta_file", help="Path to the representative FASTA file", type=str)
 parser.add_argument("--prefix", help="Prefix for output files", type=str, default='CDRH3')
+parser.add_argument("--fasta_index", help="Retrieve the sequences through the offset index of the FASTA (fasta_index.py)", action='store_true')
+parser.add_argument("--output_format", help="Format of the sequence files: fasta, seq (sequence only) or sep (heavy[SEP]light, needs --pair_csv)", type=str, choices=['fasta', 'seq', 'sep'], default='fasta')
+parser.add_argument("--train_percentage", help="Fraction of the sequences for the training set", type=float, default=0.8)
+parser.add_argument("--val_percentage", help="Fraction of the sequences for the validation set", type=float, default=0.1)
+parser.add_argument("--test_percentage", help="Fraction of the sequences for the test set", type=float, default=0.1)
+parser.add_argument("--split_method", help="Cluster allocation: binpack (default), random order or fill (train, then val, rest to test)", type=str, choices=['binpack', 'random', 'fill'], default='binpack')
+parser.add_argument("--seed", help="Seed of the allocation", type=int, default=42)
+parser.add_argument("--stratify_file", help="Delimited file with sequence ID and label (e.g. rowid,v_call), the label of the centroid is the stratum of its cluster", type=str)
+parser.add_argument("--stratify_column", help="0-based label column of --stratify_file", type=int, default=1)
+parser.add_argument("--pair_csv", help="CSV with id,heavy,light columns, used instead of the representative FASTA for --output_format sep", type=str)
 
 args = parser.parse_args()
 
@@ -23,6 +44,9 @@ args = parser.parse_args()
 main_dataset = args.tsv_dataset
 rep_fasta_file = args.rep_fasta_file
 data_prefix = args.prefix
+use_fasta_index = args.fasta_index
+output_format = args.output_format
+pair_csv = args.pair_csv
 
 # Configure logging
 logging.basicConfig(filename='train_val_test_split.log', level=logging.INFO,
@@ -30,54 +54,55 @@ logging.basicConfig(filename='train_val_test_split.log', level=logging.INFO,
 
 logging.info(f'DATASET: {main_dataset}')
 
-# Function to retrieve sequences using awk
-def retrieve_fasta_sequences(id_file, fasta_file, output_file):
-    command = f"""awk 'NR==FNR {{ ids[$1]=1; next }} /^>/ {{ f=substr($0,2) in ids }} f' {id_file} {fasta_file} > {output_file}"""
-    subprocess.run(command, shell=True, check=True)
+# Function to retrieve sequences through the offset index, only the requested records are read
+def retrieve_fasta_sequences_with_index(fasta_index, sequence_ids, output_file):
+    with open(output_file, 'wb') as f:
+        fasta_index.write_records(sequence_ids, f)
 
 
-# Load the TSV dataset and create a dictionary of clusters
-cluster_data = defaultdict(list)
-with open(main_dataset, 'r') as tsv_file:
-    for line in tsv_file:
-        cluster_id, sequence_id = line.strip().split('\t')
-        cluster_data[cluster_id].append(sequence_id)
+# Load the clusters as a compact table (integer codes in CSR layout)
+if args.cluster_table:
+    cluster_table = ClusterTable.load(args.cluster_table)
+else:
+    cluster_table = ClusterTable.from_tsv(main_dataset)
+    if args.save_cluster_table:
+        cluster_table.save(args.save_cluster_table)
 
-logging.info("Total clusters (# centroids): %d", len(cluster_data))
-
-# Sort clusters by size in descending order
-seed = 42  # Set your seed for reproducibility
-random.seed(seed)
-sorted_clusters = sorted(cluster_data.items(), key=lambda x: len(x[1]), reverse=True)
+logging.info("Total clusters (# centroids): %d", cluster_table.n_clusters)
 
 # Set percentages for train, validation, and test sets
-train_percentage = 0.8
-val_percentage = 0.1
-test_percentage = 0.1
+train_percentage = args.train_percentage
+val_percentage = args.val_percentage
+test_percentage = args.test_percentage
+fractions = (train_percentage, val_percentage, test_percentage)
 
 # Count total number of sequences
-line_count = sum(len(v) for v in cluster_data.values())
+cluster_sizes = cluster_table.sizes().tolist()
+line_count = cluster_table.n_sequences
 logging.info(f'Total sequences: {line_count}')
+logging.info(f'Intended sizes: train {line_count * train_percentage:.0f}, val {line_count * val_percentage:.0f}, test {line_count * test_percentage:.0f}')
+
+# Allocate whole clusters to each set
+strata = read_strata(args.stratify_file, cluster_table.id_strings(cluster_table.centroids), label_column=args.stratify_column) if args.stratify_file else None
+assignment = allocate_clusters(cluster_sizes, fractions, seed=args.seed, method=args.split_method, strata=strata)
+logging.info(f'Allocation: {args.split_method} (seed {args.seed}){" stratified by " + args.stratify_file if strata else ""}')
 
-# Calculate number of sequences for each set
-n_train_sequences = line_count * train_percentage
-n_val_sequences = line_count * val_percentage
-n_test_sequences = line_count * test_percentage
-
-# Allocate sequences to each set, keeping entire clusters together
-train_sequences, val_sequences, test_sequences = [], [], []
-for cluster_id, sequences in sorted_clusters:
-    if len(train_sequences) + len(sequences) <= n_train_sequences:
-        train_sequences.extend(sequences)
-    elif len(val_sequences) + len(sequences) <= n_val_sequences:
-        val_sequences.extend(sequences)
-    else:
-        test_sequences.extend(sequences)
+# split of every member, and of every ID code for the sequence retrieval
+member_split = np.repeat(np.frombuffer(assignment, dtype=np.int8), cluster_table.sizes())
+split_of_code = np.full(len(cluster_table.ids), -1, dtype=np.int8)
+split_of_code[cluster_table.members] = member_split
+train_sequences, val_sequences, test_sequences = (cluster_table.id_strings(cluster_table.members[member_split == split])
+                                                  for split in range(len(SPLITS)))
 
 # Logging the distribution
 logging.info('TRAIN: Number of sequences %d', len(train_sequences))
 logging.info('VAL: Number of sequences %d', len(val_sequences))
 logging.info('TEST: Number of sequences %d', len(test_sequences))
+summary = split_summary(cluster_sizes, assignment, fractions, strata)
+for name in SPLITS:
+    logging.info('%s: realized fraction %.4f (target %.4f)', name.upper(), summary['all'][name]['realized'], summary['all'][name]['target'])
+if strata is not None:
+    logging.info('Realized fractions per stratum: %s', json.dumps(summary['strata']))
 
 # Function to write IDs to file
 def write_to_file(filename, data):
@@ -99,9 +124,18 @@ write_to_file(val_ids, val_sequences)
 write_to_file(test_ids, test_sequences)
 
 # Retrieve the sequences for each set
-retrieve_fasta_sequences(train_ids, rep_fasta_file, train_file)
-retrieve_fasta_sequences(val_ids, rep_fasta_file, val_file)
-retrieve_fasta_sequences(test_ids, rep_fasta_file, test_file)
+if use_fasta_index and output_format == 'fasta':
+    with FastaIndex(rep_fasta_file) as fasta_index:
+        retrieve_fasta_sequences_with_index(fasta_index, train_sequences, train_file)
+        retrieve_fasta_sequences_with_index(fasta_index, val_sequences, val_file)
+        retrieve_fasta_sequences_with_index(fasta_index, test_sequences, test_file)
+else:
+    # one pass over the representative FASTA (or the pair CSV) routes every record to its set
+    id_to_split = CodeLookup(cluster_table, split_of_code, SPLITS)
+    counts = partition_records(pair_csv or rep_fasta_file, id_to_split,
+                               {'train': train_file, 'val': val_file, 'test': test_file},
+                               output_format=output_format, input_format='pair_csv' if pair_csv else 'fasta')
+    logging.info('Retrieved sequences: %s', counts)
 
 logging.info('Sequence retrieval completed.')
 
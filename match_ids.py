@@ -0,0 +1,95 @@
+"""
+Multi-process ID join: keep the lines of a large CSV export (e.g. rowid,cdr3_aa,sequence_alignment_aa) whose first
+column is in a file of IDs (e.g. the centroid rowids of a clustering). Replaces match_ids.jl.
+
+The data file is cut into chunks of --chunk_size bytes at line boundaries. Every worker process reads its chunk itself
+(only offsets are sent), parses only the first column of every line and tests it against the ID set, which the workers
+inherit from the parent (fork) instead of receiving a copy per task. The matches are written in the order of the
+data file; at most 2 * workers chunks are in flight.
+
+Example:
+python match_ids.py --ids centroids_ids_cdrl3_aa_70_human_unpaired.txt \
+    --data Bcells_subset_human_unpaired_light_cdr3_light_seq_3_rowid.txt --output matched_rows_cdrl3_unpaired.txt --workers 16
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from extract_lines import BUFFER_SIZE, read_keys
+
+# the IDs to match, set before the worker processes are forked
+_IDS = set()
+
+
+def chunk_boundaries(data_path, chunk_size):
+    """Yield (start, end) byte ranges of whole lines of roughly chunk_size bytes."""
+    file_size = os.path.getsize(data_path)
+    with open(data_path, 'rb') as f:
+        start = 0
+        while start < file_size:
+            f.seek(min(start + chunk_size, file_size))
+            f.readline()
+            end = min(f.tell(), file_size)
+            yield start, end
+            start = end
+
+
+def match_chunk(data_path, start, end, separator):
+    """The lines of data_path[start:end] whose first column is in _IDS. Returns (matched bytes, n lines, n matches)."""
+    with open(data_path, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).splitlines(keepends=True)
+    ids = _IDS
+    matched = [line for line in lines if line.split(separator, 1)[0].strip() in ids]
+    if matched and not matched[-1].endswith(b'\n'):
+        matched[-1] += b'\n'
+    return b''.join(matched), len(lines), len(matched)
+
+
+def match_ids(ids_path, data_path, output_path, separator=',', workers=None, chunk_size=64 * 1024 * 1024):
+    """Write the lines of data_path whose first column is listed in ids_path. Returns the number of matched lines."""
+    _IDS.clear()
+    _IDS.update(read_keys(ids_path))
+    workers = workers or os.cpu_count()
+    separator = separator.encode()
+    start_time = time.perf_counter()
+    n_lines = n_matched = 0
+    pending = deque()
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor, \
+            open(output_path, 'wb', buffering=BUFFER_SIZE) as output_file:
+        def write_oldest():
+            nonlocal n_lines, n_matched
+            matched, chunk_lines, chunk_matched = pending.popleft().result()
+            output_file.write(matched)
+            n_lines += chunk_lines
+            n_matched += chunk_matched
+
+        for start, end in chunk_boundaries(data_path, chunk_size):
+            pending.append(executor.submit(match_chunk, data_path, start, end, separator))
+            if len(pending) >= 2 * workers:
+                write_oldest()
+        while pending:
+            write_oldest()
+    elapsed = time.perf_counter() - start_time
+    n_bytes = os.path.getsize(data_path)
+    print(f"Matched {n_matched} of {n_lines} lines against {len(_IDS)} IDs in {elapsed:.1f} s "
+          f"({n_bytes / max(elapsed, 1e-9) / 1e6:.0f} MB/s, {workers} workers)")
+    _IDS.clear()
+    return n_matched
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Keep the lines of a CSV whose first column is in a list of IDs (parallel)')
+    parser.add_argument("--ids", help="File with the IDs, one per line", type=str, required=True)
+    parser.add_argument("--data", help="CSV file, the ID is the first column", type=str, required=True)
+    parser.add_argument("--output", help="Output file with the matching lines (in data file order)", type=str, required=True)
+    parser.add_argument("--separator", help="Column separator of the data file", type=str, default=',')
+    parser.add_argument("--workers", help="Number of worker processes (default: all CPUs)", type=int)
+    parser.add_argument("--chunk_size", help="Bytes per chunk", type=int, default=64 * 1024 * 1024)
+    args = parser.parse_args()
+
+    match_ids(args.ids, args.data, args.output, separator=args.separator, workers=args.workers, chunk_size=args.chunk_size)
@@ -0,0 +1,110 @@
+"""
+Python version of mmseqs_linclust.sh / mmseqs_linclust_2.sh for a sweep over several identity thresholds.
+The sequence DB is created once (and reused on later runs if it is newer than the FASTA), all thresholds share one tmp
+directory that is kept between runs so linclust can reuse its intermediate results, and the thresholds can run in parallel.
+Wall time and peak RSS of every mmseqs call and the cluster statistics of every threshold (cluster_stats.py)
+are written to a JSON log instead of the free-text log.
+
+Example (same settings as mmseqs_linclust_2.sh):
+python mmseqs_linclust_sweep.py all_human_paired_cdr3_aa --thresholds 70 80 90 99 --parallel 2 --threads 16 \
+    --linclust_args "--kmer-per-seq 5 -k 6 --spaced-kmer-mode 1 --spaced-kmer-pattern 11011101 --sub-mat VTML40.out --gap-open 16 --gap-extend 2"
+"""
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cluster_stats import cluster_stats
+
+
+def run_timed(command):
+    """Run a command and return its wall time (s) and peak RSS (MB)."""
+    print(" ".join(command), flush=True)
+    start = time.perf_counter()
+    process = subprocess.Popen(command)
+    # wait4 returns the resource usage of exactly this child, also when several thresholds run in parallel
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall_time = time.perf_counter() - start
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return {'command': " ".join(command), 'wall_time_s': round(wall_time, 2), 'peak_rss_mb': round(rusage.ru_maxrss / 1024, 1)}
+
+
+def count_fasta_sequences(fasta_path):
+    """Number of records in a FASTA file."""
+    with open(fasta_path, 'rb') as f:
+        return sum(1 for line in f if line.startswith(b'>'))
+
+
+def create_db(db, output_dir):
+    """Create the mmseqs sequence DB once, it is reused if it is newer than the FASTA."""
+    fasta_path = f"{db}.fasta"
+    seq_db = os.path.join(output_dir, os.path.basename(db))
+    if os.path.exists(seq_db) and os.path.getmtime(seq_db) >= os.path.getmtime(fasta_path):
+        print(f"Reusing sequence DB {seq_db}")
+        return seq_db, None
+    return seq_db, run_timed(['mmseqs', 'createdb', fasta_path, seq_db])
+
+
+def run_threshold(seq_db, output_dir, db, pident, tmp_dir, threads=None, linclust_args=''):
+    """Cluster seq_db at pident % identity and export the representatives (FASTA) and the cluster TSV."""
+    prefix = os.path.join(output_dir, f"{os.path.basename(db)}_{pident}")
+    thread_args = ['--threads', str(threads)] if threads else []
+    steps = [
+        ['mmseqs', 'linclust', seq_db, f"{prefix}_clu", tmp_dir, '--min-seq-id', str(pident / 100)]
+        + shlex.split(linclust_args) + thread_args,
+        ['mmseqs', 'createsubdb', f"{prefix}_clu", seq_db, f"{prefix}_clu_rep"],
+        ['mmseqs', 'convert2fasta', f"{prefix}_clu_rep", f"{prefix}_clu_rep.fasta"],
+        ['mmseqs', 'createtsv', seq_db, seq_db, f"{prefix}_clu", f"{prefix}_clu.tsv"] + thread_args,
+    ]
+    start = time.perf_counter()
+    step_logs = [run_timed(step) for step in steps]
+    wall_time = time.perf_counter() - start
+    return {
+        'pident': pident,
+        'min_seq_id': pident / 100,
+        'wall_time_s': round(wall_time, 2),
+        'peak_rss_mb': max(step['peak_rss_mb'] for step in step_logs),
+        'cluster_tsv': f"{prefix}_clu.tsv",
+        'rep_fasta': f"{prefix}_clu_rep.fasta",
+        'steps': step_logs,
+        'cluster_stats': cluster_stats(prefix),
+    }
+
+
+def linclust_sweep(db, thresholds, output_dir, tmp_dir=None, parallel=1, threads=None, linclust_args=''):
+    """Run the whole sweep and write <output_dir>/<db>_mmseqs_linclust.json. Returns the log dict."""
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_dir = tmp_dir or os.path.join(output_dir, 'tmp')
+    log = {'db': db, 'n_sequences': count_fasta_sequences(f"{db}.fasta"), 'linclust_args': linclust_args}
+    seq_db, log['createdb'] = create_db(db, output_dir)
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = [executor.submit(run_threshold, seq_db, output_dir, db, pident, tmp_dir, threads, linclust_args)
+                   for pident in thresholds]
+        log['thresholds'] = [future.result() for future in futures]
+
+    log_file = os.path.join(output_dir, f"{os.path.basename(db)}_mmseqs_linclust.json")
+    with open(log_file, 'w') as f:
+        json.dump(log, f, indent=2)
+    print(f"Log saved to: {log_file}")
+    return log
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='mmseqs linclust over several identity thresholds with one shared sequence DB')
+    parser.add_argument("db", help="Name of the DB, the input is <db>.fasta", type=str)
+    parser.add_argument("--thresholds", help="Identity thresholds in percent", nargs='+', type=int, default=[70, 80, 90, 100])
+    parser.add_argument("--output_dir", help="Output directory", type=str, default='./linclust_mmseq_output')
+    parser.add_argument("--tmp_dir", help="Shared mmseqs tmp directory (default: <output_dir>/tmp, kept between runs)", type=str)
+    parser.add_argument("--parallel", help="Number of thresholds clustered at the same time", type=int, default=1)
+    parser.add_argument("--threads", help="--threads passed to mmseqs", type=int)
+    parser.add_argument("--linclust_args", help="Additional arguments for mmseqs linclust", type=str, default='')
+    args = parser.parse_args()
+
+    linclust_sweep(args.db, args.thresholds, args.output_dir, tmp_dir=args.tmp_dir, parallel=args.parallel,
+                   threads=args.threads, linclust_args=args.linclust_args)
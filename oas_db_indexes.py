@@ -0,0 +1,146 @@
+"""
+Manage the secondary indexes on the OAS SQLite tables that are filtered by CDR3, sequence ID, V gene or B cell type
+(filter_seqs_with_sqlite.py, export_csv.sh, the EDA notebooks). Without them every such lookup is a full table scan.
+
+Commands:
+create   create the curated indexes (CREATE INDEX IF NOT EXISTS, tables/columns missing in the db are skipped)
+list     list all indexes on the curated tables
+drop     drop the curated indexes
+analyze  run ANALYZE on the curated tables so the query planner has statistics
+explain  print EXPLAIN QUERY PLAN for the canonical queries, to check that they use an index instead of a SCAN
+
+Example:
+python oas_db_indexes.py --db /ibmm_data2/oas_database/OAS_2.db create
+python oas_db_indexes.py --db /ibmm_data2/oas_database/OAS_2.db explain
+"""
+import argparse
+import sqlite3
+import time
+
+# table -> columns that get an index idx_<table>_<column>
+CURATED_INDEXES = {
+    'healthy_paired': ['cdr3_aa_heavy', 'sequence_id_heavy', 'v_call_heavy', 'BType'],
+    'all_human_paired': ['cdr3_aa_heavy', 'sequence_id_heavy_light', 'v_call_heavy'],
+    'Bcells_subset_human_unpaired_light': ['cdr3_aa', 'sequence_id', 'v_call'],
+    'Bcells_subset_human_unpaired_heavy': ['cdr3_aa', 'sequence_id', 'v_call'],
+}
+
+# canonical lookups of the repo, one per curated index plus the rowid lookups
+CANONICAL_QUERIES = [
+    "SELECT sequence_heavy FROM healthy_paired WHERE BType = ?",
+    "SELECT * FROM healthy_paired WHERE cdr3_aa_heavy = ?",
+    "SELECT * FROM healthy_paired WHERE sequence_id_heavy = ?",
+    "SELECT * FROM healthy_paired WHERE v_call_heavy = ?",
+    "SELECT * FROM healthy_paired WHERE ROWID = ?",
+    "SELECT sequence_id_heavy_light, sequence_alignment_aa_heavy, sequence_alignment_aa_light, sequence_alignment_aa_full, "
+    "cdr3_aa_heavy FROM all_human_paired WHERE cdr3_aa_heavy = ?",
+    "SELECT * FROM all_human_paired WHERE sequence_id_heavy_light = ?",
+    "SELECT * FROM all_human_paired WHERE v_call_heavy = ?",
+    "SELECT rowid, cdr3_aa, sequence_alignment_aa FROM Bcells_subset_human_unpaired_light WHERE cdr3_aa = ?",
+    "SELECT * FROM Bcells_subset_human_unpaired_light WHERE sequence_id = ?",
+    "SELECT * FROM Bcells_subset_human_unpaired_light WHERE v_call = ?",
+    "SELECT rowid, cdr3_aa, sequence_alignment_aa FROM Bcells_subset_human_unpaired_light WHERE rowid = ?",
+    "SELECT rowid, cdr3_aa, sequence_alignment_aa FROM Bcells_subset_human_unpaired_heavy WHERE cdr3_aa = ?",
+    "SELECT * FROM Bcells_subset_human_unpaired_heavy WHERE sequence_id = ?",
+    "SELECT * FROM Bcells_subset_human_unpaired_heavy WHERE v_call = ?",
+]
+
+
+def index_name(table_name, column):
+    """Name of the curated index on table_name(column)."""
+    return f"idx_{table_name}_{column}"
+
+
+def get_table_columns(conn, table_name):
+    """Return the column names of a table (empty if the table does not exist)."""
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table_name});")]
+
+
+def curated_indexes(conn, tables=None):
+    """Yield (table, column) of the curated indexes whose table and column exist in the database."""
+    for table_name, columns in CURATED_INDEXES.items():
+        if tables and table_name not in tables:
+            continue
+        existing_columns = get_table_columns(conn, table_name)
+        if not existing_columns:
+            print(f"{table_name}: not in the database, skipped")
+            continue
+        for column in columns:
+            if column in existing_columns:
+                yield table_name, column
+            else:
+                print(f"{table_name}: no column {column}, skipped")
+
+
+def create_indexes(conn, tables=None):
+    """Create the curated indexes that are missing."""
+    for table_name, column in curated_indexes(conn, tables):
+        start = time.perf_counter()
+        with conn:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name(table_name, column)} ON {table_name}({column});")
+        print(f"{index_name(table_name, column)} ready ({time.perf_counter() - start:.1f} s)")
+
+
+def drop_indexes(conn, tables=None):
+    """Drop the curated indexes."""
+    for table_name, column in curated_indexes(conn, tables):
+        with conn:
+            conn.execute(f"DROP INDEX IF EXISTS {index_name(table_name, column)};")
+        print(f"{index_name(table_name, column)} dropped")
+
+
+def list_indexes(conn, tables=None):
+    """Print all indexes (curated or not) on the curated tables."""
+    for table_name in CURATED_INDEXES:
+        if tables and table_name not in tables:
+            continue
+        for _, name, unique, origin, _ in conn.execute(f"PRAGMA index_list({table_name});").fetchall():
+            columns = [row[2] for row in conn.execute(f"PRAGMA index_info({name});")]
+            print(f"{table_name}: {name} ({', '.join(columns)}){' UNIQUE' if unique else ''}")
+
+
+def analyze_tables(conn, tables=None):
+    """Collect planner statistics for the curated tables."""
+    for table_name in CURATED_INDEXES:
+        if (tables and table_name not in tables) or not get_table_columns(conn, table_name):
+            continue
+        start = time.perf_counter()
+        conn.execute(f"ANALYZE {table_name};")
+        conn.commit()
+        print(f"ANALYZE {table_name} ({time.perf_counter() - start:.1f} s)")
+
+
+def explain_queries(conn, tables=None):
+    """Print the query plan of every canonical query whose table exists, flagging full table scans."""
+    for query in CANONICAL_QUERIES:
+        table_name = query.split(" FROM ")[1].split()[0]
+        if (tables and table_name not in tables) or not get_table_columns(conn, table_name):
+            continue
+        try:
+            plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", ('',))]
+        except sqlite3.OperationalError as e:
+            print(f"{query}\n  skipped: {e}")
+            continue
+        full_scan = any(step.startswith("SCAN") for step in plan)
+        print(f"{query}\n  {'FULL SCAN' if full_scan else 'ok'}: {' / '.join(plan)}")
+
+
+COMMANDS = {
+    'create': create_indexes,
+    'list': list_indexes,
+    'drop': drop_indexes,
+    'analyze': analyze_tables,
+    'explain': explain_queries,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create, list, drop and ANALYZE the secondary indexes on the OAS tables')
+    parser.add_argument("command", help="What to do", choices=list(COMMANDS))
+    parser.add_argument("--db", help="Path to the SQLite database", type=str, required=True)
+    parser.add_argument("--tables", help="Only handle these tables (default: all curated tables)", nargs='+', type=str)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    COMMANDS[args.command](conn, args.tables)
+    conn.close()
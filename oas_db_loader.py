@@ -0,0 +1,262 @@
+"""
+Bulk loader for CSV files into a table of the OAS SQLite database (e.g. healthy_paired in OAS.db).
+Rows are inserted with executemany in batches, every batch is committed as its own transaction.
+Optionally journal_mode=WAL and synchronous=OFF are set for the duration of the load (and restored afterwards).
+The number of inserted rows and the throughput (rows/s) are reported while loading and per file.
+
+Every loaded file is recorded in a manifest table (load_manifest) with its path, checksum, ROWID span and load timestamp,
+and the ROWID range of each committed batch in load_manifest_batches. Loading a file that is already in the manifest is
+a no-op, an interrupted load resumes after the last committed batch and a wrong load can be undone with --rollback (one
+DELETE per recorded batch range, so rows of other files loaded while a load was interrupted are kept).
+
+Example (naive, memory and plasma B cells in one invocation):
+python oas_db_loader.py --db /ibmm_data/oas_database/OAS.db --table healthy_paired --fast_pragmas \
+    /ibmm_data/oas_database/paired/csv_files/no_headers/no_header_OAS_db_paired_healthy_naive_b_cells_2024-02-28.csv \
+    /ibmm_data/oas_database/paired/csv_files/no_headers/no_header_OAS_db_paired_healthy_memory_b_cells_2024-02-28.csv \
+    /ibmm_data/oas_database/paired/csv_files/no_headers/no_header_OAS_db_paired_healthy_plasma_b_cells_2024-02-28.csv
+"""
+import argparse
+import csv
+import hashlib
+import sqlite3
+import time
+from itertools import islice
+
+MANIFEST_TABLE = 'load_manifest'
+BATCHES_TABLE = 'load_manifest_batches'
+
+
+def get_number_of_columns(conn, table_name):
+    """Return the number of columns of a table."""
+    columns_info = conn.execute(f"PRAGMA table_info({table_name});").fetchall()
+    if not columns_info:
+        raise ValueError(f"Table {table_name} does not exist in the database.")
+    return len(columns_info)
+
+
+def set_fast_pragmas(conn):
+    """Switch to WAL journaling and synchronous=OFF, return the previous settings."""
+    old_settings = {
+        'journal_mode': conn.execute("PRAGMA journal_mode;").fetchone()[0],
+        'synchronous': conn.execute("PRAGMA synchronous;").fetchone()[0],
+    }
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=OFF;")
+    return old_settings
+
+
+def restore_pragmas(conn, old_settings):
+    """Restore the settings returned by set_fast_pragmas."""
+    conn.execute(f"PRAGMA journal_mode={old_settings['journal_mode']};")
+    conn.execute(f"PRAGMA synchronous={old_settings['synchronous']};")
+
+
+def create_manifest_table(conn):
+    """Create the manifest table if it does not exist yet."""
+    with conn:
+        conn.execute(f"""CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            table_name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            source_path TEXT NOT NULL,
+            first_rowid INTEGER,
+            last_rowid INTEGER,
+            rows_loaded INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL,
+            loaded_at TEXT NOT NULL,
+            PRIMARY KEY (table_name, checksum));""")
+        conn.execute(f"""CREATE TABLE IF NOT EXISTS {BATCHES_TABLE} (
+            table_name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            first_rowid INTEGER NOT NULL,
+            last_rowid INTEGER NOT NULL);""")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {BATCHES_TABLE}_entry ON {BATCHES_TABLE} (table_name, checksum);")
+
+
+def file_checksum(file_path, block_size=1 << 20):
+    """Return the SHA-256 hex digest of a file."""
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def start_manifest_entry(conn, table_name, source_path, checksum):
+    """Register a load in the manifest. Returns (status, number of rows already committed) of the entry."""
+    create_manifest_table(conn)
+    entry = conn.execute(f"SELECT status, rows_loaded FROM {MANIFEST_TABLE} WHERE table_name = ? AND checksum = ?;",
+                         (table_name, checksum)).fetchone()
+    if entry is not None:
+        return entry
+    with conn:
+        conn.execute(f"INSERT INTO {MANIFEST_TABLE} (table_name, checksum, source_path, status, loaded_at) "
+                     f"VALUES (?, ?, ?, 'loading', datetime('now'));", (table_name, checksum, source_path))
+    return 'loading', 0
+
+
+def record_batch(conn, table_name, checksum, n_rows, first_rowid, last_rowid):
+    """Record the ROWID range of a just inserted batch and extend the span of its manifest entry
+    (call inside the batch transaction)."""
+    conn.execute(f"INSERT INTO {BATCHES_TABLE} (table_name, checksum, first_rowid, last_rowid) VALUES (?, ?, ?, ?);",
+                 (table_name, checksum, first_rowid, last_rowid))
+    conn.execute(f"""UPDATE {MANIFEST_TABLE} SET
+            first_rowid = min(coalesce(first_rowid, ?), ?),
+            last_rowid = max(coalesce(last_rowid, ?), ?),
+            rows_loaded = rows_loaded + ?
+        WHERE table_name = ? AND checksum = ?;""",
+                 (first_rowid, first_rowid, last_rowid, last_rowid, n_rows, table_name, checksum))
+
+
+def finish_manifest_entry(conn, table_name, checksum):
+    """Mark a manifest entry as completely loaded."""
+    with conn:
+        conn.execute(f"UPDATE {MANIFEST_TABLE} SET status = 'done', loaded_at = datetime('now') "
+                     f"WHERE table_name = ? AND checksum = ?;", (table_name, checksum))
+
+
+def rollback_load(conn, table_name, source_path):
+    """Delete all rows loaded from source_path (by the ROWID ranges of its batches) and its manifest entry."""
+    create_manifest_table(conn)
+    checksums = [checksum for checksum, in conn.execute(
+        f"SELECT checksum FROM {MANIFEST_TABLE} WHERE table_name = ? AND source_path = ?;", (table_name, source_path))]
+    n_deleted = 0
+    with conn:
+        for checksum in checksums:
+            batches = conn.execute(f"SELECT first_rowid, last_rowid FROM {BATCHES_TABLE} "
+                                   f"WHERE table_name = ? AND checksum = ?;", (table_name, checksum)).fetchall()
+            for first_rowid, last_rowid in batches:
+                n_deleted += conn.execute(f"DELETE FROM {table_name} WHERE rowid BETWEEN ? AND ?;",
+                                          (first_rowid, last_rowid)).rowcount
+            conn.execute(f"DELETE FROM {BATCHES_TABLE} WHERE table_name = ? AND checksum = ?;", (table_name, checksum))
+            conn.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE table_name = ? AND checksum = ?;", (table_name, checksum))
+    return n_deleted
+
+
+def print_manifest(conn):
+    """Print all entries of the manifest table."""
+    create_manifest_table(conn)
+    for entry in conn.execute(f"SELECT table_name, source_path, first_rowid, last_rowid, rows_loaded, status, loaded_at "
+                              f"FROM {MANIFEST_TABLE} ORDER BY loaded_at;"):
+        print(" | ".join(str(value) for value in entry))
+
+
+def batched(rows, batch_size):
+    """Yield lists of at most batch_size rows."""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def make_insert_query(table_name, number_of_columns):
+    """Return the INSERT statement with one placeholder per column."""
+    return f'INSERT INTO {table_name} VALUES ({",".join(["?"] * number_of_columns)})'
+
+
+def insert_batch(conn, table_name, insert_query, batch, checksum=None):
+    """Insert one batch with executemany as its own transaction (rolled back if an insert fails).
+    If checksum is given, the ROWID range of the batch is recorded in the manifest in the same transaction."""
+    with conn:
+        conn.executemany(insert_query, batch)
+        if checksum is not None:
+            # the first INSERT took the write lock and it is held until the commit, so no other connection inserted
+            # between the rows of the batch: they got consecutive ROWIDs ending at last_insert_rowid()
+            last_rowid = conn.execute("SELECT last_insert_rowid();").fetchone()[0]
+            record_batch(conn, table_name, checksum, len(batch), last_rowid - len(batch) + 1, last_rowid)
+
+
+def insert_rows(conn, table_name, rows, number_of_columns, batch_size=50000, report_every=1000000, checksum=None):
+    """Insert rows with executemany, one transaction per batch. Returns the number of inserted rows.
+    If checksum is given, the manifest entry of that file is updated in the same transaction as each batch."""
+    insert_query = make_insert_query(table_name, number_of_columns)
+    n_rows = 0
+    next_report = report_every
+    start = time.perf_counter()
+    for batch in batched(rows, batch_size):
+        insert_batch(conn, table_name, insert_query, batch, checksum=checksum)
+        n_rows += len(batch)
+        if report_every and n_rows >= next_report:
+            elapsed = time.perf_counter() - start
+            print(f"  {n_rows} rows inserted ({n_rows / elapsed:.0f} rows/s)")
+            next_report += report_every
+    return n_rows
+
+
+def load_csv(conn, table_name, csv_file_path, batch_size=50000, skip_header=False, number_of_columns=None,
+             use_manifest=True):
+    """Load one CSV file into table_name. Returns (number of rows, elapsed seconds)."""
+    if number_of_columns is None:
+        number_of_columns = get_number_of_columns(conn, table_name)
+    start = time.perf_counter()
+    checksum, skip_rows = None, 0
+    if use_manifest:
+        checksum = file_checksum(csv_file_path)
+        status, skip_rows = start_manifest_entry(conn, table_name, csv_file_path, checksum)
+        if status == 'done':
+            print(f"{csv_file_path} is already loaded into {table_name} (see {MANIFEST_TABLE}), skipping.")
+            return 0, time.perf_counter() - start
+        if skip_rows:
+            print(f"Resuming {csv_file_path} after {skip_rows} committed rows")
+    with open(csv_file_path, mode='r', newline='') as csv_file:
+        csv_reader = csv.reader(csv_file)
+        if skip_header:
+            next(csv_reader, None)
+        rows = islice(csv_reader, skip_rows, None)
+        n_rows = insert_rows(conn, table_name, rows, number_of_columns, batch_size=batch_size, checksum=checksum)
+    if use_manifest:
+        finish_manifest_entry(conn, table_name, checksum)
+    return n_rows, time.perf_counter() - start
+
+
+def load_csv_files(db_path, table_name, csv_file_paths, batch_size=50000, skip_header=False, fast_pragmas=False,
+                   use_manifest=True):
+    """Load several CSV files into table_name and print a summary per file."""
+    conn = sqlite3.connect(db_path)
+    old_settings = set_fast_pragmas(conn) if fast_pragmas else None
+    try:
+        number_of_columns = get_number_of_columns(conn, table_name)
+        total_rows, total_time = 0, 0.0
+        for csv_file_path in csv_file_paths:
+            print(f"Loading {csv_file_path} into {table_name}")
+            n_rows, elapsed = load_csv(conn, table_name, csv_file_path, batch_size=batch_size,
+                                       skip_header=skip_header, number_of_columns=number_of_columns,
+                                       use_manifest=use_manifest)
+            print(f"{csv_file_path}: {n_rows} rows in {elapsed:.1f} s ({n_rows / max(elapsed, 1e-9):.0f} rows/s)")
+            total_rows += n_rows
+            total_time += elapsed
+        print(f"Total: {total_rows} rows in {total_time:.1f} s ({total_rows / max(total_time, 1e-9):.0f} rows/s)")
+    finally:
+        if old_settings is not None:
+            restore_pragmas(conn, old_settings)
+        conn.close()
+    return total_rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk load CSV files into a table of the OAS SQLite database')
+    parser.add_argument("csv_files", help="CSV files to load", nargs='*', type=str)
+    parser.add_argument("--db", help="Path to the SQLite database", type=str, default='/ibmm_data/oas_database/OAS.db')
+    parser.add_argument("--table", help="Name of the table to insert into", type=str, default='healthy_paired')
+    parser.add_argument("--batch_size", help="Number of rows per executemany / transaction", type=int, default=50000)
+    parser.add_argument("--skip_header", help="Skip the first row of each CSV file", action='store_true')
+    parser.add_argument("--fast_pragmas", help="Use journal_mode=WAL and synchronous=OFF during the load", action='store_true')
+    parser.add_argument("--no_manifest", help="Do not record the load in the manifest table", action='store_true')
+    parser.add_argument("--rollback", help="Delete the rows loaded from this file (as recorded in the manifest)", type=str)
+    parser.add_argument("--show_manifest", help="Print the manifest table", action='store_true')
+    args = parser.parse_args()
+
+    if args.rollback or args.show_manifest:
+        conn = sqlite3.connect(args.db)
+        if args.rollback:
+            n_deleted = rollback_load(conn, args.table, args.rollback)
+            print(f"Deleted {n_deleted} rows loaded from {args.rollback} from {args.table}.")
+        if args.show_manifest:
+            print_manifest(conn)
+        conn.close()
+    elif not args.csv_files:
+        parser.error("no CSV files given")
+    else:
+        load_csv_files(args.db, args.table, args.csv_files, batch_size=args.batch_size, skip_header=args.skip_header,
+                       fast_pragmas=args.fast_pragmas, use_manifest=not args.no_manifest)
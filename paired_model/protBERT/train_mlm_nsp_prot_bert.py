@@ -27,10 +27,14 @@ from torch.optim import AdamW
 from transformers import get_scheduler
 import wandb
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'light_model', 'src'))
+from protein_tokenizer import ProteinTokenizer
+
 # NSP and MLM tasks using ProtBERT bfd -> https://huggingface.co/Rostlab/prot_bert_bfd
-# Input data has to be of the form heavyseq[SEP]lightseq with each AA single space separated!!
+# Input data has to be of the form heavyseq[SEP]lightseq; the character-level ProteinTokenizer
+# (light_model/src/protein_tokenizer.py) reads the prot_bert_bfd vocab, so the AA need no spaces anymore
 # example:
-# Q V Q L Q E S G P G L V K P S E T L S L T C T V S G G S I S G F Y W S W I R Q S P G K G L E [SEP] Q V Q L Q E S G P G L V K P S E T L S L T C T V S G G S I S G F Y W S W I R Q S P G K G L E
+# QVQLQESGPGLVKPSETLSLTCTVSGGSISGFYWSWIRQSPGKGLE[SEP]QVQLQESGPGLVKPSETLSLTCTVSGGSISGFYWSWIRQSPGKGLE
 
 os.environ['CUDA_VISIBLE_DEVICES'] ='0'
 
@@ -39,7 +43,7 @@ device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 print(f'device: {device}')
 
 # Load the tokenizer and configuration
-tokenizer = AutoTokenizer.from_pretrained('Rostlab/prot_bert_bfd', do_lower_case=False )
+tokenizer = ProteinTokenizer.from_pretrained('Rostlab/prot_bert_bfd')
 config = AutoConfig.from_pretrained('Rostlab/prot_bert_bfd', do_lower_case=False, vocab_size=len(tokenizer), force_download=True)
 
 # print tokenizer and config
@@ -112,13 +116,13 @@ training_args = TrainingArguments(
 #         assert torch.all(input_ids < tokenizer.vocab_size), f"Found input_ids >= vocab size: {input_ids.max().item()}"
 
 
-# small dataset with input heavyseq[SEP]lightseq with each AA SPACE SEPARATED!!
-small_train_dataset_path = "/ibmm_data2/oas_database/paired_lea_tmp/paired_model/train_test_val_datasets/heavy_sep_light_seq/paired_full_seqs_sep_train_no_ids_small_SPACE_separated.txt"
-small_val_dataset_path = "/ibmm_data2/oas_database/paired_lea_tmp/paired_model/train_test_val_datasets/heavy_sep_light_seq/paired_full_seqs_sep_val_no_ids_small_SPACE_separated.txt"
+# small dataset with input heavyseq[SEP]lightseq
+small_train_dataset_path = "/ibmm_data2/oas_database/paired_lea_tmp/paired_model/train_test_val_datasets/heavy_sep_light_seq/paired_full_seqs_sep_train_no_ids_small.txt"
+small_val_dataset_path = "/ibmm_data2/oas_database/paired_lea_tmp/paired_model/train_test_val_datasets/heavy_sep_light_seq/paired_full_seqs_sep_val_no_ids_small.txt"
 
-# FULL dataset with input heavyseq[SEP]lightseq with each AA SPACE SEPARATED!!
-full_train_dataset_path = "/ibmm_data2/oas_database/paired_lea_tmp/paired_model/train_test_val_datasets/heavy_sep_light_seq/paired_full_seqs_sep_train_no_ids_space_separated.txt"
-full_val_dataset_path = "/ibmm_data2/oas_database/paired_lea_tmp/paired_model/train_test_val_datasets/heavy_sep_light_seq/paired_full_seqs_sep_val_no_ids_space_separated.txt"
+# FULL dataset with input heavyseq[SEP]lightseq
+full_train_dataset_path = "/ibmm_data2/oas_database/paired_lea_tmp/paired_model/train_test_val_datasets/heavy_sep_light_seq/paired_full_seqs_sep_train_no_ids.txt"
+full_val_dataset_path = "/ibmm_data2/oas_database/paired_lea_tmp/paired_model/train_test_val_datasets/heavy_sep_light_seq/paired_full_seqs_sep_val_no_ids.txt"
 
 # Prepare the train_dataset
 print("start building train_dataset=", datetime.now(PST))
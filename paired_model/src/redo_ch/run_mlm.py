@@ -109,6 +109,15 @@ class ModelArguments:
         default=True,
         metadata={"help": "Whether to use one of the fast tokenizer (backed by the tokenizers library) or not."},
     )
+    use_protein_tokenizer: bool = field(
+        default=False,
+        metadata={
+            "help": (
+                "Load the tokenizer as the character-level ProteinTokenizer (light_model/src/protein_tokenizer.py) "
+                "from the vocab.txt of --tokenizer_name, for sequences without spaces between the amino acids."
+            )
+        },
+    )
     model_revision: str = field(
         default="main",
         metadata={"help": "The specific model version to use (can be a branch name, tag name or commit id)."},
@@ -444,7 +453,16 @@ def main():
         "token": model_args.token,
         "trust_remote_code": model_args.trust_remote_code,
     }
-    if model_args.tokenizer_name:
+    if model_args.use_protein_tokenizer:
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'light_model', 'src'))
+        from protein_tokenizer import ProteinTokenizer
+
+        tokenizer_kwargs.pop("use_fast")
+        tokenizer_kwargs.pop("trust_remote_code")
+        tokenizer = ProteinTokenizer.from_pretrained(
+            model_args.tokenizer_name or model_args.model_name_or_path, **tokenizer_kwargs
+        )
+    elif model_args.tokenizer_name:
         tokenizer = AutoTokenizer.from_pretrained(model_args.tokenizer_name, **tokenizer_kwargs)
     elif model_args.model_name_or_path:
         tokenizer = AutoTokenizer.from_pretrained(model_args.model_name_or_path, **tokenizer_kwargs)
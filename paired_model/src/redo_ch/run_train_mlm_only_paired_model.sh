@@ -14,6 +14,7 @@
 python run_mlm.py \
     --model_type 'roberta' \
     --tokenizer_name ./ProteinTokenizer \
+    --use_protein_tokenizer \
     --train_file /ibmm_data2/oas_database/paired_lea_tmp/paired_model/train_test_val_datasets/heavy_sep_light_seq/paired_full_seqs_sep_train_no_ids.txt \
     --validation_file /ibmm_data2/oas_database/paired_lea_tmp/paired_model/train_test_val_datasets/heavy_sep_light_seq/paired_full_seqs_sep_val_no_ids.txt \
     --per_device_train_batch_size 16 \
@@ -14,6 +14,7 @@
 python run_mlm_nsp.py \
     --model_type 'roberta' \
     --tokenizer_name ./ProteinTokenizer \
+    --use_protein_tokenizer \
     --train_file /ibmm_data2/oas_database/paired_lea_tmp/paired_model/src/redo_ch/test.txt \
     --per_device_train_batch_size 16 \
     --per_device_eval_batch_size 16 \
@@ -31,6 +31,10 @@ import copy
 from torch.optim import AdamW
 from transformers import get_scheduler
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'light_model', 'src'))
+from pretokenized_dataset import PretokenizedNSPDataset, load_or_compile
+from protein_tokenizer import ProteinTokenizer
+
 #BUCKET_NAME = 'clinical_bert_bucket'
 
 #instantiate the tokenizer
@@ -61,7 +65,7 @@ device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 print(f'device: {device}')
 
 # Load the updated tokenizer and configuration
-tokenizer = AutoTokenizer.from_pretrained('UpdatedProteinTokenizer', force_download=True)
+tokenizer = ProteinTokenizer.from_pretrained('UpdatedProteinTokenizer')
 config = AutoConfig.from_pretrained(pretrained_model_name_or_path="UpdatedProteinTokenizer/config.json", vocab_size=len(tokenizer), force_download=True)
 
 #input_ids = tokenizer(prompt, return_tensors="pt").input_ids.to(device) # This line.
@@ -113,6 +117,13 @@ training_args = TrainingArguments(
 
 def check_input_ids_validity(dataset, tokenizer):
     vocab_size = tokenizer.vocab_size
+    if hasattr(dataset, 'store'):
+        # compiled store: one pass over the token array instead of over every example
+        max_id = max(dataset.store.max_token_id(), *dataset.store.special_ids.values())
+        if max_id >= vocab_size:
+            raise ValueError(f"An input_id ({max_id}) exceeds the tokenizer's vocabulary size ({vocab_size}).")
+        print(f"All input_ids are within the vocabulary size.")
+        return
     for example in dataset:
         # Extracting input_ids from each example
         input_ids = example['input_ids'] if isinstance(example, dict) else example.input_ids
@@ -125,9 +136,11 @@ def check_input_ids_validity(dataset, tokenizer):
 
 # Prepare the train_dataset
 print("start building train_dataset=", datetime.now(PST))
-train_dataset = TextDatasetForNextSentencePrediction(
-    tokenizer=tokenizer,
-    file_path="/ibmm_data2/oas_database/paired_lea_tmp/paired_model/train_test_val_datasets/heavy_sep_light_seq/paired_full_seqs_train_for_nsp.txt",
+# tokenized once into a memory-mapped store next to the text file (light_model/src/pretokenized_dataset.py), the
+# examples are built from it like TextDatasetForNextSentencePrediction (consecutive lines of a document, 50% random)
+train_dataset = PretokenizedNSPDataset(load_or_compile(
+    "/ibmm_data2/oas_database/paired_lea_tmp/paired_model/train_test_val_datasets/heavy_sep_light_seq/paired_full_seqs_train_for_nsp.txt",
+    vocab=tokenizer.get_vocab(), documents=True),
     block_size=128
 )
 
@@ -137,9 +150,9 @@ check_input_ids_validity(train_dataset, tokenizer)
 
 # Prepare the eval_dataset
 print("start building eval_dataset=", datetime.now(PST))
-eval_dataset = TextDatasetForNextSentencePrediction(
-    tokenizer=tokenizer,
-    file_path="/ibmm_data2/oas_database/paired_lea_tmp/paired_model/train_test_val_datasets/heavy_sep_light_seq/paired_full_seqs_val_for_nsp.txt",
+eval_dataset = PretokenizedNSPDataset(load_or_compile(
+    "/ibmm_data2/oas_database/paired_lea_tmp/paired_model/train_test_val_datasets/heavy_sep_light_seq/paired_full_seqs_val_for_nsp.txt",
+    vocab=tokenizer.get_vocab(), documents=True),
     block_size=128
 )
 
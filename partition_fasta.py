@@ -0,0 +1,111 @@
+"""
+Single-pass partitioner: routes every record of a FASTA file (or of a CSV with id,heavy,light columns) to the output file
+of its split (train/val/test) according to an ID -> split mapping. The input is read once, no matter how many splits there are
+(train_test_val_split.py used to read the representative FASTA three times with awk).
+
+Output formats:
+fasta  the record as FASTA (>id / sequence)
+seq    the sequence only, one per line
+sep    heavy[SEP]light, one pair per line (requires the CSV input with heavy and light columns)
+With --space_separated the residues are separated by spaces ("Q V Q ... [SEP] E V ..."), as expected by the BERT tokenizers.
+
+Example:
+python partition_fasta.py --input rep.fasta --split_ids train=CDRH3_ids_train.txt val=CDRH3_ids_val.txt test=CDRH3_ids_test.txt \
+    --output_prefix CDRH3 --output_format seq
+"""
+import argparse
+import csv
+import os
+import time
+
+
+def iter_fasta(file_path):
+    """Yield (id, sequence) of a FASTA file, multi-line sequences are joined."""
+    with open(file_path, 'r', buffering=16 * 1024 * 1024) as f:
+        record_id, sequence = None, []
+        for line in f:
+            if line.startswith('>'):
+                if record_id is not None:
+                    yield record_id, ''.join(sequence)
+                record_id = line[1:].split(None, 1)[0] if line[1:].strip() else ''
+                sequence = []
+            else:
+                sequence.append(line.strip())
+        if record_id is not None:
+            yield record_id, ''.join(sequence)
+
+
+def iter_pair_csv(file_path, id_column=0, heavy_column=1, light_column=2):
+    """Yield (id, (heavy, light)) of a CSV file without header."""
+    with open(file_path, 'r', newline='', buffering=16 * 1024 * 1024) as f:
+        for row in csv.reader(f):
+            yield row[id_column], (row[heavy_column], row[light_column])
+
+
+def format_record(record_id, sequence, output_format, space_separated=False):
+    """Format one record as FASTA, plain sequence or heavy[SEP]light line."""
+    if isinstance(sequence, tuple):
+        heavy, light = sequence
+        if output_format == 'sep':
+            if space_separated:
+                return f"{' '.join(heavy)} [SEP] {' '.join(light)}\n"
+            return f"{heavy}[SEP]{light}\n"
+        sequence = heavy + light
+    elif output_format == 'sep':
+        raise ValueError("The sep output format needs an input with separate heavy and light columns (--input_format pair_csv).")
+    if space_separated:
+        sequence = ' '.join(sequence)
+    if output_format == 'fasta':
+        return f">{record_id}\n{sequence}\n"
+    return f"{sequence}\n"
+
+
+def partition_records(input_path, id_to_split, output_paths, output_format='fasta', input_format='fasta',
+                      space_separated=False):
+    """Route every record of input_path to output_paths[split] in one pass. Returns the number of records per split."""
+    records = iter_fasta(input_path) if input_format == 'fasta' else iter_pair_csv(input_path)
+    outputs = {split: open(path, 'w', buffering=4 * 1024 * 1024) for split, path in output_paths.items()}
+    counts = {split: 0 for split in output_paths}
+    start = time.perf_counter()
+    try:
+        for record_id, sequence in records:
+            split = id_to_split.get(record_id)
+            if split is None or split not in outputs:
+                continue
+            outputs[split].write(format_record(record_id, sequence, output_format, space_separated))
+            counts[split] += 1
+    finally:
+        for f in outputs.values():
+            f.close()
+    elapsed = time.perf_counter() - start
+    n_bytes = os.path.getsize(input_path)
+    print(f"Partitioned {input_path} in {elapsed:.1f} s ({n_bytes / max(elapsed, 1e-9) / 1e6:.1f} MB/s): "
+          + ", ".join(f"{split} {count}" for split, count in counts.items()))
+    return counts
+
+
+def read_id_to_split(split_id_files):
+    """Build the ID -> split mapping from {split: file with one ID per line}."""
+    id_to_split = {}
+    for split, file_path in split_id_files.items():
+        with open(file_path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    id_to_split[line.strip()] = split
+    return id_to_split
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Route the records of a FASTA/CSV file to train/val/test outputs in one pass')
+    parser.add_argument("--input", help="Input FASTA (or id,heavy,light CSV) file", type=str, required=True)
+    parser.add_argument("--input_format", help="Format of the input file", choices=['fasta', 'pair_csv'], default='fasta')
+    parser.add_argument("--split_ids", help="split=ID file pairs, e.g. train=ids_train.txt val=ids_val.txt", nargs='+', required=True)
+    parser.add_argument("--output_prefix", help="Outputs are written to <prefix>_<split>.txt", type=str, required=True)
+    parser.add_argument("--output_format", help="Format of the outputs", choices=['fasta', 'seq', 'sep'], default='fasta')
+    parser.add_argument("--space_separated", help="Separate the residues by spaces", action='store_true')
+    args = parser.parse_args()
+
+    split_id_files = dict(pair.split('=', 1) for pair in args.split_ids)
+    output_paths = {split: f'{args.output_prefix}_{split}.txt' for split in split_id_files}
+    partition_records(args.input, read_id_to_split(split_id_files), output_paths, output_format=args.output_format,
+                      input_format=args.input_format, space_separated=args.space_separated)
@@ -1,30 +1,84 @@
+"""
+Remove the header of one or many CSV files without parsing them: everything after the first newline(s) is copied as raw
+byte blocks. The files are either written one by one (no_header_<name> in --output_dir) or concatenated into one --output file.
+With --db and --table the number of header columns is checked against the table before anything is copied.
+
+Example (the three B cell types in one run, concatenated for oas_db_loader.py):
+python remove_header_from_csv.py --db /ibmm_data/oas_database/OAS.db --table healthy_paired \
+    --output /ibmm_data/oas_database/paired/csv_files/no_headers/no_header_OAS_db_paired_healthy_b_cells_2024-02-28.csv \
+    /ibmm_data/oas_database/paired/csv_files/with_headers/OAS_db_paired_healthy_naive_b_cells_2024-02-28.csv \
+    /ibmm_data/oas_database/paired/csv_files/with_headers/OAS_db_paired_healthy_memory_b_cells_2024-02-28.csv \
+    /ibmm_data/oas_database/paired/csv_files/with_headers/OAS_db_paired_healthy_plasma_b_cells_2024-02-28.csv
+"""
+import argparse
 import csv
+import os
+import shutil
+import sqlite3
+
+BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def read_header(csv_path, skip_lines=1):
+    """Return the parsed last skipped line (the header) of a CSV file."""
+    with open(csv_path, 'r', newline='') as f:
+        for _ in range(skip_lines - 1):
+            f.readline()
+        return next(csv.reader([f.readline()]))
+
+
+def copy_without_header(csv_path, output_file, skip_lines=1):
+    """Copy csv_path minus its first skip_lines lines to an open binary file. Returns the number of bytes copied."""
+    with open(csv_path, 'rb') as f:
+        for _ in range(skip_lines):
+            f.readline()
+        start = f.tell()
+        shutil.copyfileobj(f, output_file, BLOCK_SIZE)
+        n_bytes = f.tell() - start
+        # keep the rows of concatenated files apart if the last line has no newline
+        if n_bytes:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                output_file.write(b'\n')
+    return n_bytes
+
+
+def check_columns(csv_paths, db_path, table_name, skip_lines=1):
+    """Raise a ValueError if the header of a file does not have as many columns as the table."""
+    conn = sqlite3.connect(db_path)
+    number_of_columns = len(conn.execute(f"PRAGMA table_info({table_name});").fetchall())
+    conn.close()
+    for csv_path in csv_paths:
+        n_header_columns = len(read_header(csv_path, skip_lines))
+        if n_header_columns != number_of_columns:
+            raise ValueError(f"{csv_path} has {n_header_columns} columns, {table_name} has {number_of_columns}.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Remove the header of CSV files by copying raw bytes')
+    parser.add_argument("csv_files", help="CSV files with header", nargs='+', type=str)
+    parser.add_argument("--output", help="Concatenate all files (without header) into this file", type=str)
+    parser.add_argument("--output_dir", help="Write every file without header to <output_dir>/no_header_<name>", type=str)
+    parser.add_argument("--skip_lines", help="Number of lines to drop per file (2 for OAS files with the metadata line)", type=int, default=1)
+    parser.add_argument("--db", help="SQLite database of the target table (column count check)", type=str)
+    parser.add_argument("--table", help="Target table (column count check)", type=str)
+    args = parser.parse_args()
+
+    if bool(args.output) == bool(args.output_dir):
+        parser.error("give either --output or --output_dir")
+    if args.db and args.table:
+        check_columns(args.csv_files, args.db, args.table, args.skip_lines)
 
-# run this script 3 times
-
-# Path to the original CSV file
-# original_csv_path = '/ibmm_data/oas_database/paired/csv_files/with_headers/OAS_db_paired_healthy_naive_b_cells_2024-02-28.csv'
-# original_csv_path = '/ibmm_data/oas_database/paired/csv_files/with_headers/OAS_db_paired_healthy_memory_b_cells_2024-02-28.csv'
-original_csv_path = '/ibmm_data/oas_database/paired/csv_files/with_headers/OAS_db_paired_healthy_plasma_b_cells_2024-02-28.csv'
-
-# Path to the new CSV file without the header
-# new_csv_path = '/ibmm_data/oas_database/paired/csv_files/no_headers/no_header_OAS_db_paired_healthy_naive_b_cells_2024-02-28.csv'
-# new_csv_path = '/ibmm_data/oas_database/paired/csv_files/no_headers/no_header_OAS_db_paired_healthy_memory_b_cells_2024-02-28.csv'
-new_csv_path = '/ibmm_data/oas_database/paired/csv_files/no_headers/no_header_OAS_db_paired_healthy_plasma_b_cells_2024-02-28.csv'
-
-# Open the original CSV file and create a csv.reader object
-with open(original_csv_path, mode='r', newline='') as original_file:
-    reader = csv.reader(original_file)
-    
-    # Open the new CSV file and create a csv.writer object
-    with open(new_csv_path, mode='w', newline='') as new_file:
-        writer = csv.writer(new_file)
-        
-        # Skip the header row
-        next(reader)
-        
-        # Write the rest of the rows to the new CSV file
-        for row in reader:
-            writer.writerow(row)
-
-print(f"CSV file without header has been saved as '{new_csv_path}'.")
+    if args.output:
+        with open(args.output, 'wb') as output_file:
+            for csv_path in args.csv_files:
+                n_bytes = copy_without_header(csv_path, output_file, args.skip_lines)
+                print(f"{csv_path}: {n_bytes} bytes copied")
+        print(f"CSV files without header have been concatenated into '{args.output}'.")
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for csv_path in args.csv_files:
+            new_csv_path = os.path.join(args.output_dir, 'no_header_' + os.path.basename(csv_path))
+            with open(new_csv_path, 'wb') as output_file:
+                copy_without_header(csv_path, output_file, args.skip_lines)
+            print(f"CSV file without header has been saved as '{new_csv_path}'.")
@@ -0,0 +1,109 @@
+"""
+Assignment of whole clusters to train / validation / test so that the realized fractions match the targets
+(used by light_model/src/train_test_val_split.py instead of filling train, then val, and putting the rest into test).
+
+Methods:
+binpack  clusters by decreasing size (equal sizes in seeded random order), each cluster goes to the split that is
+         furthest below its target (largest remaining deficit in sequences). The big clusters end up in train, the
+         small ones even out the remaining deficits, so all three splits land close to their targets.
+random   same rule, but the clusters are visited in seeded random order, so big clusters are spread over the splits.
+fill     the previous behaviour: fill train, then val, everything that does not fit goes to test.
+
+With strata (e.g. V gene family or kappa / lambda of the centroid) every stratum is allocated on its own, so each
+stratum is split with the target fractions as well. Cluster sizes and assignments are kept in arrays, only the visiting
+order is a Python list, which scales to tens of millions of clusters.
+"""
+import random
+from array import array
+from collections import defaultdict
+
+SPLITS = ('train', 'val', 'test')
+
+
+def visiting_order(indices, sizes, method, rng):
+    """The order in which the clusters of one group are allocated."""
+    order = list(indices)
+    rng.shuffle(order)
+    if method in ('binpack', 'fill'):
+        # stable sort: clusters of the same size stay in the seeded random order
+        order.sort(key=sizes.__getitem__, reverse=True)
+    return order
+
+
+def allocate_group(indices, sizes, fractions, method, rng, assignment, initial_counts=None):
+    """Allocate the clusters indices (into sizes) to the splits and write the split index into assignment.
+    initial_counts are sequences already in the splits, the targets then refer to the existing plus the new sequences."""
+    order = visiting_order(indices, sizes, method, rng)
+    filled = list(initial_counts) if initial_counts is not None else [0] * len(fractions)
+    total = sum(sizes[i] for i in order) + sum(filled)
+    targets = [fraction * total for fraction in fractions]
+    last = len(fractions) - 1
+    for i in order:
+        size = sizes[i]
+        if method == 'fill':
+            split = next((s for s in range(last) if filled[s] + size <= targets[s]), last)
+        else:
+            deficits = [target - n for target, n in zip(targets, filled)]
+            split = deficits.index(max(deficits))
+        filled[split] += size
+        assignment[i] = split
+
+
+def allocate_clusters(sizes, fractions=(0.8, 0.1, 0.1), seed=42, method='binpack', strata=None, initial_counts=None):
+    """Assign every cluster to a split. sizes: cluster sizes, strata: optional label per cluster, initial_counts:
+    sequences per split that are already assigned (a list, or {label: list} with strata), e.g. of an earlier split
+    extended by new clusters. Returns an array('b') with the index of the split (into fractions) of every cluster."""
+    if method not in ('binpack', 'random', 'fill'):
+        raise ValueError(f"Unknown allocation method '{method}'.")
+    if abs(sum(fractions) - 1) > 1e-6:
+        raise ValueError(f"The split fractions {fractions} do not sum to 1.")
+    rng = random.Random(seed)
+    assignment = array('b', bytes(len(sizes)))
+    if strata is None:
+        allocate_group(range(len(sizes)), sizes, fractions, method, rng, assignment, initial_counts)
+    else:
+        groups = defaultdict(lambda: array('q'))
+        for i, label in enumerate(strata):
+            groups[label].append(i)
+        # sorted labels: the random stream, and therefore the split, does not depend on the input order of the strata
+        for label in sorted(groups, key=str):
+            allocate_group(groups[label], sizes, fractions, method, rng, assignment,
+                           initial_counts.get(label) if initial_counts is not None else None)
+    return assignment
+
+
+def split_counts(sizes, assignment, n_splits=3):
+    """Number of sequences per split."""
+    counts = [0] * n_splits
+    for size, split in zip(sizes, assignment):
+        counts[split] += size
+    return counts
+
+
+def split_summary(sizes, assignment, fractions, strata=None):
+    """Target and realized fraction of every split, overall and per stratum."""
+    def summarize(counts):
+        total = sum(counts)
+        return {name: {'sequences': count, 'target': fraction, 'realized': round(count / total, 4) if total else 0.0}
+                for name, count, fraction in zip(SPLITS, counts, fractions)}
+
+    summary = {'all': summarize(split_counts(sizes, assignment, len(fractions)))}
+    if strata is not None:
+        counts = defaultdict(lambda: [0] * len(fractions))
+        for size, split, label in zip(sizes, assignment, strata):
+            counts[label][split] += size
+        summary['strata'] = {str(label): summarize(counts[label]) for label in sorted(counts, key=str)}
+    return summary
+
+
+def read_strata(path, cluster_ids, delimiter=',', id_column=0, label_column=1):
+    """Label of every cluster, taken from the row of its centroid in a delimited file (e.g. rowid,v_call).
+    Clusters whose centroid is not in the file get the label ''."""
+    wanted = set(cluster_ids)
+    labels = {}
+    with open(path, 'r', buffering=16 * 1024 * 1024) as f:
+        for line in f:
+            fields = line.rstrip('\r\n').split(delimiter)
+            if fields[id_column] in wanted:
+                labels[fields[id_column]] = fields[label_column]
+    return [labels.get(cluster_id, '') for cluster_id in cluster_ids]